@@ -1,3 +1,4 @@
-from .analyze import extract_markers
+from .analyze import extract_markers, extract_markers_many
 from .util import format_time
 from .project import load_project
+from .sidecar import read_sidecar, write_sidecar
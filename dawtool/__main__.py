@@ -1,53 +1,201 @@
 import dawtool
 from dawtool import extract_markers, format_time, load_project
-from dawtool.project import UnknownExtension
+from dawtool.project import UnknownExtension, ProjectModules
+from dawtool.marker import Marker
+# the names only, the writers (and json/csv) are imported when used
+from dawtool.records import FORMATS
 
+import io
+import os
 import sys
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
+from contextlib import redirect_stdout
+from functools import partial
 import logging
 
 SEC_PER_HOUR = 60 * 60
 
-def main():
-    fname = args.file
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # subcommands are dispatched by hand so that the plain
+    # `dawtool [options] file` form keeps working. a file or directory that
+    # happens to be named like a subcommand is a file
+    if argv and argv[0] in COMMANDS and not os.path.exists(argv[0]):
+        return COMMANDS[argv[0]](argv[1:])
+
+    args = ap.parse_args(argv)
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+
+    # the pool (and multiprocessing) is only imported for more than one job
+    from dawtool.batch import find_files, parallel_map
+
+    fnames = find_files(args.files, tuple(ProjectModules))
+    # don't bother with a pool for a single file
+    jobs = 1 if len(args.files) == 1 and not os.path.isdir(args.files[0]) else args.jobs
+    if args.server and args.jobs is None:
+        # the server does the work, a pool of clients would only add startup
+        jobs = 1
+    # label each file's output whenever there can be more than one file,
+    # whatever the number of jobs. records carry their file name instead
+    show_names = (len(args.files) > 1 or any(os.path.isdir(f) for f in args.files)) \
+        and args.format == 'text'
+
+    # workers return their whole output as one string, which is written out
+    # through a large buffer instead of line by line
+    out = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='',
+                           write_through=False) if hasattr(sys.stdout, 'buffer') else sys.stdout
+    if args.format == 'csv':
+        from dawtool.records import write_records
+        write_records(out, [], 'csv')
+
+    failed = False
+    for fname, output, errors, ok in parallel_map(partial(process_file, args=args), fnames,
+                                                  jobs, chunksize=8, ordered=not args.unordered):
+        failed |= not ok
+        if show_names:
+            out.write(f'==> {fname} <==\n')
+        out.write(output)
+        if errors:
+            out.flush()
+            sys.stderr.write(errors)
+
+    out.flush()
+    if out is not sys.stdout:
+        # don't let closing the wrapper close stdout
+        out.detach()
+
+    return 1 if failed else 0
+
+
+def process_file(fname, args):
+    """
+    Run the cli on one file, capturing the output so results of parallel
+    workers don't interleave.
+
+    return: (fname, output, errors, success)
+    """
+    process = _process_file_remote if args.server else _process_file
+    out = io.StringIO(newline='')
+    errors = io.StringIO()
+    if args.format == 'text':
+        with redirect_stdout(out):
+            ok = process(fname, args)
+    else:
+        # keep errors and dumps out of the records
+        with redirect_stdout(errors):
+            ok = process(fname, args, out)
+    return fname, out.getvalue(), errors.getvalue(), ok
+
+def _process_file(fname, args, records_fp=None):
+    """
+    records_fp: write records in args.format here instead of the usual output
+    """
     try:
         # markers are raw time data. it's up to the client to determine how to
         # present it
         with open(fname, 'rb') as f:
             # markers = dawtool.extract_markers(fname, f)
-            proj = load_project(fname, f, theoretical=args.theoretical)
+            proj = load_project(fname, f, theoretical=args.theoretical, profile=args.profile,
+                                simplify_ms=args.simplify_ms)
             proj.parse()
             # print(len(proj.tempo_automation_events))
             markers = proj.markers
     except FileNotFoundError:
         print(fname, 'not found')
-        return
+        return False
     except UnknownExtension as e:
         print('unknown ext', e)
-        return
-    except ValueError as e:
+        return False
+    except Exception as e:
+        # anything else is this file's problem (e.g. ValueError, truncated
+        # gzip EOFError, PermissionError), not the other files'
         print('Could not extract markers from', fname, ':', e)
-        raise
+        logging.debug('Could not extract markers', exc_info=True)
+        return False
 
     if args.verbose:
         proj.dump()
+        if proj.simplify_error_ms is not None:
+            print(f'Simplified tempo automation to {len(proj.tempo_automation_events)} events, '
+                  f'max error {proj.simplify_error_ms:.6f} ms')
 
-    if args.markers:
-        # There was no error, but no markers
-        if not markers:
-            print('Could not find markers in', fname)
-            return
+    if args.profile:
+        _print_stats(fname, proj.stats)
 
-        for m in markers:
-            print(format_time(m.time, args.hours, precise=args.imprecise), m.text)
+    if records_fp is not None:
+        _write_records(fname, proj.iter_records(tempo=args.tempo), args, records_fp)
+        return True
+
+    if args.markers:
+        _print_markers(fname, markers, args)
 
     if args.emit:
         print(proj.emit(), end='')
 
+    return True
+
+def _process_file_remote(fname, args, records_fp=None):
+    """
+    Like _process_file, but have the server at args.server parse the file
+    """
+    from dawtool.server import request_records
+
+    if args.verbose or args.emit or args.profile or args.simplify_ms is not None:
+        print('-v, -e, --profile and --simplify-ms are not supported with --server')
+        return False
+
+    try:
+        records = request_records(args.server, fname, args.theoretical, args.tempo)
+    except ValueError as e:
+        print('Could not extract markers from', fname, ':', e)
+        return False
+    except OSError as e:
+        print('Could not reach server', args.server, ':', e)
+        return False
+
+    if records_fp is not None:
+        _write_records(fname, records, args, records_fp)
+    elif args.markers:
+        markers = [Marker(r['real_time'], r['text']) for r in records if r['type'] == 'marker']
+        _print_markers(fname, markers, args)
+
+    return True
+
+def _write_records(fname, records, args, fp):
+    from dawtool.records import write_records
+
+    records = ({**r, 'file': fname} for r in records)
+    write_records(fp, records, args.format, header=False)
+
+def _print_stats(fname, stats):
+    print('profile of', fname)
+    peaks = stats.get('memory_peaks', {})
+    for name, elapsed in stats['phases'].items():
+        line = f'  {name:<16} {elapsed * 1000:10.3f} ms'
+        if name in peaks:
+            line += f' {peaks[name] / 1024:10.1f} KiB peak'
+        print(line)
+    for name, n in stats['counters'].items():
+        print(f'  {name:<24} {n}')
+    if 'memory_peaks_skipped' in stats:
+        print('  no memory peaks:', stats['memory_peaks_skipped'])
+
+def _print_markers(fname, markers, args):
+    # There was no error, but no markers
+    if not markers:
+        print('Could not find markers in', fname)
+        return
+
+    for m in markers:
+        print(format_time(m.time, args.hours, precise=args.imprecise), m.text)
 
 
 ap = ArgumentParser(prog='dawtool')
-ap.add_argument('file')
+ap.add_argument('files', nargs='+', metavar='file',
+                help='Project files, or directories to search recursively for them')
 ap.add_argument('-v', '--verbose', help='Enable verbose logging', action='store_true')
 ap.add_argument('-d', '--debug', help='Enable debug logging', action='store_true')
 ap.add_argument('-e', '--emit', help='Re-emit to stdout. Only for cue files', action='store_true')
@@ -55,10 +203,165 @@ ap.add_argument('-m', '--markers', help='Output time markers', action='store_tru
 ap.add_argument('-x', '--hours', help='Output time markers in hours', action='store_true')
 ap.add_argument('-t', '--theoretical', help='Use theoretical time calculations', action='store_true')
 ap.add_argument('-i', '--imprecise', help='Use imprecise formatting', action='store_false')
-args = ap.parse_args()
+ap.add_argument('-j', '--jobs', type=int, help='Number of worker processes for multiple files (default: cpu count)')
+ap.add_argument('-u', '--unordered', help='Output results as they finish, not in input order', action='store_true')
+ap.add_argument('-f', '--format', choices=('text', *FORMATS), default='text',
+                help='Output format. ndjson and csv output one record per marker')
+ap.add_argument('--tempo', help='Also output a record per tempo automation event (ndjson/csv)', action='store_true')
+ap.add_argument('-p', '--profile', action='store_const', const=True, default=False,
+                help='Output time spent per parsing phase and counters')
+ap.add_argument('--profile-memory', dest='profile', action='store_const', const='memory',
+                help='Like --profile, and also output peak memory per phase (slower)')
+ap.add_argument('--simplify-ms', type=float, metavar='MS',
+                help='Simplify tempo automation, moving no automation event by more than MS milliseconds')
+ap.add_argument('-s', '--server', metavar='URL', help='Have a `dawtool serve` server parse the files, e.g. http://127.0.0.1:8765')
+
+#
+# Subcommands
+#
+
+def _segment(spec):
+    from dawtool.calibrate import Segment
+    try:
+        return Segment(*map(float, spec.split(':')))
+    except (TypeError, ValueError):
+        raise ArgumentTypeError(f'expected START_BPM:END_BPM:BEATS:SECONDS, got {spec!r}')
+
+def calibrate(argv):
+    from dawtool.calibrate import calibrate as fit, read_segments, validate_project_quant, DEFAULT_CANDIDATES
+
+    cap = ArgumentParser(prog='dawtool calibrate',
+                         description='Fit the tempo quantization to measured linear tempo ramps')
+    cap.add_argument('segments', nargs='*', type=_segment, metavar='START_BPM:END_BPM:BEATS:SECONDS',
+                     help='A ramp starting on the grid, and its measured duration')
+    cap.add_argument('--csv', metavar='FILE', help='Read more segments from a CSV file (same columns)')
+    cap.add_argument('-q', '--quants', type=int, nargs='+', default=DEFAULT_CANDIDATES, metavar='QUANT',
+                     help='Candidate quantizations, in steps per 4 beats (default: 1 to 4096)')
+    cap.add_argument('--validate', metavar='EXT',
+                     help="Check the TEMPO_QUANT of the project class for EXT (e.g. .als) against the segments")
+    cap.add_argument('--tolerance-ms', type=float, default=1.,
+                     help='Largest error allowed by --validate (default: %(default)s)')
+    args = cap.parse_args(argv)
+
+    segments = list(args.segments)
+    if args.csv:
+        with open(args.csv, newline='') as f:
+            segments += read_segments(f)
+    if not segments:
+        cap.error('no segments')
+
+    if args.validate:
+        try:
+            result = validate_project_quant(args.validate, segments, args.tolerance_ms, args.quants)
+        except KeyError:
+            cap.error(f'unknown ext {args.validate}')
+        cal = result.calibration
+    else:
+        cal = fit(segments, args.quants)
+
+    print(f'{"quant":>6} {"rms ms":>12} {"max ms":>12}')
+    for quant, rms, max_abs in zip(cal.candidates, cal.rms, cal.max_abs):
+        best = '  <- best' if quant == cal.quant else ''
+        print(f'{quant:>6} {rms * 1000:>12.6f} {max_abs * 1000:>12.6f}{best}')
+
+    if args.validate:
+        status = 'OK' if result.ok else 'FAIL'
+        print(f'{args.validate} TEMPO_QUANT {result.quant}: {status} '
+              f'(best fit {result.best_quant}, max error {result.max_error_ms:.6f} ms)')
+        return 0 if result.ok else 1
+    return 0
+
+def cue_rewrite(argv):
+    from dawtool.daw.cue import rewrite_rekordbox_cues
+
+    cap = ArgumentParser(prog='dawtool cue-rewrite',
+                         description='Rewrite all rekordbox cue files in a directory with corrected indexes')
+    cap.add_argument('src', help='Directory to search for cue files')
+    cap.add_argument('dst', help='Output directory, may be the same as src')
+    cap.add_argument('-j', '--jobs', type=int, help='Number of worker processes (default: cpu count)')
+    args = cap.parse_args(argv)
+
+    failed = False
+    for src, dst, written, error in rewrite_rekordbox_cues(args.src, args.dst, args.jobs):
+        if error is not None:
+            failed = True
+            print(src, ':', error, file=sys.stderr)
+        elif written:
+            print(src, '->', dst)
+    return 1 if failed else 0
+
+def _export_command(argv, export, prog, description, output_help='Output directory', output_required=True):
+    """
+    Shared export-* subcommand: parse argv, run export (see dawtool.batch)
+    and print each src -> dst, or its error.
+    """
+    cap = ArgumentParser(prog=prog, description=description)
+    cap.add_argument('paths', nargs='+', help='Project files, or directories to search for them')
+    cap.add_argument('-o', '--output', required=output_required, help=output_help)
+    cap.add_argument('-j', '--jobs', type=int, help='Number of worker processes (default: cpu count)')
+    cap.add_argument('-t', '--theoretical', help='Use theoretical time calculations', action='store_true')
+    args = cap.parse_args(argv)
+
+    failed = False
+    for src, dst, error in export(args.paths, args.output, args.jobs, theoretical=args.theoretical):
+        if error is not None:
+            failed = True
+            print(src, ':', error, file=sys.stderr)
+        else:
+            print(src, '->', dst)
+    return 1 if failed else 0
+
+def export_cue(argv):
+    from dawtool.batch import export_cues
+    return _export_command(argv, export_cues, 'dawtool export-cue',
+                           'Export the markers of projects as cue sheets')
+
+def export_smf(argv):
+    from dawtool.batch import export_smfs
+    return _export_command(argv, export_smfs, 'dawtool export-smf',
+                           'Export the tempo map and markers of projects as Standard MIDI Files')
+
+def sidecar(argv):
+    from dawtool.batch import export_sidecars
+    return _export_command(argv, export_sidecars, 'dawtool sidecar',
+                           'Precompute tempo map sidecars of projects, to query without reparsing',
+                           output_help='Output directory (default: next to each project)',
+                           output_required=False)
+
+def serve(argv):
+    from dawtool.server import make_server, DEFAULT_PORT
+
+    cap = ArgumentParser(prog='dawtool serve',
+                         description='Run a local server that parses projects for `dawtool --server`')
+    cap.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: %(default)s)')
+    cap.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help='Port to listen on (default: %(default)s)')
+    cap.add_argument('-d', '--debug', help='Enable debug logging', action='store_true')
+    args = cap.parse_args(argv)
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+
+    server = make_server(args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f'Serving on http://{host}:{port}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+COMMANDS = {
+    'calibrate': calibrate,
+    'cue-rewrite': cue_rewrite,
+    'export-cue': export_cue,
+    'export-smf': export_smf,
+    'serve': serve,
+    'sidecar': sidecar,
+}
 
-if args.debug:
-    logging.basicConfig(level=logging.DEBUG)
+ap.epilog = 'other commands: {} (see dawtool <command> -h)'.format(', '.join(COMMANDS))
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+asyncio versions of the loading helpers, for use inside an event loop.
+
+Reading the file and parsing (decompression, xml, event decoding, time
+calculations) are done in executors, so the event loop is never blocked.
+
+    markers = await extract_markers_async('mix.als')
+
+The parse runs on `executor`, the loop's default executor if None. A
+ProcessPoolExecutor avoids contention on the GIL between parses, at the
+cost of pickling the result back: the whole parsed project for
+load_project_async, only the markers for extract_markers_async. To bound the number of parses in
+flight, share one asyncio.Semaphore between calls:
+
+    limit = asyncio.Semaphore(4)
+    await asyncio.gather(*(extract_markers_async(f, semaphore=limit) for f in files))
+
+Cancelling a call cancels the parse if it hasn't started yet. A parse that
+is already running in a thread runs to completion, but its result is
+discarded and its semaphore slot is released immediately.
+"""
+
+from .project import load_project
+
+import asyncio
+import inspect
+import io
+from contextlib import AsyncExitStack
+
+
+def _read_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def _load_and_parse(filename, data, args, kwargs):
+    """
+    Top level so it can run in a process pool
+    """
+    proj = load_project(filename, io.BytesIO(data), *args, **kwargs)
+    proj.parse()
+    return proj
+
+
+def _load_and_extract_markers(filename, data, args, kwargs):
+    """
+    Like _load_and_parse, but only the markers are sent back from a process
+    """
+    return _load_and_parse(filename, data, args, kwargs).markers
+
+
+async def _read(filename, stream):
+    """
+    Return the contents of stream, or of the file filename if stream is None.
+    stream may be bytes, a file object, or have an async read() (e.g.
+    asyncio.StreamReader).
+    """
+    loop = asyncio.get_running_loop()
+    if stream is None:
+        # there are no non-blocking file reads in asyncio, use a thread
+        return await loop.run_in_executor(None, _read_file, filename)
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        return bytes(stream)
+
+    if inspect.iscoroutinefunction(stream.read):
+        return await stream.read()
+    # a plain file object's read() blocks, like open()
+    data = await loop.run_in_executor(None, stream.read)
+    if inspect.isawaitable(data):
+        data = await data
+    return data
+
+
+async def load_project_async(filename, stream=None, *args, executor=None, semaphore=None, **kwargs):
+    """
+    Async equivalent of load_project(...) followed by .parse().
+
+    stream: bytes, a file object, an object with an async read(), or None
+    to read the file filename.
+    executor: concurrent.futures executor to parse on, default executor if
+    None.
+    semaphore: asyncio.Semaphore limiting concurrent loads (reads and
+    parses) across calls sharing it.
+
+    raises FileNotFoundError
+    raises ValueError
+    raises UnknownExtension
+
+    return: the parsed Project
+    """
+    return await _run(_load_and_parse, filename, stream, args, kwargs, executor, semaphore)
+
+
+async def extract_markers_async(filename, stream=None, *args, executor=None, semaphore=None, **kwargs):
+    """
+    Async equivalent of extract_markers. Takes the same arguments as
+    load_project_async.
+
+    return: list of Marker sorted based on the Marker.time
+    """
+    return await _run(_load_and_extract_markers, filename, stream, args, kwargs, executor, semaphore)
+
+
+async def _run(job, filename, stream, args, kwargs, executor, semaphore):
+    """
+    Read filename/stream and run job(filename, data, args, kwargs) on
+    executor, holding semaphore throughout
+    """
+    loop = asyncio.get_running_loop()
+    async with AsyncExitStack() as stack:
+        if semaphore is not None:
+            await stack.enter_async_context(semaphore)
+        data = await _read(filename, stream)
+        return await loop.run_in_executor(executor, job, filename, data, args, kwargs)
@@ -16,7 +16,43 @@ def extract_markers(filename, stream, *args, **kwargs):
     proj = load_project(filename, stream, *args, **kwargs)
     proj.parse()
     # print(proj)
-    from pprint import pprint 
-    # print(pprint(proj.tempo_automation_events))
+    # print(proj.tempo_automation_events)
     # proj.dump()
     return proj.markers
+
+
+def _extract_markers_job(job):
+    path, kwargs = job
+    try:
+        with open(path, 'rb') as f:
+            return path, extract_markers(path, f, **kwargs)
+    except Exception as e:
+        return path, e
+
+
+def extract_markers_many(paths, workers=None, chunksize=8, executor='process', ordered=True, **kwargs):
+    """
+    Extract the markers of many project files, across workers processes (or
+    threads, executor='thread'). workers=None uses one per cpu, workers=1
+    runs in this thread. kwargs are passed to load_project.
+
+    paths can be a long lazy iterable, only a few chunks of chunksize paths
+    per worker are in flight at once, and each worker holds one project at
+    a time.
+
+    Parsing is CPU bound Python, so like the CLI this defaults to processes,
+    which scale with the cpus. Threads are serialized by the GIL, and are
+    only worth it to avoid process startup for a few small files.
+
+    return: iterator of (path, markers) in path order (or completion order
+    if not ordered). If a file can't be read or parsed, markers is the
+    exception it raised instead (usually FileNotFoundError/OSError,
+    ValueError or UnknownExtension).
+    """
+    from .batch import parallel_map, EXECUTORS
+
+    if executor not in EXECUTORS:
+        raise ValueError('Unknown executor', executor)
+
+    jobs = ((path, kwargs) for path in paths)
+    return parallel_map(_extract_markers_job, jobs, workers, chunksize, ordered, executor)
@@ -0,0 +1,223 @@
+"""
+Helpers for running dawtool over many files at once.
+"""
+
+from .project import load_project, ProjectModules
+
+import os
+from collections import deque
+from functools import partial
+from itertools import islice
+
+# extensions of the formats with a timeline (i.e. not cue sheets)
+PROJECT_EXTS = tuple(ext for ext in ProjectModules if ext != '.cue')
+
+
+def find_files(paths, exts):
+    """
+    Yield the files in paths. Directories are searched recursively for files
+    whose extension is in exts, files given explicitly are always yielded.
+    Directory contents are yielded in sorted order.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1] in exts:
+                    yield os.path.join(root, name)
+
+
+def plan_outputs(paths, exts, out_dir, out_ext):
+    """
+    Like find_files, but yield (src, dst, error) triples where dst is src's
+    path relative to the searched directory, under out_dir, with out_ext
+    appended (mix.als -> mix.als.cue, so mix.als and mix.flp don't
+    collide). Files given explicitly go directly in out_dir.
+
+    error is None, or a ValueError if an earlier src already planned dst
+    (e.g. two explicit files with the same name), which must then not be
+    written.
+    """
+    planned = {}
+    for path in paths:
+        for src in find_files([path], exts):
+            if src == path:
+                rel = os.path.basename(src)
+            else:
+                rel = os.path.relpath(src, path)
+            dst = os.path.join(out_dir, rel + out_ext)
+
+            key = os.path.normcase(os.path.abspath(dst))
+            if key in planned:
+                yield src, dst, ValueError('Output already planned for', planned[key])
+                continue
+            planned[key] = src
+            yield src, dst, None
+
+
+def _chunked(items, size):
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_chunk(fn, chunk):
+    return [fn(x) for x in chunk]
+
+
+# concurrent.futures classes, imported only when a pool is needed (the
+# process pool pulls in multiprocessing, which is slow to import)
+EXECUTORS = {
+    'process': 'ProcessPoolExecutor',
+    'thread': 'ThreadPoolExecutor',
+}
+
+def parallel_map(fn, items, jobs=None, chunksize=1, ordered=True, executor='process'):
+    """
+    Lazily map fn over items across a pool of jobs workers (default: one per
+    cpu). jobs=1 runs everything in this thread. executor selects worker
+    processes ('process') or threads ('thread').
+
+    Items are sent to the workers in chunks of chunksize, and only a few
+    chunks per worker are in flight at once, so items can be a long lazy
+    iterable. Results are yielded in input order, or as soon as they're
+    done if ordered is False.
+
+    For processes, fn must be picklable, i.e. a module level function.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError('Unknown executor', executor)
+
+    if jobs == 1:
+        yield from map(fn, items)
+        return
+
+    import concurrent.futures
+    from concurrent.futures import wait, FIRST_COMPLETED
+    executor_cls = getattr(concurrent.futures, EXECUTORS[executor])
+
+    jobs = jobs or os.cpu_count() or 1
+    max_in_flight = jobs * 4
+    chunks = _chunked(items, chunksize)
+
+    with executor_cls(jobs) as executor:
+        def submit():
+            chunk = next(chunks, None)
+            if chunk is None:
+                return None
+            return executor.submit(_run_chunk, fn, chunk)
+
+        if ordered:
+            pending = deque(filter(None, (submit() for _ in range(max_in_flight))))
+            while pending:
+                results = pending.popleft().result()
+                future = submit()
+                if future is not None:
+                    pending.append(future)
+                yield from results
+        else:
+            pending = set(filter(None, (submit() for _ in range(max_in_flight))))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    new = submit()
+                    if new is not None:
+                        pending.add(new)
+                    yield from future.result()
+
+
+#
+# Converters
+#
+
+def _write_cue(proj, dst):
+    with open(dst, 'w', encoding='utf-8', buffering=1 << 16) as f:
+        proj.emit_cue_to(f)
+
+
+def _write_smf(proj, dst):
+    with open(dst, 'wb') as f:
+        proj.emit_smf_to(f)
+
+
+def _export_job(writer, job):
+    """
+    Parse the project src and write it to dst with writer(proj, dst).
+    Returns (src, dst, error), errors are returned rather than raised so one
+    bad file doesn't stop a batch.
+    """
+    src, dst, error, kwargs = job
+    if error is not None:
+        return src, dst, error
+    try:
+        with open(src, 'rb') as f:
+            proj = load_project(src, f, **kwargs)
+        proj.parse()
+
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        writer(proj, dst)
+        return src, dst, None
+    except Exception as e:
+        return src, dst, e
+
+
+def _export(planned, writer, jobs, kwargs):
+    # writer must be module level, so the partial pickles for worker processes
+    jobs_iter = ((*p, kwargs) for p in planned)
+    return parallel_map(partial(_export_job, writer), jobs_iter, jobs, chunksize=16)
+
+
+def export_cues(paths, out_dir, jobs=None, **kwargs):
+    """
+    Export the markers of every project in paths (files or directories,
+    searched recursively for .als/.flp) as cue sheets in out_dir, across
+    jobs processes. kwargs are passed to load_project.
+
+    Yields (src, dst, error) per project, in path order. error is None on
+    success.
+    """
+    planned = plan_outputs(paths, PROJECT_EXTS, out_dir, '.cue')
+    yield from _export(planned, _write_cue, jobs, kwargs)
+
+
+def export_smfs(paths, out_dir, jobs=None, **kwargs):
+    """
+    Export the tempo map and markers of every project in paths (files or
+    directories, searched recursively for .als/.flp) as Standard MIDI Files
+    in out_dir, across jobs processes. kwargs are passed to load_project.
+
+    Yields (src, dst, error) per project, in path order. error is None on
+    success.
+    """
+    from .smf import SMF_EXT
+
+    planned = plan_outputs(paths, PROJECT_EXTS, out_dir, SMF_EXT)
+    yield from _export(planned, _write_smf, jobs, kwargs)
+
+
+def export_sidecars(paths, out_dir=None, jobs=None, **kwargs):
+    """
+    Write a tempo map sidecar (see dawtool.sidecar) for every project in
+    paths (files or directories, searched recursively for .als/.flp), across
+    jobs processes. kwargs are passed to load_project.
+
+    Sidecars are written next to their project (mix.als.tempomap), or in
+    out_dir if given.
+
+    Yields (src, dst, error) per project, in path order. error is None on
+    success.
+    """
+    from .sidecar import SIDECAR_EXT, write_sidecar
+
+    if out_dir is None:
+        planned = ((src, src + SIDECAR_EXT, None) for src in find_files(paths, PROJECT_EXTS))
+    else:
+        planned = plan_outputs(paths, PROJECT_EXTS, out_dir, SIDECAR_EXT)
+    yield from _export(planned, write_sidecar, jobs, kwargs)
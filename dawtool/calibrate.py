@@ -0,0 +1,198 @@
+"""
+Calibration of DAW tempo quantization (TEMPO_QUANT).
+
+DAWs only update the tempo every few beats, which makes the real time of a
+tempo ramp depend on how often (see Project._time_between_events_daw). To
+find a DAW's quantization, render a few linear tempo ramps in it, measure
+how long they take, and compare to the times predicted for each candidate
+quantization:
+
+    segments = [Segment(60, 120, 4, 2.836), Segment(120, 90, 8, 4.571)]
+    calibrate(segments).quant
+
+A segment is a linear ramp from start_bpm to end_bpm over beats, starting
+on a grid step, and the measured seconds it took. The prediction for all
+candidates and all segments is computed at once in closed form: the time
+is a sum of 60 / bpm over the grid steps, with bpms in arithmetic
+progression, which is a difference of digamma functions.
+
+scipy is only imported when predicting.
+"""
+
+from .project import get_project_class
+
+from collections import namedtuple
+from dataclasses import dataclass
+import csv
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# the practical candidates, steps per 4 beats
+DEFAULT_CANDIDATES = tuple(2 ** i for i in range(13))
+
+
+class Segment(namedtuple('Segment', 'start_bpm end_bpm beats seconds')):
+    """
+    A measured linear tempo ramp
+    """
+    __slots__ = ()
+
+
+def _digamma_asymptotic(x):
+    """
+    digamma(x) - log(x) for large x
+    """
+    x2 = x * x
+    return -1 / (2 * x) - 1 / (12 * x2) + 1 / (120 * x2 * x2) - 1 / (252 * x2 * x2 * x2)
+
+
+def _progression_sum(a, b, n):
+    """
+    sum(1 / (a + b*k) for k in range(n)) for arrays a > 0, b, n >= 0, with
+    a + b*k > 0.
+
+    That is (digamma(x + n) - digamma(x)) / |b|, x = a / |b| (summing
+    decreasing progressions from their smallest term).
+    """
+    from scipy.special import digamma
+
+    first = np.where(b < 0, a + b * (n - 1), a)
+    step = np.abs(b)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        x = first / step
+        exact = digamma(x + n) - digamma(x)
+        # for nearly constant progressions the digamma difference cancels
+        # out. expand it around log instead
+        large = np.log1p(n / x) + _digamma_asymptotic(x + n) - _digamma_asymptotic(x)
+        psi = np.where(x > 1e3, large, exact) / step
+
+    return np.where(n == 0, 0., np.where(step == 0, n / first, psi))
+
+
+def predict_times(start_bpms, end_bpms, beats, quants):
+    """
+    Real time of linear tempo ramps from start_bpms to end_bpms over beats
+    (starting on a grid step), with the tempo held for 4 / quant beats at a
+    time at the ramp's value at the start of the step.
+
+    return: array of seconds, shaped (len(quants), len(segments))
+    """
+    start = np.asarray(start_bpms, dtype=float)[None, :]
+    end = np.asarray(end_bpms, dtype=float)[None, :]
+    beats = np.asarray(beats, dtype=float)[None, :]
+    align = 4 / np.asarray(quants, dtype=float)[:, None]
+
+    # whole steps, then what's left of the ramp at the last step's bpm
+    # (tolerating float error in beats / align)
+    full = np.floor(beats / align + 1e-9)
+    rest = np.maximum(beats - full * align, 0.)
+    per_step = (end - start) / beats * align
+
+    steps_time = 60 * align * _progression_sum(np.broadcast_to(start, full.shape), per_step, full)
+    return steps_time + 60 * rest / (start + per_step * full)
+
+
+@dataclass
+class Calibration:
+    """
+    Predicted times (candidates x segments) for each candidate quant
+    """
+    candidates: np.ndarray
+    segments: list
+    predicted: np.ndarray
+
+    @property
+    def residuals(self):
+        """
+        Predicted - measured seconds, candidates x segments
+        """
+        return self.predicted - np.array([s.seconds for s in self.segments])[None, :]
+
+    @property
+    def rms(self):
+        """
+        RMS residual (seconds) per candidate
+        """
+        return np.sqrt((self.residuals ** 2).mean(axis=1))
+
+    @property
+    def max_abs(self):
+        """
+        Largest absolute residual (seconds) per candidate
+        """
+        return np.abs(self.residuals).max(axis=1)
+
+    @property
+    def quant(self):
+        """
+        The best fitting candidate
+        """
+        return int(self.candidates[np.argmin(self.rms)])
+
+    def residuals_of(self, quant):
+        """
+        Residuals (seconds) per segment of a candidate
+        """
+        return self.residuals[list(self.candidates).index(quant)]
+
+
+def calibrate(segments, candidates=DEFAULT_CANDIDATES):
+    """
+    Fit the tempo quantization to measured segments.
+
+    raises ValueError if there are no segments
+
+    return: Calibration
+    """
+    segments = [Segment(*s) for s in segments]
+    if not segments:
+        raise ValueError('No segments')
+    candidates = np.array(sorted(set(candidates)))
+    predicted = predict_times([s.start_bpm for s in segments], [s.end_bpm for s in segments],
+                              [s.beats for s in segments], candidates)
+    return Calibration(candidates, segments, predicted)
+
+
+QuantValidation = namedtuple('QuantValidation', 'ok quant best_quant max_error_ms calibration')
+
+def validate_project_quant(project, segments, tolerance_ms=1., candidates=DEFAULT_CANDIDATES):
+    """
+    Check a Project subclass' TEMPO_QUANT against reference render timings.
+    project is a Project subclass, instance, or file extension (e.g. '.als').
+
+    ok if TEMPO_QUANT is the best fitting candidate, and predicts every
+    segment to within tolerance_ms.
+
+    return: QuantValidation
+    """
+    if isinstance(project, str):
+        project = get_project_class(project)
+    quant = project.TEMPO_QUANT
+    if quant is None:
+        raise ValueError('Project has no TEMPO_QUANT', project)
+
+    cal = calibrate(segments, set(candidates) | {quant})
+    max_error_ms = float(np.abs(cal.residuals_of(quant)).max()) * 1000
+    ok = cal.quant == quant and max_error_ms <= tolerance_ms
+    return QuantValidation(ok, quant, cal.quant, max_error_ms, cal)
+
+
+def read_segments(fp):
+    """
+    Read segments from a CSV file object with the columns start_bpm,
+    end_bpm, beats, seconds (with or without that header row). Malformed
+    rows are skipped with a warning.
+    """
+    segments = []
+    for row in csv.reader(fp):
+        if not row or row[0].strip().startswith('#') or row[0].strip() == 'start_bpm':
+            continue
+        try:
+            segments.append(Segment(*map(float, row)))
+        except (TypeError, ValueError):
+            logger.warning('Skipping malformed segment row %s', row)
+    return segments
@@ -0,0 +1,193 @@
+"""
+Compiled, immutable timelines.
+
+Computing times with a Project caches state on its tempo automation events
+(real_time, prev_aligned_bpm), so a Project shouldn't be queried from
+several threads at once. Project.compile() resolves the tempo automation
+and markers once into a CompiledTimeline, backed by read-only numpy arrays.
+It can be queried from any number of threads, and pickles its arrays as
+plain buffers (out of band with pickle protocol 5), so it is cheap to send
+to worker processes.
+
+    timeline = proj.compile()
+    pool.map(timeline.real_times, chunks_of_beats)
+"""
+
+from .marker import Marker
+from . import timeline
+
+import numpy as np
+
+
+def _frozen(a):
+    """
+    Read-only float copy of a. Read-only float arrays (e.g. memory mapped
+    ones) are used as is.
+    """
+    if isinstance(a, np.ndarray) and a.dtype == np.float64 and not a.flags.writeable:
+        return a
+    a = np.array(a, dtype=float)
+    a.flags.writeable = False
+    return a
+
+
+class CompiledTimeline:
+    """
+    Tempo automation events as arrays (event_*, sorted by beat,
+    event_prev_aligned_bpms is nan where there is none), with the markers,
+    time signatures and, in DAW mode if requested, the dense grid table
+    (see timeline.dense_grid).
+
+    align is the DAW tempo alignment in beats (4 / TEMPO_QUANT), None in
+    theoretical mode. A project without tempo information (e.g. cue files)
+    has no events, and only its markers can be queried.
+    """
+    __slots__ = ('event_beats', 'event_bpms', 'event_real_times', 'event_prev_aligned_bpms',
+                 'align', 'marker_times', 'marker_texts', 'time_signatures', 'dense')
+
+    def __init__(self, beats, bpms, real_times, prev_aligned_bpms, align,
+                 marker_times, marker_texts, time_signatures, dense=None):
+        # set through object.__setattr__, see __setattr__
+        init = object.__setattr__
+        init(self, 'event_beats', _frozen(beats))
+        init(self, 'event_bpms', _frozen(bpms))
+        init(self, 'event_real_times', _frozen(real_times))
+        init(self, 'event_prev_aligned_bpms', _frozen(prev_aligned_bpms))
+        init(self, 'align', align)
+        init(self, 'marker_times', _frozen(marker_times))
+        init(self, 'marker_texts', tuple(marker_texts))
+        init(self, 'time_signatures', tuple(time_signatures))
+        if dense is not None:
+            dense = (dense[0], _frozen(dense[1]))
+        init(self, 'dense', dense)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledTimeline is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('CompiledTimeline is immutable')
+
+    def __reduce__(self):
+        # through __init__, so the arrays are read-only after unpickling too
+        return (CompiledTimeline, (self.event_beats, self.event_bpms, self.event_real_times,
+                                   self.event_prev_aligned_bpms, self.align, self.marker_times,
+                                   self.marker_texts, self.time_signatures, self.dense))
+
+    def __repr__(self):
+        return f'<CompiledTimeline: {len(self.event_beats)} tempo events, {len(self.marker_times)} markers>'
+
+    @property
+    def theoretical(self):
+        return self.align is None
+
+    @property
+    def markers(self):
+        """
+        New list of Marker sorted by time
+        """
+        return [Marker(t, text) for t, text in zip(self.marker_times.tolist(), self.marker_texts)]
+
+    def real_times(self, beats):
+        """
+        Real times of an array of beats, like Project.beat_real_times
+
+        return: numpy array of seconds
+        """
+        beats = np.asarray(beats, dtype=float)
+        if not len(self.event_beats):
+            raise ValueError('No tempo information')
+        if beats.size and beats.min() < 0:
+            raise ValueError('Negative beat', beats.min())
+
+        events = (self.event_beats, self.event_bpms, self.event_real_times)
+        if self.theoretical:
+            return timeline.theoretical_real_times(*events, beats)
+        if self.dense is not None:
+            ret = timeline.dense_real_times(self.dense, beats, self.align)
+            if ret is not None:
+                return ret
+        return timeline.daw_real_times(*events, beats, self.align)
+
+    def real_time(self, beat):
+        """
+        Real time of a single beat, in seconds
+        """
+        return float(self.real_times([beat])[0])
+
+    def beats_at(self, times):
+        """
+        Beats at an array of real times (seconds), the inverse of
+        real_times. Where the tempo never changes within a grid step this is
+        exact, otherwise (theoretical mode, beats outside of the dense table)
+        it is found by bisection, to within ~1e-9 beats.
+
+        return: numpy array of beats
+        """
+        times = np.asarray(times, dtype=float)
+        if not len(self.event_beats):
+            raise ValueError('No tempo information')
+        if times.size and times.min() < 0:
+            raise ValueError('Negative time', times.min())
+
+        if self.dense is not None:
+            first, table = self.dense
+            if not times.size or (times.min() >= table[0] and times.max() <= table[-1]):
+                k = np.clip(np.searchsorted(table, times, side='right') - 1, 0, len(table) - 2)
+                span = table[k+1] - table[k]
+                frac = np.divide(times - table[k], span, out=np.zeros_like(times), where=span > 0)
+                return (first + k + frac) * self.align
+
+        # a beat can't be later than at the fastest tempo throughout
+        lo = np.zeros_like(times)
+        hi = times * self.event_bpms.max() / 60 + (self.align or 0.) + 1.
+        while np.any(hi - lo > 1e-9):
+            mid = (lo + hi) / 2
+            later = self.real_times(mid) > times
+            hi = np.where(later, mid, hi)
+            lo = np.where(later, lo, mid)
+        return lo
+
+    def bpm_at(self, beats):
+        """
+        Tempo automation value at an array of beats
+        """
+        if not len(self.event_beats):
+            raise ValueError('No tempo information')
+        return timeline.bpm_at(self.event_beats, self.event_bpms, beats)
+
+
+def compile_project(proj, dense=False):
+    """
+    See Project.compile. Doesn't modify the project.
+    """
+    events = getattr(proj, 'tempo_automation_events', None)
+    if proj.TEMPO_QUANT is None:
+        # no tempo information, only markers
+        beats = bpms = prev = real_times = ()
+    elif proj._calc_beat_real_time_fast_path():
+        beats, bpms, prev, real_times = [0.], [proj.beats_per_min], [np.nan], [0.]
+    else:
+        beats = np.array([ev.beat for ev in events])
+        bpms = np.array([ev.bpm for ev in events])
+        if proj.theoretical:
+            durations = timeline.theoretical_segment_durations(beats, bpms)
+            prev = np.full(len(beats), np.nan)
+        else:
+            prev0 = events[0].prev_aligned_bpm
+            durations, prev = timeline.daw_segment_durations(
+                    beats, bpms, 4 / proj.TEMPO_QUANT, np.nan if prev0 is None else prev0)
+        real_times = np.concatenate([[0.], np.cumsum(durations)])
+
+    align = None
+    table = None
+    if not proj.theoretical and proj.TEMPO_QUANT is not None:
+        align = 4 / proj.TEMPO_QUANT
+        if dense and len(beats):
+            table = proj._dense or timeline.dense_grid(beats, bpms, real_times, align, proj.dense_budget)
+
+    # parse order isn't necessarily time order (e.g. cue sheets). sorted()
+    # is stable, so markers at the same time keep their order
+    markers = sorted(proj.markers, key=lambda m: m.time)
+    return CompiledTimeline(beats, bpms, real_times, prev, align,
+                            [m.time for m in markers], [m.text for m in markers],
+                            proj.time_signatures, table)
@@ -198,25 +198,35 @@ class AbletonProject(Project):
         return inner_chunk
 
     def parse(self):
-        try:
-            self.contents = gzip.decompress(self.raw_contents)
-        except OSError as e:
-            if self.require_gzip:
-                raise ValueError('Not gzip', len(self.raw_contents), self.raw_contents[:30]) from None
-            else:
-                self.contents = self.raw_contents
+        with self._phase('decompress'):
+            try:
+                self.contents = gzip.decompress(self.raw_contents)
+            except OSError as e:
+                if self.require_gzip:
+                    raise ValueError('Not gzip', len(self.raw_contents), self.raw_contents[:30]) from None
+                else:
+                    self.contents = self.raw_contents
+        self._count('bytes_decompressed', len(self.contents))
 
         if not self.contents:
             raise ValueError('Empty contents')
 
-        self._parse_version()
+        with self._phase('version'):
+            self._parse_version()
 
-        # Gather all raw info needed to compute marker times
-        self._parse_tempo(self.contents)
-        self._parse_markers(self.contents)
-        self._parse_automation(self.contents)
+        # Gather all raw info needed to compute marker times.
+        # Each of these scans for its tag, then parses just that chunk as xml
+        with self._phase('tempo'):
+            self._parse_tempo(self.contents)
+        with self._phase('markers'):
+            self._parse_markers(self.contents)
+        with self._phase('automation'):
+            self._parse_automation(self.contents)
+        if self.simplify_ms is not None:
+            self._simplify_tempo_automation_events()
 
-        self._calc_markers()
+        with self._phase('calc_markers'):
+            self._calc_markers()
 
     def _parse_version(self):
         start_idx = self.contents.find(b'<Ableton')
@@ -327,6 +337,7 @@ class AbletonProject(Project):
             return
 
         self.tempo_automation_events = [TempoAutomationFloatEvent.fromxml(ev) for ev in events]
+        self._count('tempo_events', len(self.tempo_automation_events))
 
     def _parse_tempo(self, contents):
         if self.version.minorA == 8:
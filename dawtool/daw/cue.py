@@ -7,10 +7,12 @@ correct for it if re-emitting a rekordbox cue file.
 
 from ..project import Project
 from ..marker import Marker
+from ..util import CUE_FRAMES_PER_SEC
 
 import os.path
 import io
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict
 
 
 @dataclass
@@ -33,72 +35,155 @@ class CueRawMarker(Marker):
         return '{:02}:{:02}:00'.format(min, sec)
 
 
+@dataclass
+class _CueTrackData:
+    """
+    Commands collected for one TRACK block while tokenizing.
+    """
+    performer: str = None
+    title: str = None
+    file: str = None
+    file_type: str = None
+    # index number -> raw index string
+    indexes: Dict[int, str] = field(default_factory=dict)
+
+
 class CueFile(Project):
     EXT = '.cue'
 
-    def __init__(self, filename, stream):
-        super().__init__(filename, stream)
-        self.contents = stream.read().decode()
+    def __init__(self, filename, stream, *args, **kwargs):
+        super().__init__(filename, stream, *args, **kwargs)
+        # kept undecoded, parse() decodes it line by line
+        self.raw_contents = stream.read()
         self.performer = 'UNKNOWN'
         self.title = 'UNKNOWN'
         self.path = None
         self.file = None
         self.file_type = None
 
-        # looking for a line like this: REM RECORDED_BY "rekordbox-dj"
-        self._from_rekordbox = 'RECORDED_BY "rekordbox-dj"' in self.contents
+        # set during parse if we find a line like this:
+        # REM RECORDED_BY "rekordbox-dj"
+        self._from_rekordbox = False
 
     def emit(self):
         """
         Should be called after .parse()
         """
         s = io.StringIO()
-        s.write(f'PERFORMER "{self.performer}"\n')
-        s.write(f'TITLE "{self.title}"\n')
-        s.write(f'FILE "{self.file}" {self.file_type}\n')
+        self.emit_to(s)
+        return s.getvalue()
+
+    def emit_to(self, fp):
+        """
+        Write the sheet to the text file object fp, one track at a time.
+
+        Should be called after .parse()
+        """
+        fp.write(f'PERFORMER "{self.performer}"\n'
+                 f'TITLE "{self.title}"\n'
+                 f'FILE "{self.file}" {self.file_type}\n')
         for i, m in enumerate(self.markers, start=1):
-            s.write(f'  TRACK {i:02} AUDIO\n')
+            lines = [f'  TRACK {i:02} AUDIO\n']
 
             # guaranteed to have INDEX, but we don't assume anything else
             if m.performer is not None:
-                s.write(f'    PERFORMER "{m.performer}"\n')
+                lines.append(f'    PERFORMER "{m.performer}"\n')
             if m.title is not None:
-                s.write(f'    TITLE "{m.title}"\n')
+                lines.append(f'    TITLE "{m.title}"\n')
             if self._from_rekordbox:
                 # if from recordbox, we need to compute a proper index, since
                 # theirs is wrong
-                s.write('    INDEX {:02} {}\n'.format(m.index_num, m.recomputed_index))
+                lines.append('    INDEX {:02} {}\n'.format(m.index_num, m.recomputed_index))
             else:
                 # safe to directly use the index from the original file
-                s.write(f'    INDEX {m.index_num:02} {m.orig_index}\n')
-        return s.getvalue()
+                lines.append(f'    INDEX {m.index_num:02} {m.orig_index}\n')
+            fp.write(''.join(lines))
+
+    def emit_cue_to(self, fp, *args, **kwargs):
+        """
+        A cue file is exported by re-emitting it
+        """
+        self.emit_to(fp)
 
     def parse(self):
-        header, *track_chunks = self.contents.split('TRACK')
+        """
+        Single pass over the lines of the sheet. Commands before the first
+        TRACK are header commands, everything after a TRACK belongs to that
+        track until the next one.
+        """
+        with self._phase('parse'):
+            self._parse_lines(io.TextIOWrapper(io.BytesIO(self.raw_contents), encoding='utf-8'))
 
-        self._parse_header(header)
+    def _parse_lines(self, lines):
+        header = _CueTrackData()
+        track = None
+        for line in lines:
+            command, _, args = line.strip().partition(' ')
 
-        # discard header info
-        for chunk in track_chunks:
-            self.markers.append(self._parse_chunk(chunk))
+            if command == 'TRACK':
+                if track is not None:
+                    self.markers.append(self._make_marker(track))
+                track = _CueTrackData()
+            elif command == 'REM':
+                # rekordbox puts this in the header, before any TRACK
+                if args.strip() == 'RECORDED_BY "rekordbox-dj"':
+                    self._from_rekordbox = True
+            else:
+                self._parse_command(track or header, command, args)
 
-    def _parse_header(self, header):
-        headerlines = header.splitlines()
-        self.performer = self._get_line_data('PERFORMER', headerlines) or 'UNKNOWN'
-        self.title = self._get_line_data('TITLE', headerlines) or 'UNKNOWN'
-        self.file, self.file_type = self._get_line_data('FILE', headerlines) or (None, None)
+        if track is not None:
+            self.markers.append(self._make_marker(track))
 
+        self.performer = header.performer or 'UNKNOWN'
+        self.title = header.title or 'UNKNOWN'
+        self.file, self.file_type = header.file, header.file_type
 
     def _parse_chunk(self, chunk):
-        lines = [x.strip() for x in chunk.splitlines()]
+        """
+        Parse the lines of a single track block into a marker
+        """
+        track = _CueTrackData()
+        for line in chunk.splitlines():
+            command, _, args = line.strip().partition(' ')
+            self._parse_command(track, command, args)
+        return self._make_marker(track)
 
-        performer = self._get_line_data('PERFORMER', lines)
-        title = self._get_line_data('TITLE', lines)
-        path, typ = self._get_line_data('FILE', lines) or (None, None)
-        text = None
+    @staticmethod
+    def _parse_command(track, command, args):
+        """
+        Store a command's arguments on track. If a command is repeated, the
+        first one is used. Unknown commands are ignored.
+        """
+        if command == 'INDEX':
+            # cue files can have multiple INDEX commands with different index
+            # "numbers" (0 for the pregap, 1 for the track start, ...)
+            try:
+                num, index = args.split()
+                num = int(num)
+            except ValueError:
+                raise ValueError('Malformed cue INDEX', args)
+            track.indexes.setdefault(num, index)
+        elif command == 'PERFORMER':
+            if track.performer is None:
+                track.performer = CueFile._unquote(args)
+        elif command == 'TITLE':
+            if track.title is None:
+                track.title = CueFile._unquote(args)
+        elif command == 'FILE':
+            if track.file is None:
+                track.file, track.file_type = map(lambda x: x.strip(), args.split('"')[1:])
 
-        # TODO: make this more hardened. what if there is no FILE?
-        # what if there is no title/etc?
+    @staticmethod
+    def _unquote(args):
+        if '"' in args:
+            return args.split('"')[1]
+        return args.strip()
+
+    def _make_marker(self, track):
+        performer = track.performer
+        title = track.title
+        path = track.file
+        text = None
 
         # If we have both the performer and track, use them.
         # Otherwise, just use the filename w/o extension and maybe we'll
@@ -118,45 +203,26 @@ class CueFile(Project):
             # No performer, no title, no file... we have nothing
             text = 'Unknown'
 
-        num, index = self._get_line_data('INDEX', lines) or (None, None)
+        # The track starts at INDEX 01. If there is none, fall back to the
+        # lowest index present.
+        # see https://www.gnu.org/software/ccd2cue/manual/html_node/INDEX-_0028CUE-Command_0029.html#INDEX-_0028CUE-Command_0029
+        num, index = None, None
+        if 1 in track.indexes:
+            num = 1
+        elif track.indexes:
+            num = min(track.indexes)
+        if num is not None:
+            index = track.indexes[num]
+
         return CueRawMarker(self._parse_index(index), text,
                 performer,
                 title,
                 num,
                 index,
                 path,
-                typ
+                track.file_type
                 )
 
-    def _get_line_data(self, key, lines):
-        lines = [x for x in lines if x.startswith(key)]
-        if not lines:
-            return None
-
-        if len(lines) > 1:
-            # FIXME: cue files can have multiple INDEX commands with different
-            # index "numbers" (0, 1, 2) in one track block. We should be
-            # looking for the one with number, which is what we support,
-            # but instead we raise this ValueError
-            raise ValueError('Multiple lines found with key', key)
-
-        # there should only be 1 per track chunk..
-        line = lines[0]
-
-        if key == 'INDEX':
-            num, index = line.split()[1:]
-            num = int(num)
-            if num != 1:
-                # see https://www.gnu.org/software/ccd2cue/manual/html_node/INDEX-_0028CUE-Command_0029.html#INDEX-_0028CUE-Command_0029
-                raise ValueError('Unimplemented INDEX number', num)
-            return num, index
-        elif key in ('PERFORMER', 'TITLE'):
-            return line.split('"')[1]
-        elif key == 'FILE':
-            return tuple(map(lambda x: x.strip(), line.split('"')[1:]))
-        
-        raise ValueError('Unimplemented key', key)
-
     def _parse_index(self, index):
         """
         Return 0 if index is none
@@ -184,5 +250,51 @@ class CueFile(Project):
             min, sec, frames = map(int, index.split(':'))
         except ValueError:
             raise ValueError('Malformed cue index')
-        # ignore frames.. no idea what the frame rate is
-        return min*60 + sec
+        return min*60 + sec + frames / CUE_FRAMES_PER_SEC
+
+
+#
+# Bulk rekordbox rewriting
+#
+
+def rewrite_rekordbox_cue(src, dst):
+    """
+    Re-emit the rekordbox cue file src to dst with corrected indexes. Cue
+    files not recorded by rekordbox are left alone.
+
+    return: True if dst was written
+    """
+    with open(src, 'rb') as f:
+        cue = CueFile(src, f)
+    cue.parse()
+    if not cue._from_rekordbox:
+        return False
+
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    with open(dst, 'w', encoding='utf-8', buffering=1 << 16) as f:
+        cue.emit_to(f)
+    return True
+
+
+def _rewrite_rekordbox_cue_job(paths):
+    src, dst = paths
+    try:
+        return src, dst, rewrite_rekordbox_cue(src, dst), None
+    except Exception as e:
+        return src, dst, False, e
+
+
+def rewrite_rekordbox_cues(src_dir, dst_dir, jobs=None):
+    """
+    Rewrite every rekordbox cue file under src_dir to the same relative path
+    under dst_dir (which may be src_dir itself), across jobs processes.
+
+    Yields (src, dst, written, error) per cue file, in path order.
+    """
+    from ..batch import find_files, parallel_map
+
+    def pairs():
+        for src in find_files([src_dir], (CueFile.EXT,)):
+            yield src, os.path.join(dst_dir, os.path.relpath(src, src_dir))
+
+    yield from parallel_map(_rewrite_rekordbox_cue_job, pairs(), jobs, chunksize=16)
@@ -3,13 +3,18 @@ FL Studio project module, including tempo automation code.
 """
 
 from ..marker import Marker
+from ..project import TimeSignature
 from .flstudio_core import FlStudioProjectCore, Event, Channel, \
                            ChannelAutomationPoint, PlaylistItem, \
                            AutomationChannel, FlStudioRawMarker
 
 from dataclasses import dataclass, field
 from typing import List
-from collections import Counter
+from itertools import groupby
+from bisect import bisect_left, bisect_right
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -46,6 +51,33 @@ class RenderedPlaylistItem:
     points: List[GlobalTempoAutomationPoint]
 
 
+@dataclass
+class AutomationTimeline:
+    """
+    Columnar global timeline of every clip automating one target (param_id
+    on dest_id), with the same gap/overlap/same start semantics as the tempo
+    automation. beats, values and artificial are parallel numpy arrays.
+
+    values are the raw point values as stored in the flp (0 to 1), not
+    converted to the param's units. artificial marks the points injected to
+    implement the clip semantics.
+    """
+    param_id: int
+    dest_id: int
+    channel_ids: List[int]
+    beats: 'numpy.ndarray'
+    values: 'numpy.ndarray'
+    artificial: 'numpy.ndarray'
+
+    @property
+    def is_master(self):
+        return self.dest_id == AutomationChannel.DEST_MASTER
+
+    @property
+    def is_tempo(self):
+        return self.is_master and self.param_id == AutomationChannel.PARAM_MASTER_TEMPO
+
+
 class FlStudioProject(FlStudioProjectCore):
     def __init__(self, filename, stream, *args, **kwargs):
         super().__init__(filename, stream, *args, **kwargs)
@@ -57,8 +89,14 @@ class FlStudioProject(FlStudioProjectCore):
 
     def parse(self):
         super().parse()
-        self._compute_tempo_automations()
-        self._calc_markers()
+        with self._phase('render_clips'):
+            self._compute_tempo_automations()
+        self._count('tempo_events', len(self.tempo_automation_events))
+        if self.simplify_ms is not None:
+            self._simplify_tempo_automation_events()
+        with self._phase('calc_markers'):
+            self._calc_markers()
+        self._calc_time_signatures()
 
     @property
     def has_tempo_automation(self):
@@ -74,6 +112,22 @@ class FlStudioProject(FlStudioProjectCore):
         markers = [Marker(self._calc_beat_real_time(self._convert_pulse_to_beat(m.pulse)), m.text) for m in filtered_markers]
         self.markers = markers
 
+    def _calc_time_signatures(self):
+        """
+        The project time signature, changed by time signature markers
+        """
+        sigs = {0.: TimeSignature(0., self.time_sig_numerator, self.time_sig_denominator)}
+        for m in self.raw_markers:
+            if m.action != Event.MarkerAction.TIME_SIGNATURE:
+                continue
+            if not m.numerator or not m.denominator:
+                logger.warning('Time signature marker without time signature at pulse %d', m.pulse)
+                continue
+            beat = self._convert_pulse_to_beat(m.pulse)
+            # a later marker on the same beat wins
+            sigs[beat] = TimeSignature(beat, m.numerator, m.denominator)
+        self.time_signatures = sorted(sigs.values())
+
     def _calc_beat_real_time_fast_path(self):
         return not self.tempo_automation_events
     
@@ -124,41 +178,41 @@ class FlStudioProject(FlStudioProjectCore):
         # the known start point of the playlist item
         tempo_auto_clips = []
         for auto_chan in self.tempo_automation_channels:
-            # TODO: validate channel_id? would be weird. how do we even handle?
-            # any of these situations where we parse some object that has a track_id or id, to be indexed into something else
-            # is potentially a bug
-            try:
-                chan = self.channels[auto_chan.channel_id]
-            except IndexError:
-                raise ValueError('Malformed auto chan channel id', auto_chan.channel_id)
+            chan = self._get_auto_chan_channel(auto_chan)
             clips = self._get_chan_clips(chan)
             tempo_auto_clips.extend(clips)
 
         # next, sort by the start of the clip. the start_beat and the time
         # of the first point are equal, so either can be used
         sorted_clips = sorted(tempo_auto_clips, key=lambda x: x.start_beat)
-        self._dedup_clips(sorted_clips)
-
-        deduped_clips = sorted_clips
+        deduped_clips = self._dedup_clips(sorted_clips)
+        self._count('clips', len(tempo_auto_clips))
+        self._count('clips_deduped', len(deduped_clips))
         self.tempo_automation_events = self._render_dedup_clips(deduped_clips)
 
-    def _dedup_clips(self, sorted_clips):
-        # TODO: cleaner non-mutation based approach? index walking seemed
-        # bit messy, as did keeping a list of times that had been deduped
-        # already
+    def _get_auto_chan_channel(self, auto_chan):
+        try:
+            return self.channels_by_id[auto_chan.channel_id]
+        except KeyError:
+            raise ValueError('Malformed auto chan channel id', auto_chan.channel_id)
 
-        # find all items that start at the same time. find the longest
-        # item (as determined by end-start, not points) and remove all others
-        counter = Counter(c.start_beat for c in sorted_clips)
-        need_deduping = (time for time, count in counter.items() if count > 1)
+    @staticmethod
+    def _dedup_clips(sorted_clips):
+        """
+        Find all clips that start at the same time and keep only the longest
+        one (as determined by item length, not points). On a tie the later
+        clip wins.
 
-        # now, rm the ones that need deduping
-        for time in need_deduping:
-            dups = filter(lambda x: x.start_beat == time, sorted_clips)
-            sorted_dups = sorted(dups, key=lambda x: x.len)
-            for dup in sorted_dups[:-1]:
-                # safe; clips must be unique in some way
-                sorted_clips.remove(dup)
+        Single pass over clips sorted by start_beat; returns a new list.
+        """
+        deduped = []
+        for _, same_start in groupby(sorted_clips, key=lambda x: x.start_beat):
+            longest = None
+            for clip in same_start:
+                if longest is None or clip.len >= longest.len:
+                    longest = clip
+            deduped.append(longest)
+        return deduped
 
     def _render_dedup_clips(self, deduped_clips):
         # now, we're ready to render out all the clips into a final
@@ -173,13 +227,7 @@ class FlStudioProject(FlStudioProjectCore):
             first = ArtificialGlobalTempoAutomationPoint(0.0, None, first_point.bpm)
             final_render.append(first)
 
-        for i, curr in enumerate(deduped_clips):
-            if curr is deduped_clips[-1]:
-                # last clip, just render them all
-                final_render += curr.points
-                break
-
-            next = deduped_clips[i+1]
+        for curr, next in zip(deduped_clips, deduped_clips[1:]):
             curr_last_point = curr.points[-1]
             curr_last_point_beat = curr_last_point.beat
 
@@ -206,17 +254,21 @@ class FlStudioProject(FlStudioProjectCore):
 
                 overlap_beat = next.start_beat
 
+                # points within a clip are sorted by beat, so split them
+                # around the overlap point with a binary search
+                beats = [p.beat for p in curr.points]
+                lo = bisect_left(beats, overlap_beat)
+                hi = bisect_right(beats, overlap_beat, lo)
+
                 # render all points less than the overlap point
-                for point in filter(lambda x: x.beat < overlap_beat, curr.points):
-                    final_render.append(point)
+                final_render += curr.points[:lo]
 
                 # do we happen to have any points at exactly the same as the
                 # overlap point? then this is easy, we render those and we're
                 # done
                 # TODO: try to make an flp that actually has this scenario
-                at_overlap = [p for p in curr.points if p.beat == overlap_beat]
-                if at_overlap:
-                    final_render += at_overlap
+                if hi > lo:
+                    final_render += curr.points[lo:hi]
                     continue
 
                 # ok this might be hard now. we need to inject an artifical
@@ -227,26 +279,10 @@ class FlStudioProject(FlStudioProjectCore):
                 # and the overlap
 
                 # now we need to consider the two points on either side
-                # of the overlap point
-
-                # we are guaranteed that the overlap point is less than
-                # the last point
-
-                prev_overlap = None
-                post_overlap = None
-                # TODO: technically, we could binary search. only useful if
-                # there were a /lot/ of points in this clip (unlikely)
-                for i, point in enumerate(curr.points):
-                    next_point = curr.points[i+1]
-                    if point.beat < overlap_beat < next_point.beat:
-                        prev_overlap = point
-                        post_overlap = next_point
-                        break
-
-                # we should be guaranteed to have found prev_overlap
-                # and post_overlap
-                assert prev_overlap is not None
-                assert post_overlap is not None
+                # of the overlap point. the clip starts before the overlap
+                # point and its last point is after it, so both exist.
+                prev_overlap = curr.points[lo-1]
+                post_overlap = curr.points[lo]
 
                 if prev_overlap.bpm == post_overlap.bpm:
                     # If there was no slope, great, just use their bpm
@@ -260,8 +296,136 @@ class FlStudioProject(FlStudioProjectCore):
                 fake = ArtificialGlobalTempoAutomationPoint(overlap_beat, None, fake_point_bpm)
                 final_render.append(fake)
 
+        # last clip, just render them all
+        final_render += deduped_clips[-1].points
+
         return final_render
     
+    #
+    # Generic automation
+    #
+
+    def render_automation_timelines(self):
+        """
+        Render every automation channel (master tempo/volume/pitch, mixer
+        track params, ...) into columnar global timelines, one per automation
+        target. Clips of channels automating the same target are merged,
+        following the same semantics as _compute_tempo_automations.
+
+        Should be called after .parse()
+
+        return: dict mapping (dest_id, param_id) to AutomationTimeline
+        """
+        targets = {}
+        for auto_chan in self.automation_channels:
+            key = (auto_chan.dest_id, auto_chan.param_id)
+            targets.setdefault(key, []).append(auto_chan)
+
+        timelines = {}
+        for (dest_id, param_id), auto_chans in targets.items():
+            chans = [self._get_auto_chan_channel(x) for x in auto_chans]
+            beats, values, artificial = self._render_timeline_columns(chans)
+            timelines[(dest_id, param_id)] = AutomationTimeline(param_id, dest_id,
+                    [x.id for x in chans], beats, values, artificial)
+
+        return timelines
+
+    def _render_timeline_columns(self, channels):
+        """
+        Vectorized equivalent of _get_chan_clips + _dedup_clips +
+        _render_dedup_clips over raw point values.
+
+        Every playlist item is a row of a (clips x points) matrix, padded with
+        +inf beats, so resolving, deduping and gap/overlap trimming are whole
+        array operations.
+
+        return: beats, values, artificial arrays
+        """
+        import numpy as np
+
+        rows_start = []
+        rows_len = []
+        rows_incs = []
+        rows_vals = []
+        for chan in channels:
+            if not chan.automation_points:
+                continue
+            incs = [p.beat_increment for p in chan.automation_points]
+            vals = [p.value for p in chan.automation_points]
+            for item in self.playlist_items_by_channel.get(chan.id, ()):
+                if item.muted:
+                    continue
+                rows_start.append(self._convert_pulse_to_beat(item.start_pulse))
+                rows_len.append(self._convert_pulse_to_beat(item.len_pulses))
+                rows_incs.append(incs)
+                rows_vals.append(vals)
+
+        if not rows_start:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=bool)
+
+        npoints = np.array([len(x) for x in rows_incs])
+        width = npoints.max()
+        valid = np.arange(width) < npoints[:, None]
+
+        # resolve point beats by accumulating increments onto the item start,
+        # left to right, same as _resolve_playlist_item_auto_points
+        acc = np.zeros((len(rows_start), width + 1))
+        acc[:, 0] = rows_start
+        values = np.full((len(rows_start), width), np.nan)
+        for i, (incs, vals) in enumerate(zip(rows_incs, rows_vals)):
+            acc[i, 1:npoints[i]+1] = incs
+            values[i, :npoints[i]] = vals
+        beats = np.cumsum(acc, axis=1)[:, 1:]
+        beats[~valid] = np.inf
+
+        # sort by start, then length (stable), and keep the last clip of
+        # each start time, i.e. the longest one
+        starts = np.array(rows_start)
+        order = np.lexsort((np.array(rows_len), starts))
+        starts = starts[order]
+        keep = np.append(starts[1:] != starts[:-1], True)
+        order = order[keep]
+        starts = starts[keep]
+        beats, values, valid, npoints = beats[order], values[order], valid[order], npoints[order]
+
+        # each clip is cut off by the start of the next one. all points up to
+        # and including the cut are rendered, which covers the gap, overlap and
+        # perfect alignment cases
+        cut = np.append(starts[1:], np.inf)
+        rendered = valid & (beats <= cut[:, None])
+
+        # unless there's a point exactly at the cut, inject an artificial one
+        # there. for a gap it continues the last point's value, for an overlap
+        # it's interpolated from the points around the cut
+        at_cut = (valid & (beats == cut[:, None])).any(axis=1)
+        inject = np.isfinite(cut) & ~at_cut
+        rows = np.arange(len(starts))
+        before = (valid & (beats < cut[:, None])).sum(axis=1)
+        lo = np.maximum(before - 1, 0)
+        hi = np.minimum(before, npoints - 1)
+        b0, b1 = beats[rows, lo], beats[rows, hi]
+        v0, v1 = values[rows, lo], values[rows, hi]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            interp = v0 + (v1 - v0) * (cut - b0) / (b1 - b0)
+        cut_values = np.where((before >= npoints) | (v0 == v1), v0, interp)
+
+        all_beats = np.hstack((beats, cut[:, None]))
+        all_values = np.hstack((values, cut_values[:, None]))
+        all_rendered = np.hstack((rendered, inject[:, None]))
+        all_artificial = np.zeros(all_rendered.shape, dtype=bool)
+        all_artificial[:, -1] = True
+
+        out_beats = all_beats[all_rendered]
+        out_values = all_values[all_rendered]
+        out_artificial = all_artificial[all_rendered]
+
+        if out_beats[0] != 0.0:
+            out_beats = np.insert(out_beats, 0, 0.0)
+            out_values = np.insert(out_values, 0, out_values[0])
+            out_artificial = np.insert(out_artificial, 0, True)
+
+        return out_beats, out_values, out_artificial
+
     def _get_chan_clips(self, channel):
         # return a list of RenderedPlaylistItem
         #lists of global automation points
@@ -270,9 +434,8 @@ class FlStudioProject(FlStudioProjectCore):
         # it
         ret = []
 
-        def item_filter(x):
-            return x.channel_id == channel.id and not x.muted
-        playlist_items = filter(item_filter, self.playlist_items)
+        items = self.playlist_items_by_channel.get(channel.id, ())
+        playlist_items = (x for x in items if not x.muted)
 
         for item in playlist_items:
             points = self._resolve_playlist_item_auto_points(channel, item)
@@ -12,14 +12,15 @@ from ..util import spb
 
 from io import BytesIO
 from enum import IntEnum, auto
+from collections import namedtuple, defaultdict
+import mmap
 import struct
 from binascii import hexlify as hx
 from dataclasses import dataclass, field
 from typing import List
 import logging
 
-# for debugging
-from hexdump import hexdump
+# for debugging, `from hexdump import hexdump` (pip install hexdump)
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +29,11 @@ logger = logging.getLogger(__name__)
 class Event:
     # BYTE Events
     BYTE = 0
-    TIME_SIG_NUMERATOR = 33  # there are unused, but I found them when reversing. relevant to markers
+    PROJECT_TIME_SIG_NUMERATOR = 17
+    PROJECT_TIME_SIG_DENOMINATOR = 18
+    # these follow each MARKER_TIME, and apply to it if it's a time
+    # signature marker
+    TIME_SIG_NUMERATOR = 33
     TIME_SIG_DENOMINATOR = 34
 
     # WORD Events
@@ -99,11 +104,139 @@ class Event:
     UNKNOWN_9A = 0x9a
 
 
+#
+# Raw event iteration
+#
+
+# payload sizes for the fixed size event kinds. TEXT (and data) events are
+# length prefixed.
+_FIXED_EVENT_SIZES = {Event.BYTE: 1, Event.WORD: 2, Event.DWORD: 4}
+_EVENT_STRUCTS = {
+    Event.BYTE: struct.Struct('<B'),
+    Event.WORD: struct.Struct('<H'),
+    Event.DWORD: struct.Struct('<I'),
+}
+_SIGNED_DWORD = struct.Struct('<i')
+_SIGNED_DWORD_EVENTS = (Event.UNKNOWN_92, Event.UNKNOWN_9A, Event.UNKNOWN_93)
+
+_FLP_HEADER = struct.Struct('<4sIHHH')
+_FLP_DATA_HEADER = struct.Struct('<4sI')
+
+
+class FlEvent(namedtuple('FlEvent', 'id kind offset data')):
+    """
+    A single undecoded flp event.
+
+    kind is the event id range the event falls in (Event.BYTE, Event.WORD,
+    Event.DWORD or Event.TEXT). offset is the position of the payload in the
+    source buffer and data is a memoryview over the payload (no copy).
+    """
+    __slots__ = ()
+
+    @property
+    def value(self):
+        """
+        The payload decoded the same way the project parser sees it: an int
+        for BYTE/WORD/DWORD events, bytes for TEXT/data events.
+        """
+        if self.kind == Event.TEXT:
+            return bytes(self.data)
+        if self.id in _SIGNED_DWORD_EVENTS:
+            return _SIGNED_DWORD.unpack(self.data)[0]
+        return _EVENT_STRUCTS[self.kind].unpack(self.data)[0]
+
+
+def _iter_events(buf, pos):
+    """
+    Walk events in buf starting at pos until the end of the buffer.
+    """
+    view = memoryview(buf)
+    end = len(view)
+
+    while pos < end:
+        event_id = view[pos]
+        pos += 1
+        kind = event_id & 0xc0  # top 2 bits select the event kind
+
+        if kind == Event.TEXT:
+            # text len encoded in the low 7 bits of the following bytes.
+            # the last byte with length data in it has 0 high bit.
+            size = 0
+            shift = 0
+            while True:
+                if pos >= end:
+                    raise ValueError('flp truncated event', event_id)
+                byt = view[pos]
+                pos += 1
+                size |= ((byt & 0x7f) << shift)
+                shift += 7
+                if not (byt & 0x80):
+                    break
+        else:
+            size = _FIXED_EVENT_SIZES[kind]
+
+        if pos + size > end:
+            raise ValueError('flp truncated event', event_id)
+
+        yield FlEvent(event_id, kind, pos, view[pos:pos+size])
+        pos += size
+
+
+def iter_events(source):
+    """
+    Lazily walk the raw events of an flp without building a project or
+    accumulating any state, e.g. to scan many files for one event type.
+
+    source is either bytes-like (bytes, bytearray, mmap, memoryview) or a
+    binary file object. Real files are memory mapped, other file objects are
+    read into memory.
+
+    Yields FlEvent in file order. It's fine to stop iterating early.
+
+    raises ValueError if the header is malformed or an event is truncated
+    """
+    mapped = None
+    if hasattr(source, 'read'):
+        try:
+            mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+            buf = mapped
+        except (AttributeError, OSError, ValueError):
+            # not a real file (BytesIO etc), or an empty one
+            buf = source.read()
+    else:
+        buf = source
+
+    try:
+        if len(buf) < _FLP_HEADER.size + _FLP_DATA_HEADER.size:
+            raise ValueError('flp too short')
+
+        magic, header_len, proj_format_type, _, _ = _FLP_HEADER.unpack_from(buf)
+        if magic != FlStudioProjectCore.MAGIC:
+            raise ValueError('flp bad magic')
+        if header_len != 6:
+            raise ValueError('flp unexpected header len')
+
+        data_magic, _ = _FLP_DATA_HEADER.unpack_from(buf, _FLP_HEADER.size)
+        if data_magic != b'FLdt':
+            raise ValueError('flp bad data chunk header')
+
+        yield from _iter_events(buf, _FLP_HEADER.size + _FLP_DATA_HEADER.size)
+    finally:
+        if mapped is not None:
+            try:
+                mapped.close()
+            except BufferError:
+                # caller still holds a payload view, leave it to the gc
+                pass
+
 
 @dataclass
 class FlStudioRawMarker(Marker):
     time: int
     action: int
+    # only meaningful for MarkerAction.TIME_SIGNATURE markers
+    numerator: int = None
+    denominator: int = None
 
     @property
     def pulse(self):
@@ -225,9 +358,19 @@ class FlStudioProjectCore(Project):
         self.version = None
         self.num_channels = 0
         self.channels = []
+        # id -> Channel. channel ids aren't necessarily list positions
+        # (deleted/reordered channels), so always resolve through this
+        self.channels_by_id = {}
         self.automation_channels = []
         self.playlist_items = []
+        # channel id -> list of PlaylistItem, for joining with channels
+        self.playlist_items_by_channel = defaultdict(list)
+        # the channel that channel specific events apply to
+        self._curr_channel = None
         self.raw_markers = []
+        # project wide time signature
+        self.time_sig_numerator = 4
+        self.time_sig_denominator = 4
         self.stream = BytesIO(stream.read())  # prevent dangling file
 
     @property
@@ -253,7 +396,8 @@ class FlStudioProjectCore(Project):
         self.num_channels = self._read16LE()
         self.pulses_per_beat = self._read16LE()
 
-        self._parse_events_chunk()
+        with self._phase('events'):
+            self._parse_events_chunk()
 
     def _parse_events_chunk(self):
         if self._read(4) != b'FLdt':
@@ -261,36 +405,17 @@ class FlStudioProjectCore(Project):
 
         data_chunk_len = self._read32LE()
 
-        while True:
-            try:
-                event_id = self._read8LE()
-                # print('getting event id', hex(event_id), end=' ')
-                # print()
-            except struct.error:
-                # print('exiting')
-                break
-            
-            if Event.BYTE <= event_id < Event.WORD:
-                data = self._read8LE()
-                # print(data, hex(data))
-            elif Event.WORD <= event_id < Event.DWORD:
-                data = self._read16LE()
-                # print(data, hex(data))
-            elif Event.DWORD <= event_id < Event.TEXT:
-                if event_id in [Event.UNKNOWN_92, Event.UNKNOWN_9A, Event.UNKNOWN_93]:
-                    data = self._read32LE(True)
-                else:
-                    data = self._read32LE()
-                # print(data, hex(data))
-            elif event_id >= Event.TEXT:
-                text_data_len = self._parse_text_data_len()
-                data = self._read(text_data_len)
-                # print(text_data_len, end=' ')
-                # print(data[:20])
-            else:
-                raise ValueError('flp invalid event id', event_id)
+        start = self.stream.tell()
+        decoded = 0
+        for event in _iter_events(self.stream.getvalue(), start):
+            # some handlers re-read their payload from the stream, so keep it
+            # positioned just past the current event
+            self.stream.seek(event.offset + len(event.data))
+            self._handle_event(event.id, event.value)
+            decoded += 1
 
-            self._handle_event(event_id, data)
+        self._count('events_decoded', decoded)
+        self._count('event_bytes', self.stream.tell() - start)
 
     def _handle_event(self, event_id, data):
         # TODO: eventually refactor to event handler functions
@@ -298,9 +423,16 @@ class FlStudioProjectCore(Project):
             # convert from milliseconds
             self.beats_per_min = data / 1000.0
         elif event_id == Event.CHANNEL_NEW:
-            self.channels.append(Channel(id=data))
+            chan = Channel(id=data)
+            if chan.id in self.channels_by_id:
+                # malformed, ids should be unique. the later channel is the
+                # one the following channel events apply to
+                logger.warning('Duplicate CHANNEL_NEW id %d', chan.id)
+            self.channels.append(chan)
+            self.channels_by_id[chan.id] = chan
+            self._curr_channel = chan
         elif event_id == Event.CHANNEL_NAME:
-            if not self.channels:
+            if self._curr_channel is None:
                 # This means flp is malformed. This event shoudl only be after
                 # a CHANNEL_NEW. Ignore it i guess..
                 # TODO: it would be cool to have some testing infrastructure
@@ -309,14 +441,14 @@ class FlStudioProjectCore(Project):
                 logger.warning('CHANNEL_NAME before CHANNEL_NEW')
                 return
 
-            self.channels[-1].name = self._decode_str(data)
+            self._curr_channel.name = self._decode_str(data)
         elif event_id == Event.CHANNEL_SAMPLE_PATH:
-            if not self.channels:
+            if self._curr_channel is None:
                 # This means flp is malformed. see above
                 logger.warning('CHANNEL_NAME before CHANNEL_NEW')
                 return
 
-            self.channels[-1].sample_path = self._decode_str(data)
+            self._curr_channel.sample_path = self._decode_str(data)
         elif event_id == Event.AUTOMATION_CHANNELS:
             orig_seek = self.stream.tell()
             self._reset_stream(data)
@@ -334,7 +466,11 @@ class FlStudioProjectCore(Project):
             achan = AutomationChannel(track_id, param_id, dest_id)
             self.automation_channels.append(achan)
         elif event_id == Event.AUTOMATION_DATA:
-            curr_chan = self.channels[-1]
+            if self._curr_channel is None:
+                # malformed, see above
+                logger.warning('AUTOMATION_DATA before CHANNEL_NEW')
+                return
+            curr_chan = self._curr_channel
 
             # TODO: these are useful for debugging, and should be logging
             # but at some level beyond debug
@@ -400,8 +536,6 @@ class FlStudioProjectCore(Project):
 
             # array of structs of size 32. add automation added 1 struct to this
 
-            from hexdump import hexdump
-
             start_seek = self.stream.tell()
             self.stream.seek(self.stream.tell() - len(data))
 
@@ -434,6 +568,7 @@ class FlStudioProjectCore(Project):
 
                 item = PlaylistItem(start_pulse, channel_id, len_pulses, track_id, flags)
                 self.playlist_items.append(item)
+                self.playlist_items_by_channel[channel_id].append(item)
 
                 # print('start_pulse', hex(start_pulse), start_pulse)  # steps/pulses?
                 # print('start_time', hex(start_pulse), start_pulse * self.sec_per_pulse)  # steps/pulses?
@@ -457,6 +592,18 @@ class FlStudioProjectCore(Project):
             marker_action = data >> (8*3)
             pulse = data & 0xffffff
             self.raw_markers.append(FlStudioRawMarker(pulse, '', marker_action))
+        elif event_id in (Event.TIME_SIG_NUMERATOR, Event.TIME_SIG_DENOMINATOR):
+            if not self.raw_markers:
+                logger.warning('Time signature event before any marker')
+                return
+            if event_id == Event.TIME_SIG_NUMERATOR:
+                self.raw_markers[-1].numerator = data
+            else:
+                self.raw_markers[-1].denominator = data
+        elif event_id == Event.PROJECT_TIME_SIG_NUMERATOR:
+            self.time_sig_numerator = data
+        elif event_id == Event.PROJECT_TIME_SIG_DENOMINATOR:
+            self.time_sig_denominator = data
         elif event_id == Event.MARKER_TEXT:
             # now we patch up the previously added marker
             # TODO: port to self._decode_str
@@ -496,7 +643,7 @@ class FlStudioProjectCore(Project):
             # print('got 0x24', data)
             pass
         elif event_id == Event.BASIC_CHAN_PARAMS:
-            # print(self.channels[-1].name)
+            # print(self._curr_channel.name)
             # hexdump(data)
             self.stream.seek(self.stream.tell() - len(data))
             a = self._read32LE()
@@ -513,21 +660,6 @@ class FlStudioProjectCore(Project):
             # print('unhandled event')
             pass
 
-    def _parse_text_data_len(self):
-        # text len encoded in the low 7 bits of the following bytes.
-        # the last byte with length data in it has 0 high bit.
-        ret = 0
-        shift = 0
-
-        while True:
-            byt = self._read8LE()
-            ret |= ((byt & 0x7f) << shift)
-            shift += 7
-            if not (byt & 0x80):
-                break
-        
-        return ret
-
     #
     # Stream helpers
     #
@@ -7,10 +7,16 @@ when doing time calculations.
 """
 
 from .marker import Marker
-from .util import calc_time_elapsed_theoretical, spb, format_time
+from .util import calc_time_elapsed_theoretical, spb, format_time, format_cue_index
 from .util import linspace, power_of_two
 
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+import heapq
+import sys
 
 @dataclass
 class GenericTempoAutomationEvent:
@@ -18,26 +24,63 @@ class GenericTempoAutomationEvent:
     real_time: float
     bpm: float
 
+    prev_aligned_bpm: float = None # computed
 
-from os.path import splitext
+
+class TimeSignature(namedtuple('TimeSignature', 'beat numerator denominator')):
+    """
+    A time signature taking effect at beat, starting a new bar there
+    """
+    @property
+    def beats_per_bar(self):
+        # beats are quarter notes
+        return self.numerator * 4 / self.denominator
+
+
+from os.path import splitext, basename
+from importlib import import_module
+import io
 
 # Map file extension to class responsible for parsing
-# filled by _register_project_subclasses at the bottom
+# filled by Project.__init_subclass__ as the DAW modules are imported
 ProjectsMap = {}
 
+# Map file extension to the module implementing it. These are only imported
+# the first time a file with that extension is loaded, so that
+# `import dawtool` stays cheap for short lived processes.
+ProjectModules = {
+    '.als': '.daw.ableton',
+    '.flp': '.daw.flstudio',
+    '.cue': '.daw.cue',
+}
+
 
 class UnknownExtension(Exception):
     pass
 
+# returned by Project._phase when not profiling, so disabled phases cost a
+# method call and nothing else
+_NO_PHASE = nullcontext()
+
+def get_project_class(ext):
+    """
+    Return the Project subclass for a file extension (e.g. '.als'),
+    importing its module if needed.
+
+    raises KeyError if no class handles ext
+    """
+    module = ProjectModules.get(ext)
+    if module is not None:
+        import_module(module, __package__)
+    return ProjectsMap[ext]
+
 def load_project(filename, stream, *args, **kwargs):
     """
     Resets the stream
     """
+    fname, ext = splitext(filename)
     try:
-        fname, ext = splitext(filename)
-        proj = ProjectsMap[ext](filename, stream, *args, **kwargs)
-        stream.seek(0)
-        return proj
+        cls = get_project_class(ext)
     except KeyError:
         stream.seek(0, 2)
         size = stream.tell()
@@ -45,25 +88,94 @@ def load_project(filename, stream, *args, **kwargs):
         # TODO: dont pass so much info, let client do that
         raise UnknownExtension(ext, size, stream.read(100))
 
+    proj = cls(filename, stream, *args, **kwargs)
+    stream.seek(0)
+    return proj
+
 
 class Project:
     # When implementing a subclass make sure to implement the EXT class
-    # attribute and add the subclass to `_register_project_subclasses`.
+    # attribute and add its module to `ProjectModules`.
 
     EXT = ''
     TEMPO_QUANT = None
 
+    # kinds of segments passed to on_segment
+    SEGMENT_VERTICAL = 'vertical'
+    SEGMENT_HORIZONTAL = 'horizontal'
+    SEGMENT_SLOPE = 'slope'
+    SEGMENT_THEORETICAL = 'theoretical'
+    SEGMENT_KINDS = (SEGMENT_VERTICAL, SEGMENT_HORIZONTAL, SEGMENT_SLOPE, SEGMENT_THEORETICAL)
+
+    # compute the real times of this many or more tempo automation events
+    # with numpy (DAW mode only)
+    VECTORIZE_MIN_EVENTS = 512
+
+    # default memory budget (bytes) for the dense timeline, see
+    # _dense_timeline. it's only built for batches of queries at least as
+    # large as it is, never while parsing
+    DENSE_BUDGET = 32 * 2**20
+
     # TODO: make filename optional
-    def __init__(self, filename, stream, theoretical=False):
+    def __init__(self, filename, stream, theoretical=False, profile=False,
+                 on_segment=None, on_phase=None, simplify_ms=None, dense_budget=None):
         self.filename = filename
         self.stream = stream
         self.markers = []
         self.version = None
+        # sorted by beat, the first at beat 0. 4/4 unless the format tells
+        # us otherwise
+        self.time_signatures = [TimeSignature(0., 4, 4)]
 
         # Use theoretical time calculations, or use the real daw
         # implementation based ones
         self.theoretical = theoretical
 
+        # Opt-in instrumentation. If profile is set, stats holds
+        #   phases: {name: seconds}, accumulated across uses of the phase
+        #   counters: {name: count}
+        # and if profile == 'memory', also
+        #   memory_peaks: {name: peak bytes allocated during the phase}
+        #   memory_peaks_skipped: why memory_peaks is empty, only set on
+        #     python < 3.9 when tracemalloc was already tracing (the peak
+        #     can't be reset without stopping the caller's tracing)
+        self.profile = profile
+        self.stats = {}
+        if profile:
+            self.stats = {'phases': {}, 'counters': {}}
+            if profile == 'memory':
+                self.stats['memory_peaks'] = {}
+
+        # Optional tracing hooks, for feeding metrics systems.
+        # on_segment(first, second, kind, elapsed) is called for every pair
+        # of tempo automation events whose time is computed (second is a
+        # GenericTempoAutomationEvent when computing a time between events).
+        # kind is one of SEGMENT_KINDS, elapsed is the real time (seconds)
+        # between them.
+        # on_phase(name, duration) is called when a parse phase (see stats)
+        # ends, with its wall clock duration in seconds.
+        self.on_segment = on_segment
+        self.on_phase = on_phase
+
+        # If set, drop tempo automation events that move no event's real time
+        # by more than simplify_ms milliseconds, before computing times.
+        # simplify_error_ms is set to the error actually introduced.
+        self.simplify_ms = simplify_ms
+        self.simplify_error_ms = None
+
+        # Memory budget in bytes for the dense timeline (DAW mode), built on
+        # demand by beat_real_times. None uses DENSE_BUDGET, 0 disables it.
+        self.dense_budget = self.DENSE_BUDGET if dense_budget is None else dense_budget
+        # None: not built yet, False: doesn't fit or doesn't apply
+        self._dense = None
+
+        # see _time_index. _real_times_of is the tempo automation events list
+        # whose real times were last computed, _real_times_generation counts
+        # the computations.
+        self._time_indexes = {}
+        self._real_times_of = None
+        self._real_times_generation = 0
+
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         ProjectsMap[cls.EXT] = cls
@@ -72,6 +184,64 @@ class Project:
     def sec_per_beat(self):
         return spb(self.beats_per_min)
 
+    #
+    # instrumentation
+    #
+
+    def _phase(self, name):
+        """
+        Context manager timing a phase of parsing, if profiling or there is
+        an on_phase hook. Phases shouldn't nest if measuring memory.
+        """
+        if not self.profile and self.on_phase is None:
+            return _NO_PHASE
+        return self._profile_phase(name)
+
+    @contextmanager
+    def _profile_phase(self, name):
+        tracemalloc = None
+        if self.profile == 'memory':
+            import tracemalloc
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                # python < 3.9 can't reset the peak, and restarting would
+                # drop the caller's traces. don't measure
+                self.stats['memory_peaks_skipped'] = 'tracemalloc was already tracing, ' \
+                                                     'and cannot reset its peak before python 3.9'
+                tracemalloc = None
+            if tracemalloc is not None:
+                base = tracemalloc.get_traced_memory()[0]
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            if self.profile:
+                phases = self.stats['phases']
+                phases[name] = phases.get(name, 0.) + elapsed
+            if self.on_phase is not None:
+                self.on_phase(name, elapsed)
+
+            if tracemalloc is not None:
+                peaks = self.stats['memory_peaks']
+                peak = tracemalloc.get_traced_memory()[1] - base
+                peaks[name] = max(peaks.get(name, 0), peak)
+                if started:
+                    tracemalloc.stop()
+
+    def _count(self, name, n=1):
+        """
+        Add n to a counter, if profiling
+        """
+        if self.profile:
+            counters = self.stats['counters']
+            counters[name] = counters.get(name, 0) + n
+
     def parse(self):
         raise NotImplementedError
 
@@ -85,63 +255,313 @@ class Project:
         """
         return None 
 
+    #
+    # beat grids
+    #
+
+    @property
+    def beats_per_bar(self):
+        """
+        Beats per bar at the start of the project
+        """
+        return self.time_signatures[0].beats_per_bar
+
+    def beat_real_times(self, beats):
+        """
+        Compute the real times of an array of beats at once, respecting
+        tempo automation and DAW tempo quantization. Much faster than
+        computing them one at a time when there are many.
+
+        Should be called after .parse()
+
+        return: numpy array of seconds
+        """
+        import numpy as np
+        from . import timeline
+
+        beats = np.asarray(beats, dtype=float)
+        if beats.size and beats.min() < 0:
+            raise ValueError('Negative beat', beats.min())
+
+        if self._calc_beat_real_time_fast_path():
+            return beats * self.sec_per_beat
+
+        events = self.tempo_automation_events
+        if events[0].real_time is None:
+            self._calc_tempo_automation_event_real_times()
+        event_beats = np.array([ev.beat for ev in events])
+        event_bpms = np.array([ev.bpm for ev in events])
+        event_times = np.array([ev.real_time for ev in events])
+
+        if self.theoretical:
+            return timeline.theoretical_real_times(event_beats, event_bpms, event_times, beats)
+
+        align = 4 / self.TEMPO_QUANT
+        dense = self._dense_timeline(queries=beats.size)
+        if dense is not None:
+            ret = timeline.dense_real_times(dense, beats, align)
+            if ret is not None:
+                return ret
+        return timeline.daw_real_times(event_beats, event_bpms, event_times, beats, align)
+
+    def beat_grid(self, start_beat, end_beat, step=1.):
+        """
+        Real times of every step beats from start_beat, up to but excluding
+        end_beat, as a numpy array. See beat_real_times.
+        """
+        import numpy as np
+        return self.beat_real_times(np.arange(start_beat, end_beat, step))
+
+    def bar_beats(self, start_beat, end_beat):
+        """
+        Beats at which bars start in [start_beat, end_beat), as a numpy
+        array, following the time signature changes.
+        """
+        from .timeline import bar_starts
+        return bar_starts(self.time_signatures, start_beat, end_beat)
+
+    def compile(self, dense=False):
+        """
+        Return an immutable dawtool.compiled.CompiledTimeline of the tempo
+        automation and markers. Unlike the project, it is safe to query from
+        many threads at once, and cheap to send to other processes.
+
+        dense: also build the dense timeline (DAW mode, if it fits in
+        dense_budget), for timelines that will be queried a lot. Building it
+        costs about as much as querying every grid step once.
+
+        Doesn't modify the project or its events.
+
+        Should be called after .parse()
+        """
+        from .compiled import compile_project
+        return compile_project(self, dense)
+
+    def tempo_map(self):
+        """
+        Return an editable copy of the tempo automation, see
+        dawtool.tempo_map.TempoMap.
+
+        Should be called after .parse()
+        """
+        from .tempo_map import TempoMap
+        return TempoMap(self)
+
+    def bar_grid(self, start_beat, end_beat):
+        """
+        Real times of the bar starts in [start_beat, end_beat), as a numpy
+        array. See beat_real_times.
+        """
+        return self.beat_real_times(self.bar_beats(start_beat, end_beat))
+
+    #
+    # cue sheet export
+    #
+
+    def emit_cue(self, *args, **kwargs):
+        """
+        Return the markers as a cue sheet string. See emit_cue_to.
+        """
+        s = io.StringIO()
+        self.emit_cue_to(s, *args, **kwargs)
+        return s.getvalue()
+
+    def emit_cue_to(self, fp, performer='UNKNOWN', title=None, file=None, file_type='WAVE'):
+        """
+        Write the markers as a cue sheet to the text file object fp, with one
+        track per marker. Track INDEX times are computed from the marker's
+        real time, with frames (75 per second).
+
+        title defaults to the project's file name, and file to that name
+        with a .wav extension.
+
+        Should be called after .parse()
+        """
+        name = splitext(basename(self.filename or ''))[0] or 'UNKNOWN'
+        title = name if title is None else title
+        file = name + '.wav' if file is None else file
+
+        def quote(x):
+            # there's no escaping in cue sheets
+            return x.replace('"', "'")
+
+        fp.write(f'PERFORMER "{quote(performer)}"\n'
+                 f'TITLE "{quote(title)}"\n'
+                 f'FILE "{quote(file)}" {file_type}\n')
+        for i, m in enumerate(self.markers, start=1):
+            fp.write(f'  TRACK {i:02} AUDIO\n'
+                     f'    TITLE "{quote(m.text)}"\n'
+                     f'    INDEX 01 {format_cue_index(m.real_time)}\n')
+
+    def emit_smf_to(self, fp, **kwargs):
+        """
+        Write the tempo map and markers as a Standard MIDI File to the binary
+        file object fp. See dawtool.smf.
+
+        Should be called after .parse()
+        """
+        from .smf import emit_smf
+        fp.write(emit_smf(self.compile(), **kwargs))
+
     #
     # tempo automation stuff
     #
 
-    def dump(self):
+    def dump(self, fp=None):
         """
         dump the automation timeline including automation events and markers
         and the distances between each timeline event
-        """
 
-        # If the proj has no markers, we need to force compute real times
-        self._calc_tempo_automation_event_real_times()
+        The dump is written to the text file object fp (default stdout) in a
+        single write.
+        """
 
         # TODO: just use real_time now that Marker has it
         def gettime(x):
             return x.real_time
-            # if isinstance(x, TempoAutomationFloatEvent):
-            #     return x.real_time
-            # else:
-            #     assert 0, type(x)
-            #     return x.time
 
-        timeline_events = self.markers + self.tempo_automation_events
-        # timeline_events = self.raw_markers + self.tempo_automation_events
-        sorted_timeline_events = sorted(timeline_events, key=lambda x: gettime(x))
+        # Both are kept sorted by time (which also computes the tempo
+        # automation events' real times if the proj has no markers), merge
+        # them. Markers first on ties.
+        _, markers = self._time_index('markers')
+        _, events = self._time_index('tempo')
+        sorted_timeline_events = list(heapq.merge(markers, events, key=gettime))
 
-        print('>>> Full Timeline Dump <<<')
+        lines = ['>>> Full Timeline Dump <<<\n']
 
         for i, ev in enumerate(sorted_timeline_events):
-            print(format_time(gettime(ev), precise=True), ev)
+            lines.append(f'{format_time(gettime(ev), precise=True)} {ev}\n')
             try:
                 dist = gettime(sorted_timeline_events[i+1]) - gettime(ev)
                 if dist:
-                    print('\t +', dist)
+                    lines.append(f'\t + {dist}\n')
             except IndexError:
                 break
 
-        print('>>> End Timeline Dump <<<')
-        print('\n\n\n')
-        # print('>>> Automation Events Dump <<<')
+        lines.append('>>> End Timeline Dump <<<\n')
+        lines.append('\n\n\n\n')
+
+        (sys.stdout if fp is None else fp).write(''.join(lines))
+
+    #
+    # time range queries
+    #
+
+    def _time_index(self, name):
+        """
+        (real times, items) of the markers or tempo automation events
+        (name 'markers' or 'tempo'), sorted by real time for bisecting.
+
+        Cached until the list is replaced or the tempo automation events'
+        times are recomputed, both checked in O(1). Lists edited in place
+        must be assigned again to be noticed.
+        """
+        if name == 'markers':
+            items = self.markers
+        else:
+            items = getattr(self, 'tempo_automation_events', None) or []
+            if items:
+                self._ensure_real_times()
+
+        cached = self._time_indexes.get(name)
+        if cached is not None and cached[0] is items and cached[1] == self._real_times_generation:
+            return cached[2], cached[3]
+
+        # tempo automation events are sorted by beat, so by time too.
+        # sorted() is stable, and cheap on sorted input
+        ordered = sorted(items, key=lambda x: x.real_time)
+        keys = [x.real_time for x in ordered]
+        self._time_indexes[name] = (items, self._real_times_generation, keys, ordered)
+        return keys, ordered
+
+    def markers_between(self, start, end):
+        """
+        Markers with start <= time <= end (seconds), sorted by time
+
+        Should be called after .parse()
+        """
+        keys, markers = self._time_index('markers')
+        return markers[bisect_left(keys, start):bisect_right(keys, end)]
+
+    def tempo_events_between(self, start, end):
+        """
+        Tempo automation events with start <= real_time <= end (seconds),
+        sorted by time
+
+        Should be called after .parse()
+        """
+        keys, events = self._time_index('tempo')
+        return events[bisect_left(keys, start):bisect_right(keys, end)]
+
+    def nearest_marker(self, time):
+        """
+        The marker closest to time (seconds), the earlier one on ties. None
+        if there are no markers.
+
+        Should be called after .parse()
+        """
+        keys, markers = self._time_index('markers')
+        i = bisect_left(keys, time)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(keys)]
+        if not candidates:
+            return None
+        return markers[min(candidates, key=lambda j: abs(keys[j] - time))]
+
+    def iter_records(self, tempo=False):
+        """
+        Yield a record dict (see dawtool.records) per marker and, if tempo
+        is set, per tempo automation event, each in timeline order.
+
+        Should be called after .parse()
+        """
+        for m in self.markers:
+            yield {'type': 'marker', 'real_time': m.real_time, 'text': m.text}
 
-        # for i, ev in enumerate(self.tempo_automation_events):
-        #     print(format_time(gettime(ev), precise=True), ev)
-        #     try:
-        #         dist = self.tempo_automation_events[i+1].real_time - ev.real_time
-        #         if dist:
-        #             print('\t +', dist)
-        #     except IndexError:
-        #         break
+        events = getattr(self, 'tempo_automation_events', None)
+        if not tempo or not events:
+            return
 
-        # print('>>> End Automation Events Dump <<<')
+        self._ensure_real_times()
+
+        for ev in events:
+            yield {'type': 'tempo', 'real_time': ev.real_time, 'beat': ev.beat,
+                   'bpm': ev.bpm, 'prev_aligned_bpm': ev.prev_aligned_bpm}
+
+    def _simplify_tempo_automation_events(self):
+        """
+        See simplify_ms. Should be called before any real times are computed.
+        """
+        if not self.tempo_automation_events:
+            return
+        from .simplify import simplify_tempo_events
+        with self._phase('simplify'):
+            kept, self.simplify_error_ms = simplify_tempo_events(self, self.simplify_ms)
+        self._count('tempo_events_dropped', len(self.tempo_automation_events) - len(kept))
+        self.tempo_automation_events = kept
+
+    def _ensure_real_times(self):
+        """
+        Compute the tempo automation events' real times, unless they were
+        already computed for the current list
+        """
+        if self._real_times_of is not self.tempo_automation_events:
+            self._calc_tempo_automation_event_real_times()
 
     def _calc_tempo_automation_event_real_times(self):
         """
         Go through all the automation events and compute the real time each
         is at. Iterate, and simply accumulate the distances to the next point.
+
+        With many events (e.g. recorded automation), all the distances are
+        computed at once with numpy instead. Those times can differ from the
+        iterative ones by float rounding (~1e-14 s).
         """
+        if not self.theoretical and self.on_segment is None and \
+                len(self.tempo_automation_events) >= self.VECTORIZE_MIN_EVENTS:
+            return self._calc_tempo_automation_event_real_times_vectorized()
+
+        self._dense = None
+        integrated = 0
         for i, event in enumerate(self.tempo_automation_events):
             beat = event.beat
 
@@ -155,8 +575,43 @@ class Project:
             time_elapsed = self._time_between_events(prev_event, event)
             # print('time elapsed', time_elapsed)
             self.tempo_automation_events[i].real_time = prev_event.real_time + time_elapsed
+            integrated += 1
             # logging.debug(self.tempo_automation_events[i])
-        
+
+        self._real_times_of = self.tempo_automation_events
+        self._real_times_generation += 1
+        self._count('segments_integrated', integrated)
+
+    def _calc_tempo_automation_event_real_times_vectorized(self):
+        """
+        Like _calc_tempo_automation_event_real_times, but with the
+        prev_aligned_bpm chain resolved up front so that all segments can be
+        computed at once, see timeline.daw_segment_durations.
+        """
+        import numpy as np
+        from math import isnan
+        from .timeline import daw_segment_durations
+
+        self._dense = None
+        events = self.tempo_automation_events
+        prev0 = events[0].prev_aligned_bpm
+        durations, prev = daw_segment_durations(
+                [ev.beat for ev in events], [ev.bpm for ev in events],
+                4 / self.TEMPO_QUANT, np.nan if prev0 is None else prev0)
+        real_times = np.concatenate([[0.], np.cumsum(durations)])
+
+        integrated = 0
+        for event, real_time, prev_aligned_bpm in zip(events, real_times.tolist(), prev.tolist()):
+            event.real_time = real_time
+            if event.beat <= 0:
+                continue
+            event.prev_aligned_bpm = None if isnan(prev_aligned_bpm) else prev_aligned_bpm
+            integrated += 1
+
+        self._real_times_of = self.tempo_automation_events
+        self._real_times_generation += 1
+        self._count('segments_integrated', integrated)
+
     def _calc_beat_real_time(self, beat):
         # TODO: handle if beat was somehow negative?
 
@@ -170,7 +625,18 @@ class Project:
         # past the last marker. this might optimize things if there are lots
         # of events, but the markers are all close to the start
         if self.tempo_automation_events[0].real_time is None:
+            self._count('real_time_cache_misses')
             self._calc_tempo_automation_event_real_times()
+        else:
+            self._count('real_time_cache_hits')
+
+        dense = self._dense_timeline()
+        if dense is not None:
+            first, table = dense
+            step = beat * self.TEMPO_QUANT / 4 - first
+            k = int(step)
+            if 0 <= step and k + 1 < len(table):
+                return float(table[k] + (table[k+1] - table[k]) * (step - k))
 
         # Binary search the cache. This won't make a difference if there's a
         # small amount of automation events, but it will if there's a lot of
@@ -237,6 +703,45 @@ class Project:
 
         # raise ValueError('No automation events smaller than requested time')
 
+    def _dense_timeline(self, queries=0):
+        """
+        In DAW mode the tempo only changes every 4 / TEMPO_QUANT beats (a grid
+        step), so the real time is linear within each step. If it fits in
+        dense_budget, compute the real time of every grid step up to the last
+        automation event once. The real time of any beat in that range is
+        then an index and a partial step, without searching the automation
+        events.
+
+        Building the table costs about as much as resolving one beat per grid
+        step, so it's only built for a batch of at least that many queries
+        (see beat_real_times), and then kept for later lookups. Otherwise
+        this returns the table only if it was built before.
+
+        The table starts at the first event at or after beat 0. Before it
+        (Ableton's segment from its event at a negative beat), beats go
+        through the events as usual.
+
+        Should be called after the automation events' real times are
+        computed.
+
+        return: (first step, numpy array of the real times of the grid steps
+        from it), or None if the table isn't used
+        """
+        if self._dense is None and queries and not self.theoretical and self.on_segment is None:
+            events = self.tempo_automation_events
+            steps = (events[-1].beat - max(events[0].beat, 0.)) * self.TEMPO_QUANT / 4
+            if queries >= steps:
+                from .timeline import dense_grid
+
+                self._dense = dense_grid(
+                        [ev.beat for ev in events], [ev.bpm for ev in events],
+                        [ev.real_time for ev in events], 4 / self.TEMPO_QUANT,
+                        self.dense_budget) or False
+                if self._dense:
+                    self._count('dense_steps', len(self._dense[1]))
+
+        return self._dense or None
+
     def _calc_beat_real_time_from_events(self, beat, first, second):
         bpm = self._calc_bpm_at_beat(beat, first, second)
         fake_event = GenericTempoAutomationEvent(beat, None, bpm)
@@ -291,6 +796,9 @@ class Project:
 
         real_time_elapsed = theoretical_time_elapsed
 
+        if self.on_segment is not None:
+            self.on_segment(first, second, self.SEGMENT_THEORETICAL, real_time_elapsed)
+
         return real_time_elapsed
 
     #
@@ -335,14 +843,20 @@ class Project:
         horizontal = first.bpm == second.bpm
 
         if vertical:
+            kind = self.SEGMENT_VERTICAL
             ret = self._time_between_events_daw_vertical(first, second)
         elif horizontal:
+            kind = self.SEGMENT_HORIZONTAL
             ret = self._time_between_events_daw_horizontal(first, second, self.TEMPO_QUANT)
         else:
-            # slope
+            kind = self.SEGMENT_SLOPE
             ret = self._time_between_events_daw_slope(first, second, self.TEMPO_QUANT)
 
         assert second.prev_aligned_bpm is not None, 'prev_aligned_bpm must be forwarded'
+
+        if self.on_segment is not None:
+            self.on_segment(first, second, kind, ret)
+
         return ret
 
     def _time_between_events_daw_horizontal(self, first, second, quant):
@@ -520,13 +1034,3 @@ class Project:
         end = start + align
         return start, end
 
-
-def _register_project_subclasses():
-    """
-    Triggers __init_subclass__ and fills ProjectsMap
-    """
-    from .daw.ableton import AbletonProject
-    from .daw.flstudio import FlStudioProject
-    from .daw.cue import CueFile
-
-_register_project_subclasses()
@@ -0,0 +1,50 @@
+"""
+Machine readable output of project data, as NDJSON or CSV records.
+
+A record is a dict with (a subset of) the RECORD_FIELDS keys, see
+Project.iter_records. Missing fields are null in NDJSON and empty in CSV.
+"""
+
+RECORD_FIELDS = ('file', 'type', 'real_time', 'text', 'beat', 'bpm', 'prev_aligned_bpm')
+
+
+def write_ndjson(fp, records, header=True):
+    """
+    Write one JSON object per line to the text file object fp.
+    header is accepted for symmetry with write_csv, NDJSON has none.
+    """
+    from json import dumps
+
+    # build the whole chunk and write it once, instead of one write per line
+    fp.write(''.join(dumps({k: r.get(k) for k in RECORD_FIELDS}) + '\n' for r in records))
+
+
+def write_csv(fp, records, header=True):
+    """
+    Write the records as CSV rows with the RECORD_FIELDS columns to the text
+    file object fp, which should be opened with newline=''.
+    """
+    import csv
+
+    w = csv.DictWriter(fp, RECORD_FIELDS, lineterminator='\n')
+    if header:
+        w.writeheader()
+    w.writerows(records)
+
+
+FORMATS = {
+    'ndjson': write_ndjson,
+    'csv': write_csv,
+}
+
+def write_records(fp, records, fmt, header=True):
+    """
+    Write records to fp in the output format fmt, one of FORMATS.
+
+    raises ValueError for an unknown format
+    """
+    try:
+        writer = FORMATS[fmt]
+    except KeyError:
+        raise ValueError('Unknown record format', fmt)
+    writer(fp, records, header)
@@ -0,0 +1,170 @@
+"""
+Long running local parse server, so that clients don't pay for interpreter
+startup and imports on every project.
+
+The server speaks HTTP on localhost:
+
+    GET  /ping
+    POST /parse   JSON body {"path": ..., "theoretical": false, "tempo": false}
+    POST /parse?filename=mix.als&theoretical=1&tempo=1   raw project bytes
+
+/parse responds with {"records": [...]}, see dawtool.records, or with
+{"error": ...}: a 400 if the request is malformed or the project can't be
+read or parsed, a 500 for anything else. Requests are handled concurrently
+in threads.
+"""
+
+from .project import load_project, ProjectModules, UnknownExtension
+
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from urllib.parse import urlsplit, parse_qs
+import io
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+# Parsed results for files by path, invalidated by size/mtime
+PATH_CACHE_SIZE = 256
+
+
+def warm():
+    """
+    Import everything parsing might need up front, so the first request
+    isn't slow.
+    """
+    for module in ProjectModules.values():
+        import_module(module, __package__)
+    # used for theoretical times
+    import scipy.integrate
+
+
+def parse_records(filename, stream, theoretical=False, tempo=False):
+    """
+    Parse a project and return its records as a list.
+
+    raises ValueError, UnknownExtension
+    """
+    proj = load_project(filename, stream, theoretical=theoretical)
+    proj.parse()
+    return list(proj.iter_records(tempo=tempo))
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def _parse_path_records(path, mtime_ns, size, theoretical, tempo):
+    # mtime_ns and size are only part of the cache key
+    with open(path, 'rb') as f:
+        return parse_records(path, f, theoretical, tempo)
+
+
+def parse_path_records(path, theoretical=False, tempo=False):
+    """
+    Like parse_records for a file on disk, but cached until the file
+    changes.
+
+    raises FileNotFoundError, ValueError, UnknownExtension
+    """
+    st = os.stat(path)
+    return _parse_path_records(path, st.st_mtime_ns, st.st_size, bool(theoretical), bool(tempo))
+
+
+def _flag(query, name):
+    return query.get(name, ['0'])[0].lower() in ('1', 'true', 'yes')
+
+
+class ParseRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'dawtool'
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/ping':
+            return self._send(404, {'error': 'Not found'})
+        self._send(200, {'ok': True})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/parse':
+            return self._send(404, {'error': 'Not found'})
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+
+        try:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                req = json.loads(body)
+                records = parse_path_records(req['path'], req.get('theoretical', False),
+                                             req.get('tempo', False))
+            else:
+                query = parse_qs(url.query)
+                filename = query.get('filename', [''])[0]
+                records = parse_records(filename, io.BytesIO(body),
+                                        _flag(query, 'theoretical'), _flag(query, 'tempo'))
+        except FileNotFoundError as e:
+            return self._send(400, {'error': f'{e.filename} not found'})
+        except UnknownExtension as e:
+            return self._send(400, {'error': f'unknown ext {e.args[0]}'})
+        except (KeyError, TypeError, ValueError, EOFError, OSError) as e:
+            # includes malformed requests, unreadable (e.g. directories,
+            # permissions) and unparseable (e.g. truncated) projects
+            logger.debug('Could not parse', exc_info=True)
+            return self._send(400, {'error': str(e) or type(e).__name__})
+        except Exception as e:
+            # like the CLI, a bad file must not take the request down with it
+            logger.exception('Could not parse')
+            return self._send(500, {'error': f'{type(e).__name__}: {e}'})
+
+        self._send(200, {'records': records})
+
+    def _send(self, code, obj):
+        data = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def make_server(host='127.0.0.1', port=DEFAULT_PORT):
+    """
+    Create (but don't start) a server. port 0 picks a free port, see
+    server.server_address.
+    """
+    warm()
+    server = ThreadingHTTPServer((host, port), ParseRequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+#
+# Client
+#
+
+def request_records(url, path, theoretical=False, tempo=False, timeout=60):
+    """
+    Ask the server at url (e.g. http://127.0.0.1:8765) to parse the file at
+    path. The server must be able to read path.
+
+    return: list of records
+    raises ValueError if the server could not read or parse the project
+    raises OSError if the server can't be reached
+    """
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+
+    body = json.dumps({'path': os.path.abspath(path), 'theoretical': theoretical,
+                       'tempo': tempo}).encode()
+    req = Request(url.rstrip('/') + '/parse', body, {'Content-Type': 'application/json'})
+    try:
+        with urlopen(req, timeout=timeout) as resp:
+            return json.load(resp)['records']
+    except HTTPError as e:
+        if e.code not in (400, 500):
+            raise
+        raise ValueError(json.load(e)['error']) from None
@@ -0,0 +1,145 @@
+"""
+Binary tempo map sidecar files.
+
+A sidecar stores a project's CompiledTimeline (see Project.compile), so that
+later jobs can query times and markers without reparsing the project. The
+arrays are read straight out of a memory map, so opening a sidecar is cheap
+regardless of its size, and the pages are shared between processes reading
+the same file.
+
+Only the tempo automation events and markers are stored, not the dense grid
+table (which can be far larger than the project, see timeline.dense_grid);
+read_sidecar(path, dense=True) rebuilds the table from the events.
+
+Layout (version 2, little endian), every section 8 byte aligned:
+
+    header          HEADER, see below
+    event_beats             f8[n_events]
+    event_bpms              f8[n_events]
+    event_real_times        f8[n_events]
+    event_prev_aligned_bpms f8[n_events]   nan where there is none
+    marker_times            f8[n_markers]
+    time signatures         f8[n_time_sigs, 3]   beat, numerator, denominator
+    marker text offsets     u8[n_markers + 1]    into the text blob
+    marker text blob        utf-8
+
+The header is: magic, version (u2), flags (u2, none defined yet), reserved
+(u4), align (f8, nan in theoretical mode), n_events, n_markers, n_time_sigs,
+text blob size (u8).
+"""
+
+import mmap
+import os
+import struct
+
+MAGIC = b'DAWTMAP\0'
+VERSION = 2
+HEADER = struct.Struct('<8sHHIdQQQQ')
+
+SIDECAR_EXT = '.tempomap'
+
+
+def write_sidecar(timeline, path):
+    """
+    Write a CompiledTimeline to path. timeline may also be a parsed Project,
+    which is compiled first. Its dense table, if any, isn't stored.
+
+    The file is written next to path and then moved into place, so readers
+    never see a partial file.
+    """
+    import numpy as np
+    from .compiled import CompiledTimeline
+
+    if not isinstance(timeline, CompiledTimeline):
+        timeline = timeline.compile()
+
+    texts = [t.encode('utf-8') for t in timeline.marker_texts]
+    offsets = np.concatenate([[0], np.cumsum([len(t) for t in texts], dtype=np.int64)])
+    sigs = np.array([tuple(ts) for ts in timeline.time_signatures], dtype=float).reshape(-1, 3)
+
+    header = HEADER.pack(MAGIC, VERSION, 0, 0,
+                         np.nan if timeline.align is None else timeline.align,
+                         len(timeline.event_beats), len(timeline.marker_times), len(sigs),
+                         int(offsets[-1]))
+    sections = [timeline.event_beats, timeline.event_bpms, timeline.event_real_times,
+                timeline.event_prev_aligned_bpms, timeline.marker_times, sigs]
+
+    tmp = f'{path}.tmp{os.getpid()}'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            for a in sections:
+                f.write(np.ascontiguousarray(a, dtype='<f8').tobytes())
+            f.write(offsets.astype('<u8').tobytes())
+            f.write(b''.join(texts))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_sidecar(path, dense=False, dense_budget=None):
+    """
+    Open a sidecar written by write_sidecar. The arrays of the returned
+    CompiledTimeline are read-only views of a memory map of the file.
+
+    dense: also rebuild the dense grid table (in memory, DAW mode only), for
+    timelines that will be queried a lot. dense_budget is as for Project,
+    None uses Project.DENSE_BUDGET.
+
+    raises ValueError if path isn't a sidecar, is truncated, or is from
+    another version of dawtool
+    raises FileNotFoundError
+
+    return: CompiledTimeline
+    """
+    import numpy as np
+    from .compiled import CompiledTimeline
+    from .project import Project, TimeSignature
+    from . import timeline
+
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            raise ValueError('Not a dawtool sidecar', path) from None
+
+    if len(mm) < HEADER.size:
+        raise ValueError('Not a dawtool sidecar', path)
+    (magic, version, flags, _, align, n_events, n_markers, n_sigs,
+            text_size) = HEADER.unpack_from(mm)
+    if magic != MAGIC:
+        raise ValueError('Not a dawtool sidecar', path)
+    if version != VERSION:
+        raise ValueError('Unsupported sidecar version', version)
+
+    n_floats = 4 * n_events + n_markers + 3 * n_sigs
+    if len(mm) != HEADER.size + 8 * (n_floats + n_markers + 1) + text_size:
+        raise ValueError('Truncated or corrupt sidecar', path)
+
+    offset = HEADER.size
+    def take(count, dtype='<f8'):
+        nonlocal offset
+        a = np.frombuffer(mm, dtype=dtype, count=count, offset=offset)
+        offset += 8 * count
+        return a
+
+    beats, bpms, real_times, prev = (take(n_events) for _ in range(4))
+    marker_times = take(n_markers)
+    sigs = take(3 * n_sigs).reshape(-1, 3)
+    offsets = take(n_markers + 1, '<u8').tolist()
+    blob = mm[offset:offset + text_size]
+
+    texts = [blob[a:b].decode('utf-8') for a, b in zip(offsets, offsets[1:])]
+    time_signatures = [TimeSignature(beat, int(num), int(denom)) for beat, num, denom in sigs.tolist()]
+
+    align = None if np.isnan(align) else align
+    table = None
+    if dense and align is not None and n_events:
+        budget = Project.DENSE_BUDGET if dense_budget is None else dense_budget
+        table = timeline.dense_grid(beats, bpms, real_times, align, budget)
+
+    return CompiledTimeline(beats, bpms, real_times, prev, align,
+                            marker_times, texts, time_signatures, table)
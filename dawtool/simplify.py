@@ -0,0 +1,164 @@
+"""
+Error bounded simplification of tempo automation.
+
+Recorded tempo automation can have thousands of points that are
+(almost) on a line. Dropping the ones that barely change the tempo map
+makes every later time calculation cheaper.
+
+Points are dropped Ramer-Douglas-Peucker style on the (beat, bpm)
+polyline: a point is kept if it is more than eps bpm away from the line
+between the kept points around it. Runs are split at vertical lines (tempo
+jumps), whose points are always kept. The largest eps for which the real
+times of the original automation events under the simplified map are
+within the requested error of the original ones is searched for by
+bisection (on a log scale), with a fixed number of steps, so the pass
+costs a bounded number of vectorized time calculations.
+"""
+
+from . import timeline
+
+import numpy as np
+
+# below this eps (bpm), give up and keep every point
+MIN_EPS = 1e-9
+
+# bisection steps of the eps search
+SEARCH_STEPS = 8
+
+# runs still being split after this many levels keep all their points. on
+# smooth lanes the splits are balanced and this is never reached, on noise
+# (which doesn't simplify anyway) RDP peels off one point per level
+MAX_DEPTH = 64
+
+
+def rdp_keep(beats, bpms, eps):
+    """
+    Return a boolean mask of the points of the (beats, bpms) polyline to
+    keep, so that no dropped point is more than eps bpm from the line
+    between the kept points around it.
+
+    Costs O(MAX_DEPTH * n).
+    """
+    beats = np.asarray(beats, dtype=float)
+    bpms = np.asarray(bpms, dtype=float)
+    n = len(beats)
+    keep = np.zeros(n, dtype=bool)
+    if not n:
+        return keep
+
+    # both points of vertical lines, and the ends, split the runs
+    vertical = np.flatnonzero(beats[1:] == beats[:-1])
+    keep[vertical] = True
+    keep[vertical + 1] = True
+    keep[0] = keep[-1] = True
+
+    # split every run with points inside at once, one recursion level at a
+    # time, instead of one run at a time
+    bounds = np.flatnonzero(keep)
+    starts, ends = bounds[:-1], bounds[1:]
+    for _ in range(MAX_DEPTH):
+        inner = ends - starts > 1
+        starts, ends = starts[inner], ends[inner]
+        if not len(starts):
+            return keep
+
+        # the points inside each run, run after run
+        counts = ends - starts - 1
+        offsets = np.cumsum(counts) - counts
+        owner = np.repeat(np.arange(len(starts)), counts)
+        idx = starts[owner] + 1 + np.arange(counts.sum()) - offsets[owner]
+        i, j = starts[owner], ends[owner]
+
+        chord = bpms[i] + (bpms[j] - bpms[i]) * (beats[idx] - beats[i]) / (beats[j] - beats[i])
+        dist = np.abs(bpms[idx] - chord)
+        best = np.maximum.reduceat(dist, offsets)
+        # the first point at each run's largest distance
+        at_max = np.flatnonzero(dist == best[owner])
+        first = at_max[np.concatenate([[True], owner[at_max][1:] != owner[at_max][:-1]])]
+
+        split = best > eps
+        k = idx[first[split]]
+        keep[k] = True
+        starts, ends = np.concatenate([starts[split], k]), np.concatenate([k, ends[split]])
+
+    # the runs are disjoint, mark what's between their starts and ends
+    inside = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(inside, starts, 1)
+    np.add.at(inside, ends, -1)
+    keep |= np.cumsum(inside[:-1]) > 0
+    return keep
+
+
+def _real_times(beats, bpms, x, align):
+    """
+    Real times of the beats x under the automation events (beats, bpms),
+    with the vectorized engine (see dawtool.timeline). align is None in
+    theoretical mode.
+    """
+    if align is None:
+        durations = timeline.theoretical_segment_durations(beats, bpms)
+    else:
+        durations, _ = timeline.daw_segment_durations(beats, bpms, align)
+    real_times = np.concatenate([[0.], np.cumsum(durations)])
+    if align is None:
+        return timeline.theoretical_real_times(beats, bpms, real_times, x)
+    return timeline.daw_real_times(beats, bpms, real_times, x, align)
+
+
+def simplify_tempo_events(proj, max_error_ms):
+    """
+    Simplify proj's tempo automation events so that the real time of every
+    original event moves by at most max_error_ms.
+
+    The events themselves aren't modified. Call before their real times are
+    computed.
+
+    return: (kept events, achieved max error in ms)
+    """
+    events = proj.tempo_automation_events
+    if len(events) < 3:
+        return list(events), 0.
+
+    beats = np.array([ev.beat for ev in events])
+    bpms = np.array([ev.bpm for ev in events])
+    x = np.maximum(beats, 0.)
+    align = None if proj.theoretical else 4 / proj.TEMPO_QUANT
+
+    exact = None
+    def error_ms(keep):
+        # the exact times are computed once, and only if needed
+        nonlocal exact
+        if exact is None:
+            exact = _real_times(beats, bpms, x, align)
+        times = _real_times(beats[keep], bpms[keep], x, align)
+        return float(np.abs(times - exact).max()) * 1000
+
+    # at the largest eps only the points that must stay are kept. if that's
+    # all of them (e.g. stepped automation), there's nothing to gain
+    hi = max(float(bpms.max() - bpms.min()), MIN_EPS)
+    keep = rdp_keep(beats, bpms, hi)
+    if keep.all():
+        return list(events), 0.
+    error = error_ms(keep)
+    if error <= max_error_ms:
+        return [ev for ev, k in zip(events, keep) if k], error
+
+    # hi is too coarse, and MIN_EPS keeps every point (error 0)
+    best, best_error = None, 0.
+    lo_exp, hi_exp = np.log2(MIN_EPS), np.log2(hi)
+    for _ in range(SEARCH_STEPS):
+        mid_exp = (lo_exp + hi_exp) / 2
+        keep = rdp_keep(beats, bpms, 2 ** mid_exp)
+        if keep.all():
+            lo_exp = mid_exp
+            continue
+        error = error_ms(keep)
+        if error <= max_error_ms:
+            best, best_error = keep, error
+            lo_exp = mid_exp
+        else:
+            hi_exp = mid_exp
+
+    if best is None:
+        return list(events), 0.
+    return [ev for ev, k in zip(events, best) if k], best_error
@@ -0,0 +1,212 @@
+"""
+Standard MIDI File (SMF) export of the tempo map.
+
+The tempo automation is written as a type 1 SMF with a single tempo track,
+so other tools can follow the project's tempo without reimplementing the DAW
+time calculations:
+
+- In DAW mode the tempo only changes every 4 / TEMPO_QUANT beats (a grid
+  step), so there is one set_tempo event per step whose tempo differs from
+  the previous step. Theoretical mode has no grid, the tempo is rendered
+  every theoretical_step beats (THEORETICAL_STEP by default) with each
+  step's average tempo.
+- Time signature changes become time_signature events.
+- Markers become marker events, at the beat of their real time.
+
+set_tempo holds whole microseconds per quarter note. So that the rounding
+doesn't add up over long projects, a step's tempo is nudged by a few
+microseconds when the time at the end of the step would otherwise drift
+more than MAX_DRIFT_US from the project's.
+
+The encoder (encode_smf) only uses the standard library.
+"""
+
+from math import floor
+import struct
+
+# divisible by the steps per beat of every TEMPO_QUANT (4 for Ableton, 128
+# for FL Studio), so grid steps land exactly on ticks
+PPQ = 3840
+
+SMF_EXT = '.mid'
+
+MAX_DRIFT_US = 50
+
+# default resolution (beats) of the tempo in theoretical mode, Ableton's grid
+THEORETICAL_STEP = 4 / 16
+
+
+def _varlen(n):
+    """
+    MIDI variable length quantity
+    """
+    out = bytearray([n & 0x7f])
+    n >>= 7
+    while n:
+        out.append(0x80 | (n & 0x7f))
+        n >>= 7
+    return bytes(reversed(out))
+
+
+def _meta(kind, data):
+    return b'\xff' + bytes([kind]) + _varlen(len(data)) + data
+
+
+def set_tempo(usec_per_quarter):
+    if not 0 < usec_per_quarter < 1 << 24:
+        raise ValueError('Tempo out of range for set_tempo', usec_per_quarter)
+    return _meta(0x51, usec_per_quarter.to_bytes(3, 'big'))
+
+
+def time_signature(numerator, denominator):
+    log2 = denominator.bit_length() - 1
+    if denominator != 1 << log2:
+        raise ValueError('Time signature denominator is not a power of 2', denominator)
+    # 24 MIDI clocks per metronome click, 8 32nd notes per quarter
+    return _meta(0x58, bytes([numerator, log2, 24, 8]))
+
+
+def marker(text):
+    return _meta(0x06, text.encode('utf-8'))
+
+
+def encode_track(events):
+    """
+    Encode a track chunk from (tick, event bytes) pairs. Events on the same
+    tick keep their order.
+    """
+    body = bytearray()
+    prev = 0
+    for tick, data in sorted(events, key=lambda x: x[0]):
+        body += _varlen(tick - prev)
+        body += data
+        prev = tick
+    body += b'\x00' + _meta(0x2f, b'')
+    return b'MTrk' + struct.pack('>I', len(body)) + bytes(body)
+
+
+def encode_smf(tracks, ppq=PPQ):
+    """
+    Encode a type 1 SMF from lists of (tick, event bytes) pairs, one per
+    track.
+    """
+    header = b'MThd' + struct.pack('>IHHH', 6, 1, len(tracks), ppq)
+    return header + b''.join(encode_track(t) for t in tracks)
+
+
+def _steps_within(err, slope, limit):
+    """
+    How many of the next limit steps keep the drift err + m * slope within
+    MAX_DRIFT_US, for m = 1, 2, ...
+    """
+    if slope > 0:
+        n = floor((MAX_DRIFT_US - err) / slope)
+    elif slope < 0:
+        n = floor((MAX_DRIFT_US + err) / -slope)
+    else:
+        n = limit if abs(err) <= MAX_DRIFT_US else 0
+    return max(0, min(n, limit))
+
+
+def _tempo_changes(times, align):
+    """
+    Whole microseconds per quarter note for the steps of align beats, given
+    the real times (us, numpy array) of the step boundaries, as a list of
+    (first step, usec) for each step whose tempo differs from the previous
+    one's. Keeps the previous step's tempo where possible, so that only
+    real changes produce events.
+
+    Runs of steps with the same tempo are found with numpy, and the drift
+    within a run grows linearly, so this costs O(runs + changes), not
+    O(steps).
+    """
+    import numpy as np
+
+    exact = np.diff(times) / align
+    # float noise (a few ulps of the times, per step) isn't a tempo change
+    noise = 8 * np.finfo(float).eps * max(abs(times[-1]), 1.) / align
+    bounds = np.concatenate([[0], np.flatnonzero(np.abs(np.diff(exact)) > noise) + 1, [len(exact)]])
+
+    bounds = bounds.tolist()
+    # the runs' average tempos, so that each run's end lands on its time
+    tempos = (np.diff(times[bounds]) / (align * np.diff(bounds))).tolist()
+
+    changes = []
+    prev = None
+    # elapsed - real time at the current step boundary, in us
+    err = 0.
+    for a, b, tempo in zip(bounds, bounds[1:], tempos):
+        k = a
+        while k < b:
+            if prev is not None:
+                slope = align * (prev - tempo)
+                if b - k == 1:
+                    # most steps of a ramp, inlined
+                    n = abs(err + slope) <= MAX_DRIFT_US
+                else:
+                    n = _steps_within(err, slope, b - k)
+                if n:
+                    err += n * slope
+                    k += n
+                    continue
+            # the exact tempo, or the one that lands exactly on the step's
+            # end
+            for usec in (round(tempo), round(tempo - err / align)):
+                if abs(err + align * (usec - tempo)) <= MAX_DRIFT_US:
+                    break
+            if usec != prev:
+                changes.append((k, usec))
+            prev = usec
+            err += align * (usec - tempo)
+            k += 1
+    return changes
+
+
+def tempo_track(timeline, ppq=PPQ, theoretical_step=THEORETICAL_STEP):
+    """
+    Events of the tempo track for a CompiledTimeline, as (tick, event
+    bytes) pairs.
+
+    The tempo is rendered every grid step of the timeline (4 / TEMPO_QUANT
+    beats), or in theoretical mode every theoretical_step beats.
+    """
+    import numpy as np
+
+    if not len(timeline.event_beats):
+        raise ValueError('No tempo information')
+
+    align = timeline.align or theoretical_step
+    step_ticks = round(align * ppq)
+    if step_ticks != align * ppq:
+        raise ValueError('Tempo steps are not a whole number of ticks', ppq)
+
+    marker_beats = timeline.beats_at(timeline.marker_times).tolist()
+    end = max([float(timeline.event_beats[-1]), 0.] + marker_beats)
+    steps = int(end / align) + 1
+
+    # real time at every step boundary, the tempo is constant within a step
+    # in DAW mode
+    times = timeline.real_times(np.arange(steps + 1) * align) * 1e6
+    changes = _tempo_changes(times, align)
+
+    events = []
+    for ts in timeline.time_signatures:
+        events.append((round(ts.beat * ppq), time_signature(ts.numerator, ts.denominator)))
+
+    for k, usec in changes:
+        events.append((k * step_ticks, set_tempo(usec)))
+
+    for beat, text in zip(marker_beats, timeline.marker_texts):
+        events.append((round(beat * ppq), marker(text)))
+
+    return events
+
+
+def emit_smf(timeline, ppq=PPQ, theoretical_step=THEORETICAL_STEP):
+    """
+    Return the tempo map of a CompiledTimeline (or a parsed Project, which
+    is compiled first) as SMF bytes. See tempo_track.
+    """
+    if hasattr(timeline, 'compile'):
+        timeline = timeline.compile()
+    return encode_smf([tempo_track(timeline, ppq, theoretical_step)], ppq)
@@ -0,0 +1,328 @@
+"""
+Editable tempo automation, for editors that move, insert or delete single
+tempo automation points and re-query times.
+
+The real time of an automation event is the sum of the durations of the
+segments (pairs of consecutive events) before it. The durations are kept in
+a SumTree, so after an edit only the segments touching the edited event are
+recomputed (plus any following ones whose prev_aligned_bpm changed, see
+Project._time_between_events_daw), and both edits and real time lookups
+are O(log n) on the tree.
+
+The events and their beats are also kept in plain lists, for bisecting.
+Inserting into or deleting from them is an O(n) memmove, which is cheap in
+practice next to the Python work of an edit.
+
+    tempo = proj.tempo_map()
+    i = tempo.insert(32., 140.)
+    tempo.move(i, beat=36.)
+    tempo.real_time_at(64.)
+"""
+
+from .project import GenericTempoAutomationEvent
+
+from bisect import bisect_right
+from dataclasses import dataclass
+import random
+
+
+class _Node:
+    __slots__ = ('value', 'total', 'size', 'priority', 'left', 'right')
+
+    def __init__(self, value, priority):
+        self.value = self.total = value
+        self.size = 1
+        self.priority = priority
+        self.left = self.right = None
+
+    def update(self):
+        self.total = self.value
+        self.size = 1
+        for child in (self.left, self.right):
+            if child is not None:
+                self.total += child.total
+                self.size += child.size
+
+
+def _size(node):
+    return 0 if node is None else node.size
+
+
+class SumTree:
+    """
+    A list of numbers with O(log n) (expected) insert, delete, update and
+    prefix sums. It's a treap keyed by position, each node holding the size
+    and sum of its subtree.
+    """
+    def __init__(self, values=()):
+        self._random = random.Random(0)
+        self._root = None
+
+        # O(n) build of the treap of values in order (a Cartesian tree on
+        # the priorities). stack is the rightmost path of the tree so far,
+        # nodes are finished as they leave it
+        stack = []
+        for value in values:
+            node = _Node(value, self._random.random())
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+                last.update()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        while stack:
+            last = stack.pop()
+            last.update()
+        self._root = last if values else None
+
+    def __len__(self):
+        return _size(self._root)
+
+    def _split(self, node, k):
+        """
+        Split the subtree at node into its first k values and the rest
+        """
+        if node is None:
+            return None, None
+        if _size(node.left) >= k:
+            left, node.left = self._split(node.left, k)
+            node.update()
+            return left, node
+        node.right, right = self._split(node.right, k - _size(node.left) - 1)
+        node.update()
+        return node, right
+
+    def _merge(self, a, b):
+        """
+        Concatenate the subtrees a and b
+        """
+        if a is None or b is None:
+            return a if b is None else b
+        if a.priority > b.priority:
+            a.right = self._merge(a.right, b)
+            a.update()
+            return a
+        b.left = self._merge(a, b.left)
+        b.update()
+        return b
+
+    def _path(self, i):
+        """
+        Nodes from the root to the node of index i
+        """
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        node = self._root
+        path = []
+        while True:
+            path.append(node)
+            left = _size(node.left)
+            if i == left:
+                return path
+            if i < left:
+                node = node.left
+            else:
+                i -= left + 1
+                node = node.right
+
+    def __getitem__(self, i):
+        return self._path(i)[-1].value
+
+    def __setitem__(self, i, value):
+        path = self._path(i)
+        delta = value - path[-1].value
+        path[-1].value = value
+        for node in path:
+            node.total += delta
+
+    def insert(self, i, value):
+        """
+        Insert value before index i
+        """
+        left, right = self._split(self._root, i)
+        node = _Node(value, self._random.random())
+        self._root = self._merge(self._merge(left, node), right)
+
+    def __delitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        left, right = self._split(self._root, i)
+        _, right = self._split(right, 1)
+        self._root = self._merge(left, right)
+
+    def prefix_sum(self, i):
+        """
+        Sum of the first i values
+        """
+        total = 0.
+        node = self._root
+        while node is not None and i > 0:
+            left = _size(node.left)
+            if i <= left:
+                node = node.left
+                continue
+            # all of the left subtree, and this node
+            if node.left is not None:
+                total += node.left.total
+            total += node.value
+            i -= left + 1
+            node = node.right
+        return total
+
+
+@dataclass
+class EditableTempoEvent:
+    beat: float
+    bpm: float
+
+    prev_aligned_bpm: float = None # computed
+
+
+class TempoMap:
+    """
+    Editable copy of a parsed project's tempo automation events. Edits don't
+    change the project.
+
+    Event indexes are positions in the beat sorted events, and shift on
+    insert/delete.
+    """
+    def __init__(self, proj):
+        # the project does the actual time calculations, so they match its
+        # DAW and theoretical modes
+        self._proj = proj
+        self.events = [EditableTempoEvent(ev.beat, ev.bpm) for ev in proj.tempo_automation_events]
+        if not self.events:
+            raise ValueError('No tempo automation events')
+        self._beats = [ev.beat for ev in self.events]
+        self._tree = SumTree([self._segment_duration(i) for i in range(len(self.events) - 1)])
+
+    def __len__(self):
+        return len(self.events)
+
+    def _segment_duration(self, i):
+        """
+        Time between events i and i+1. Sets events[i+1].prev_aligned_bpm.
+        """
+        first, second = self.events[i], self.events[i+1]
+        if second.beat <= 0:
+            # Ableton's events before the start of the arrangement, the
+            # project engine gives them all real time 0
+            return 0.
+        return self._proj._time_between_events(first, second)
+
+    def _update_from(self, i):
+        """
+        Recompute the duration of segment i and following segments, as long
+        as the prev_aligned_bpm forwarded into the next segment changed.
+        """
+        last = len(self.events) - 1
+        while 0 <= i < last:
+            old_prev = self.events[i+1].prev_aligned_bpm
+            self._tree[i] = self._segment_duration(i)
+            i += 1
+            if self.events[i].prev_aligned_bpm == old_prev:
+                break
+
+    @staticmethod
+    def _check_first(beat):
+        """
+        The engine starts the timeline at the first event, at real time 0,
+        which is only right at or before beat 0
+        """
+        if beat > 0:
+            raise ValueError('The first tempo automation event must be at or before beat 0', beat)
+
+    #
+    # edits
+    #
+
+    def insert(self, beat, bpm):
+        """
+        Insert an automation event. If there are events on the same beat,
+        it goes after them.
+
+        return: the index of the new event
+        """
+        i = bisect_right(self._beats, beat)
+        self.events.insert(i, EditableTempoEvent(beat, bpm))
+        self._beats.insert(i, beat)
+        # the segment ending at i is recomputed, the one starting at i is new
+        self._tree.insert(min(i, len(self._tree)), 0.)
+        self._update_from(i - 1)
+        self._update_from(i)
+        return i
+
+    def delete(self, i):
+        """
+        Delete the automation event at index i
+
+        raises ValueError if it's the only event, or if the new first event
+        would be after beat 0
+        """
+        if len(self.events) == 1:
+            raise ValueError('Cannot delete the last tempo automation event')
+        i = range(len(self.events))[i]
+        if i == 0:
+            self._check_first(self._beats[1])
+        del self.events[i]
+        del self._beats[i]
+        # the segments before and after i merge
+        del self._tree[min(i, len(self._tree) - 1)]
+        self._update_from(max(i - 1, 0))
+
+    def move(self, i, beat=None, bpm=None):
+        """
+        Change the beat and/or bpm of the event at index i.
+
+        raises ValueError if the first event would be after beat 0
+
+        return: the new index of the event
+        """
+        i = range(len(self.events))[i]
+        ev = self.events[i]
+        beat = ev.beat if beat is None else beat
+        bpm = ev.bpm if bpm is None else bpm
+
+        lo = self._beats[i-1] if i > 0 else float('-inf')
+        hi = self._beats[i+1] if i + 1 < len(self.events) else float('inf')
+        if i == 0:
+            self._check_first(min(beat, hi))
+        if not lo <= beat <= hi:
+            # changes order
+            self.delete(i)
+            return self.insert(beat, bpm)
+
+        ev.beat, ev.bpm = beat, bpm
+        self._beats[i] = beat
+        self._update_from(max(i - 1, 0))
+        self._update_from(i)
+        return i
+
+    #
+    # queries
+    #
+
+    def event_real_time(self, i):
+        """
+        Real time of the event at index i
+        """
+        return self._tree.prefix_sum(i)
+
+    def real_time_at(self, beat):
+        """
+        Real time of beat, like Project._calc_beat_real_time
+        """
+        i = bisect_right(self._beats, beat) - 1
+        if i < 0:
+            raise ValueError('No automation events smaller than requested time')
+
+        first = self.events[i]
+        if first.beat == beat:
+            return self.event_real_time(i)
+        second = self.events[i+1] if i + 1 < len(self.events) else None
+
+        bpm = self._proj._calc_bpm_at_beat(beat, first, second)
+        fake_event = GenericTempoAutomationEvent(beat, None, bpm)
+        return self.event_real_time(i) + self._proj._time_between_events(first, fake_event)
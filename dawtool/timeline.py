@@ -0,0 +1,321 @@
+"""
+Vectorized tempo timeline calculations, for resolving the real time of
+many beats at once.
+
+These implement the same timing model as the per-event engine in
+project.py, but over numpy arrays:
+
+- The tempo automation is piecewise linear between automation events
+  (beats, bpms). At a vertical line (two events on the same beat), the
+  later event's bpm applies from that beat on.
+
+- DAW model: The DAW only updates the tempo every `align` beats (4 /
+  TEMPO_QUANT), so the whole timeline is a sequence of "cells" of align
+  beats each with a constant tempo, the bpm at the start of the cell. The
+  real time of a beat is the real time of the last automation event
+  before it, plus the durations of the cells (or parts of cells) between
+  them.
+
+- Theoretical model: The seconds per beat are integrated exactly between
+  automation events.
+
+numpy is imported by this module, so import it lazily from modules that
+need to stay cheap to import.
+"""
+
+import numpy as np
+
+
+def bpm_at(beats, bpms, x):
+    """
+    Tempo at each beat in x, interpolated between the automation events
+    (beats, bpms), with beats sorted ascending. Before the first event, the
+    first event's bpm applies, after the last event, the last event's.
+    """
+    beats = np.asarray(beats, dtype=float)
+    bpms = np.asarray(bpms, dtype=float)
+    x = np.asarray(x, dtype=float)
+
+    # last event at or before x. 'right' so that at a vertical line, the
+    # later event wins
+    i = np.searchsorted(beats, x, side='right') - 1
+    i = np.clip(i, 0, len(beats) - 1)
+    nxt = np.minimum(i + 1, len(beats) - 1)
+
+    b0, b1 = beats[i], beats[nxt]
+    v0, v1 = bpms[i], bpms[nxt]
+
+    # x is strictly before b1 whenever nxt != i, so no division by zero
+    between = (nxt != i) & (x >= b0)
+    span = np.where(between, b1 - b0, 1.)
+    slope = np.where(between, (v1 - v0) / span, 0.)
+    return v0 + slope * np.where(between, x - b0, 0.)
+
+
+def daw_real_times(beats, bpms, real_times, x, align):
+    """
+    Real time of each beat in x under the DAW model, with tempo updated
+    every align beats, given the real times of the automation events
+    (beats, bpms).
+
+    Each beat is resolved from the last event at or before it. On a
+    horizontal segment that's closed form, only on sloped segments that
+    contain beats of x are the cells summed, in one walk over all of them.
+    """
+    beats = np.asarray(beats, dtype=float)
+    bpms = np.asarray(bpms, dtype=float)
+    real_times = np.asarray(real_times, dtype=float)
+    x = np.asarray(x, dtype=float)
+    last = len(beats) - 1
+
+    i = np.clip(np.searchsorted(beats, x, side='right') - 1, 0, last)
+    start = np.maximum(beats[i], 0.)
+
+    # the cell the segment starts in may have started in an earlier
+    # segment, and keeps that segment's tempo until the next cell
+    front_cell = np.floor(start / align) * align
+    front_end = np.where(front_cell == start, start, front_cell + align)
+    front_spb = 60. / bpm_at(beats, bpms, front_cell)
+    elapsed = (np.minimum(x, front_end) - start) * front_spb
+
+    # the rest of the segment, from front_end to x
+    rest = x > front_end
+    nxt = np.minimum(i + 1, last)
+    sloped = rest & (i < last) & (bpms[i] != bpms[nxt])
+    flat = rest & ~sloped
+    elapsed[flat] += (x[flat] - front_end[flat]) * 60. / bpms[i[flat]]
+
+    q = np.flatnonzero(sloped)
+    if q.size:
+        # group the beats by segment. every segment needs the real time at
+        # the start of each of its cells, from front_end up to the last
+        # cell holding one of its beats. those cells are laid out one
+        # segment after the other, and summed in a single pass
+        segs, group = np.unique(i[q], return_inverse=True)
+        first = np.zeros(len(segs), dtype=np.int64)
+        first[group] = np.rint(front_end[q] / align).astype(np.int64)
+        cell = np.floor(x[q] / align).astype(np.int64)
+        last = first.copy()
+        np.maximum.at(last, group, cell)
+
+        counts = last - first + 1
+        offsets = np.cumsum(counts) - counts
+        owner = np.repeat(np.arange(len(segs)), counts)
+        k = np.arange(counts.sum()) - offsets[owner]
+        cell_starts = (first[owner] + k) * align
+        cell_spb = 60. / bpm_at(beats, bpms, cell_starts)
+
+        # real time at the start of each cell relative to its segment's
+        # front_end, an exclusive running sum restarted at every segment
+        cell_elapsed = np.empty(len(cell_starts))
+        cell_elapsed[0] = 0.
+        np.cumsum(cell_spb[:-1] * align, out=cell_elapsed[1:])
+        cell_elapsed -= cell_elapsed[offsets][owner]
+
+        idx = offsets[group] + cell - first[group]
+        elapsed[q] += cell_elapsed[idx] + (x[q] - cell_starts[idx]) * cell_spb[idx]
+
+    return real_times[i] + elapsed
+
+
+def theoretical_real_times(beats, bpms, real_times, x):
+    """
+    Real time of each beat in x under the theoretical model, given the real
+    times of the automation events (beats, bpms). Events at negative beats
+    are treated as starting at beat 0.
+    """
+    beats = np.asarray(beats, dtype=float)
+    bpms = np.asarray(bpms, dtype=float)
+    real_times = np.asarray(real_times, dtype=float)
+    x = np.asarray(x, dtype=float)
+
+    i = np.clip(np.searchsorted(beats, x, side='right') - 1, 0, len(beats) - 1)
+    start = np.maximum(beats[i], 0.)
+    v0 = bpms[i]
+    v1 = bpm_at(beats, bpms, x)
+    domain = x - start
+
+    # integral of 60 / (linear bpm from v0 to v1) over domain beats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sloped = domain * 60. * np.log(v1 / v0) / (v1 - v0)
+    elapsed = np.where(v0 == v1, domain * 60. / v0, sloped)
+    return real_times[i] + np.where(domain == 0, 0., elapsed)
+
+
+def dense_grid(beats, bpms, real_times, align, budget):
+    """
+    Real times of every grid step (align beats) under the DAW model, from
+    the first automation event at or after beat 0 up to one past the step
+    containing the last event. Within a step the tempo is constant, so the
+    real time of any beat in that range is an index and a partial step, see
+    dense_real_times.
+
+    return: (index of the first step, numpy array of real times), or None
+    if the table would take more than budget bytes
+    """
+    beats = np.asarray(beats, dtype=float)
+    nonneg = beats[beats >= 0]
+    if not nonneg.size:
+        return None
+    first = int(np.ceil(nonneg[0] / align))
+    steps = int(beats[-1] / align) + 2 - first
+    if not 0 < steps * 8 <= budget:
+        return None
+    return first, daw_real_times(beats, bpms, real_times, (first + np.arange(steps)) * align, align)
+
+
+def dense_real_times(dense, x, align):
+    """
+    Real time of each beat in x from a dense_grid table, or None if any of
+    them are outside of it.
+    """
+    first, table = dense
+    steps = np.asarray(x, dtype=float) / align - first
+    if steps.size and (steps.min() < 0 or steps.max() >= len(table) - 1):
+        return None
+    k = steps.astype(np.int64)
+    return table[k] + (table[k+1] - table[k]) * (steps - k)
+
+
+def theoretical_segment_durations(beats, bpms):
+    """
+    Durations of all the segments between consecutive automation events
+    (beats, bpms) under the theoretical model, like
+    Project._time_between_events_theoretical over every segment. Segments
+    ending at beat <= 0 have duration 0.
+    """
+    b = np.asarray(beats, dtype=float)
+    v = np.asarray(bpms, dtype=float)
+    v1, v2 = v[:-1], v[1:]
+    domain = np.where(b[1:] > 0, b[1:] - np.maximum(b[:-1], 0.), 0.)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sloped = domain * 60. * np.log(v2 / v1) / (v2 - v1)
+    elapsed = np.where(v1 == v2, domain * 60. / v1, sloped)
+    return np.where(domain == 0, 0., elapsed)
+
+
+def bar_starts(time_signatures, start_beat, end_beat):
+    """
+    Beats at which bars start in [start_beat, end_beat), given the
+    time_signatures (sorted TimeSignature's, the first at beat 0). Each time
+    signature change starts a new bar.
+    """
+    out = []
+    for ts, nxt in zip(time_signatures, list(time_signatures[1:]) + [None]):
+        region_end = end_beat if nxt is None else min(nxt.beat, end_beat)
+        if region_end <= start_beat:
+            continue
+        bar_len = ts.beats_per_bar
+        # first bar of the region at or after start_beat
+        n = max(0., np.ceil((start_beat - ts.beat) / bar_len))
+        out.append(ts.beat + np.arange(n, np.ceil((region_end - ts.beat) / bar_len)) * bar_len)
+        if nxt is None or nxt.beat >= end_beat:
+            break
+    if not out:
+        return np.empty(0)
+    return np.concatenate(out)
+
+
+def daw_segment_durations(beats, bpms, align, prev_aligned_bpm0=np.nan):
+    """
+    Durations of all the segments between consecutive automation events
+    (beats, bpms) under the DAW model, computed independently of each other.
+
+    This is a vectorized Project._time_between_events_daw over every
+    segment. The serial dependency there, each segment forwarding the
+    prev_aligned_bpm to the next, is resolved in a pre-pass first: each
+    event's prev_aligned_bpm is either determined by its own segment, or
+    carried over from the previous event (vertical lines and segments
+    within one alignment window), which is a forward fill.
+
+    Segments ending at beat <= 0 are skipped like in
+    Project._calc_tempo_automation_event_real_times, they have duration 0
+    and their end event's prev_aligned_bpm is left as nan.
+
+    return: (durations, prev_aligned_bpm), with one duration per segment
+    and one prev_aligned_bpm per event (nan where there is none)
+    """
+    b = np.asarray(beats, dtype=float)
+    v = np.asarray(bpms, dtype=float)
+    n = len(b)
+    if n < 2:
+        return np.empty(0), np.full(n, prev_aligned_bpm0)
+
+    b1, b2, v1, v2 = b[:-1], b[1:], v[:-1], v[1:]
+    active = b2 > 0
+    s = np.maximum(b1, 0.)
+    e = b2
+    s_aligned = s % align == 0
+    e_aligned = e % align == 0
+    window_end = s - s % align + align
+    e_floor = e - e % align
+
+    vertical = b1 == b2
+    horizontal = ~vertical & (v1 == v2)
+    sloped = ~vertical & ~horizontal
+    both_aligned = s_aligned & e_aligned
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(sloped, (v2 - v1) / (b2 - b1), 0.)
+
+    def line(x):
+        # Project._calc_bpm_at_beat on sloped segments
+        return v1 + slope * (x - b1)
+
+    #
+    # prev_aligned_bpm pre-pass
+    #
+
+    # start unaligned and ending in the same window carry it over
+    same_window = ~s_aligned & (e <= window_end)
+    carry = active & (vertical | same_window)
+    # sloped segments spanning windows forward the bpm at the last
+    # alignment, everything else the start bpm
+    spans = sloped & ~both_aligned & ~same_window & ~(s_aligned & (e < window_end))
+    own = np.where(spans, line(e_floor), v1)
+    own = np.where(active, own, np.nan)
+
+    # forward fill the carried values
+    own = np.concatenate([[prev_aligned_bpm0], own])
+    src = np.where(np.concatenate([[True], ~carry]), np.arange(n), 0)
+    prev = own[np.maximum.accumulate(src)]
+
+    #
+    # durations
+    #
+
+    # bpm in effect at the start of each segment, up to the next alignment
+    start_bpm = np.where(s_aligned, v1, prev[:-1])
+
+    # horizontal, and sloped within a single window
+    front_end = np.where(s_aligned, s, np.minimum(e, window_end))
+    flat = (e - front_end) * 60. / v1
+    durations = (front_end - s) * 60. / start_bpm + flat
+
+    # sloped segments where the tempo changes across cells, as in
+    # Project._time_between_events_daw_slope
+    cells = sloped & ~(s_aligned & ~e_aligned & (e < window_end)) & ~same_window
+    within = sloped & ~cells
+    durations = np.where(within, (e - s) * 60. / start_bpm, durations)
+
+    cells_start = np.where(both_aligned, s, window_end)
+    cells_end = np.where(both_aligned, e, e_floor)
+    first_bpm = np.where(both_aligned, v1, line(window_end))
+    last_bpm = np.where(both_aligned, v2, line(e_floor))
+    steps = np.where(cells, (cells_end - cells_start) // align, 0).astype(np.int64)
+
+    front = np.where(both_aligned, 0., (window_end - s) * 60. / start_bpm)
+    back = np.where(both_aligned, 0., (e - e_floor) * 60. / last_bpm)
+
+    # every cell of every such segment at once. cell bpms are
+    # linspace(first_bpm, last_bpm, steps + 1)[:-1]
+    seg = np.repeat(np.arange(n - 1), steps)
+    k = np.arange(len(seg)) - np.repeat(np.cumsum(steps) - steps, steps)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dist = np.where(steps > 0, (last_bpm - first_bpm) / steps, 0.)
+    cell_bpm = first_bpm[seg] + k * dist[seg]
+    middle = np.bincount(seg, weights=align * 60. / cell_bpm, minlength=n - 1)
+
+    durations = np.where(cells, front + middle + back, durations)
+    durations = np.where(vertical | ~active, 0., durations)
+    return durations, prev
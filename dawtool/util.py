@@ -39,6 +39,20 @@ def format_time(total_seconds, hours_fmt=False, precise=False, hours_pad=True):
 
     return ret
 
+# Cue sheet INDEX frames, as on a CD
+CUE_FRAMES_PER_SEC = 75
+
+def format_cue_index(total_seconds):
+    """
+    Convert total_seconds float into a cue sheet INDEX time of the form
+    "mm:ss:ff", where ff are frames at 75 frames per second. Minutes are not
+    wrapped into hours.
+    """
+    total_frames = round(total_seconds * CUE_FRAMES_PER_SEC)
+    total_secs, frames = divmod(total_frames, CUE_FRAMES_PER_SEC)
+    mins, secs = divmod(total_secs, 60)
+    return '{:02}:{:02}:{:02}'.format(mins, secs, frames)
+
 #####
 
 def power_of_two(x):
@@ -4,7 +4,7 @@ setuptools.setup(
     version='0.0.1',
     author='Mark Mossberg',
     python_requires='>=3.7',
-    install_requires=['pytest', 'hexdump', 'scipy'],
+    install_requires=['pytest', 'scipy', 'numpy'],
     packages=setuptools.find_packages(),
     entry_points={
         "console_scripts": ['dawtool=dawtool.__main__:main']
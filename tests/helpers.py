@@ -0,0 +1,44 @@
+"""
+Shared test helpers.
+"""
+
+from dawtool import load_project
+
+import os
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_parsed(fname, **kwargs):
+    """
+    Load and parse a project. fname is relative to the tests directory, or
+    absolute. kwargs are passed to load_project.
+    """
+    fname = os.path.join(TESTS_DIR, fname)
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f, **kwargs)
+        proj.parse()
+    return proj
+
+
+def assert_vectorized_matches_serial(fname):
+    """
+    Check that the vectorized tempo automation real times (see
+    Project.VECTORIZE_MIN_EVENTS) match the iterative ones for fname
+    """
+    import pytest
+
+    def load(min_events):
+        path = os.path.join(TESTS_DIR, fname)
+        with open(path, 'rb') as f:
+            proj = load_project(path, f)
+            proj.VECTORIZE_MIN_EVENTS = min_events
+            proj.parse()
+        return proj
+
+    serial = load(float('inf'))
+    vectorized = load(0)
+    for a, b in zip(serial.tempo_automation_events, vectorized.tempo_automation_events):
+        assert a.prev_aligned_bpm == b.prev_aligned_bpm
+        assert a.real_time == pytest.approx(b.real_time, abs=1e-12)
+    assert [m.time for m in vectorized.markers] == pytest.approx([m.time for m in serial.markers], abs=1e-12)
@@ -16,6 +16,7 @@ from dawtool import extract_markers, format_time, load_project
 from dawtool.daw.ableton import TempoAutomationFloatEvent, AbletonSetVersion, AbletonProject, AbletonRawMarker
 from dawtool.marker import Marker
 from dawtool.project import UnknownExtension
+from helpers import assert_vectorized_matches_serial
 
 import pytest
 
@@ -290,3 +291,7 @@ def test_als_malform_no_ae():
         proj = load_project(fname, f, theoretical=True)
 
     proj.parse()
+
+@pytest.mark.parametrize('fname', ['als/automation-intense-unaligned.als', 'als/automation-pathological.als'])
+def test_vectorized_real_times(fname):
+    assert_vectorized_matches_serial(fname)
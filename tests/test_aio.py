@@ -0,0 +1,109 @@
+from dawtool import extract_markers
+from dawtool.aio import load_project_async, extract_markers_async, _load_and_extract_markers
+from dawtool.project import UnknownExtension
+
+import pytest
+
+import asyncio
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FILES = [f'{TESTS_DIR}/fl/complex.flp', f'{TESTS_DIR}/als/example-120.als', f'{TESTS_DIR}/cue/rekordbox.cue']
+
+
+def _expected(fname, **kwargs):
+    with open(fname, 'rb') as f:
+        return extract_markers(fname, f, **kwargs)
+
+def test_extract_markers_async():
+    async def run():
+        limit = asyncio.Semaphore(2)
+        return await asyncio.gather(*(extract_markers_async(f, semaphore=limit) for f in FILES))
+
+    assert asyncio.run(run()) == [_expected(f) for f in FILES]
+
+def test_load_project_async_stream_and_pool():
+    fname = FILES[0]
+
+    async def run(executor):
+        with open(fname, 'rb') as f:
+            proj = await load_project_async(fname, f, theoretical=True, executor=executor)
+        with open(fname, 'rb') as f:
+            data = f.read()
+        markers = await extract_markers_async(fname, data, theoretical=True, executor=executor)
+        return proj.markers, markers
+
+    expected = _expected(fname, theoretical=True)
+    with ProcessPoolExecutor(1) as executor:
+        assert asyncio.run(run(executor)) == (expected, expected)
+
+def test_load_project_async_errors():
+    async def run(fname):
+        return await load_project_async(fname)
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(run(f'{TESTS_DIR}/als/missing.als'))
+    with pytest.raises(ValueError):
+        asyncio.run(run(f'{TESTS_DIR}/als/junk.als'))
+    with pytest.raises(UnknownExtension):
+        asyncio.run(run(__file__))
+
+def test_load_project_async_cancel():
+    async def run():
+        limit = asyncio.Semaphore(1)
+        with ThreadPoolExecutor(1) as executor:
+            first = asyncio.ensure_future(load_project_async(FILES[0], semaphore=limit, executor=executor))
+            # queued behind first on the semaphore
+            second = asyncio.ensure_future(load_project_async(FILES[1], semaphore=limit, executor=executor))
+            await asyncio.sleep(0)
+            second.cancel()
+            proj = await first
+            with pytest.raises(asyncio.CancelledError):
+                await second
+            # the slot wasn't leaked
+            assert not limit.locked()
+            return proj
+
+    assert asyncio.run(run()).markers == _expected(FILES[0])
+
+def test_load_project_async_stream_read_off_loop():
+    fname = FILES[0]
+    with open(fname, 'rb') as f:
+        data = f.read()
+
+    class File(io.BytesIO):
+        def read(self, *args):
+            self.thread = threading.current_thread()
+            return super().read(*args)
+
+    class AsyncReader:
+        async def read(self):
+            return data
+
+    async def run():
+        f = File(data)
+        markers = await extract_markers_async(fname, f)
+        # a plain read() blocks, so it must not run on the loop's thread
+        assert f.thread is not threading.current_thread()
+        return markers, await extract_markers_async(fname, AsyncReader())
+
+    expected = _expected(fname)
+    assert asyncio.run(run()) == (expected, expected)
+
+def test_extract_markers_async_process_pool():
+    async def run(executor):
+        limit = asyncio.Semaphore(2)
+        return await asyncio.gather(*(extract_markers_async(f, executor=executor, semaphore=limit)
+                                      for f in FILES))
+
+    with ProcessPoolExecutor(2) as executor:
+        assert asyncio.run(run(executor)) == [_expected(f) for f in FILES]
+
+    # the job run in the pool sends back the markers, not the project
+    with open(FILES[0], 'rb') as f:
+        data = f.read()
+    assert _load_and_extract_markers(FILES[0], data, (), {}) == _expected(FILES[0])
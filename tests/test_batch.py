@@ -0,0 +1,103 @@
+from dawtool import load_project, extract_markers, extract_markers_many
+from dawtool.batch import find_files, plan_outputs, export_cues
+
+import pytest
+
+import os
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_find_files():
+    found = list(find_files([f'{TESTS_DIR}/als/live8', f'{TESTS_DIR}/fl/complex.flp'], ('.als',)))
+    assert [os.path.relpath(x, TESTS_DIR) for x in found] == [
+        'als/live8/live8-patch-markers-auto.als',
+        'als/live8/live8-patch-markers-noauto.als',
+        'fl/complex.flp',
+    ]
+
+def test_plan_outputs():
+    planned = list(plan_outputs([f'{TESTS_DIR}/als', f'{TESTS_DIR}/fl/complex.flp'], ('.als',), 'out', '.cue'))
+    assert (f'{TESTS_DIR}/als/live9/live9-patch-2-0point.als', 'out/live9/live9-patch-2-0point.als.cue', None) in planned
+    assert planned[-1] == (f'{TESTS_DIR}/fl/complex.flp', 'out/complex.flp.cue', None)
+
+def test_plan_outputs_collisions(tmp_path):
+    for d in ('a', 'b'):
+        (tmp_path / d).mkdir()
+        (tmp_path / d / 'mix.als').touch()
+    (tmp_path / 'a' / 'mix.flp').touch()
+    a, b = str(tmp_path / 'a'), str(tmp_path / 'b')
+
+    planned = list(plan_outputs([f'{a}/mix.als', f'{b}/mix.als', a], ('.als', '.flp'), 'out', '.cue'))
+    assert [(os.path.relpath(src, tmp_path), dst) for src, dst, _ in planned] == [
+        ('a/mix.als', 'out/mix.als.cue'),
+        ('b/mix.als', 'out/mix.als.cue'),
+        ('a/mix.als', 'out/mix.als.cue'),
+        ('a/mix.flp', 'out/mix.flp.cue'),
+    ]
+    assert [err is None for _, _, err in planned] == [True, False, False, True]
+    assert isinstance(planned[1][2], ValueError)
+
+def test_export_cues(tmp_path):
+    paths = [f'{TESTS_DIR}/fl/complex.flp', f'{TESTS_DIR}/als/example-140.als', f'{TESTS_DIR}/als/junk.als']
+    results = list(export_cues(paths, str(tmp_path), jobs=2, theoretical=True))
+
+    assert [os.path.basename(src) for src, dst, err in results] == ['complex.flp', 'example-140.als', 'junk.als']
+    assert results[0][2] is None and results[1][2] is None
+    assert isinstance(results[2][2], ValueError)
+
+    # round trip through the cue parser
+    fname = f'{TESTS_DIR}/als/example-140.als'
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f, theoretical=True)
+    proj.parse()
+
+    cue_fname = str(tmp_path / 'example-140.als.cue')
+    with open(cue_fname, 'rb') as f:
+        cue = load_project(cue_fname, f)
+    cue.parse()
+
+    assert cue.title == 'example-140'
+    assert [m.text for m in cue.markers] == [m.text for m in proj.markers]
+    # to the nearest cue frame
+    assert [m.time for m in cue.markers] == [pytest.approx(m.time, abs=1 / 150) for m in proj.markers]
+    assert cue.markers[1].orig_index == '02:51:32'
+
+def test_export_cues_truncated(tmp_path):
+    data = open(f'{TESTS_DIR}/als/example-140.als', 'rb').read()
+    bad = tmp_path / 'bad.als'
+    bad.write_bytes(data[:len(data) // 2])
+
+    paths = [str(bad), f'{TESTS_DIR}/fl/complex.flp']
+    results = list(export_cues(paths, str(tmp_path / 'out'), jobs=2))
+    assert isinstance(results[0][2], EOFError)
+    assert results[1][2] is None
+
+@pytest.mark.parametrize('executor,workers', [('thread', None), ('process', 2), ('thread', 1)])
+def test_extract_markers_many(executor, workers):
+    paths = [f'{TESTS_DIR}/fl/complex.flp', f'{TESTS_DIR}/als/junk.als', f'{TESTS_DIR}/als/missing.als',
+             f'{TESTS_DIR}/cue/rekordbox.cue', f'{TESTS_DIR}/als/example-140.als']
+    results = list(extract_markers_many(iter(paths), workers, chunksize=2, executor=executor, theoretical=True))
+
+    assert [path for path, _ in results] == paths
+    assert isinstance(results[1][1], ValueError)
+    assert isinstance(results[2][1], FileNotFoundError)
+    for path, markers in results[::3]:
+        with open(path, 'rb') as f:
+            assert markers == extract_markers(path, f, theoretical=True)
+
+def test_extract_markers_many_truncated(tmp_path):
+    data = open(f'{TESTS_DIR}/als/example-140.als', 'rb').read()
+    bad = tmp_path / 'bad.als'
+    bad.write_bytes(data[:len(data) // 2])
+
+    # in the same chunk as a good file
+    paths = [str(bad), f'{TESTS_DIR}/fl/complex.flp']
+    # worker processes by default
+    results = list(extract_markers_many(paths, 2, chunksize=2))
+    assert isinstance(results[0][1], EOFError)
+    assert results[1][1]
+
+def test_extract_markers_many_bad_executor():
+    with pytest.raises(ValueError):
+        extract_markers_many([], executor='fork')
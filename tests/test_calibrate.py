@@ -0,0 +1,94 @@
+from dawtool.__main__ import main
+from dawtool.calibrate import (Segment, calibrate, predict_times, read_segments,
+                               validate_project_quant, DEFAULT_CANDIDATES)
+from dawtool.daw.ableton import AbletonProject
+from dawtool.daw.flstudio import FlStudioProject
+
+import numpy as np
+import pytest
+
+import io
+import logging
+
+# ramps starting and ending on the grid of both DAWs
+RAMPS = [(60, 120, 4), (120, 60, 4), (90, 174, 16), (140, 139.5, 8), (128, 128, 2), (174, 70, 1)]
+
+
+def _measure(cls, noise=0., seed=0):
+    """
+    "Render" RAMPS with the DAW engine of cls
+    """
+    proj = cls('f', io.BytesIO())
+    rng = np.random.default_rng(seed)
+    return [Segment(start, end, beats,
+                    proj._time_elapsed_bpm_range_daw(start, end, beats, 4 / cls.TEMPO_QUANT) + rng.normal(0, noise))
+            for start, end, beats in RAMPS]
+
+
+def test_predict_times():
+    times = predict_times([60], [120], [4], DEFAULT_CANDIDATES)
+    assert times.shape == (13, 1)
+    assert times[4, 0] == pytest.approx(2.8360648088301073, abs=1e-12)
+    assert times[9, 0] == pytest.approx(2.7745428009136432, abs=1e-12)
+
+    # brute force, including ramps that don't end on the grid
+    rng = np.random.default_rng(1)
+    start, end = rng.uniform(40, 200, 40), rng.uniform(40, 200, 40)
+    end[:4] = start[:4]
+    end[4] = start[4] * (1 + 1e-9)
+    beats = rng.choice([0.25, 1, 3.5, 4, 16], 40)
+    for quant, row in zip(DEFAULT_CANDIDATES, predict_times(start, end, beats, DEFAULT_CANDIDATES)):
+        align = 4 / quant
+        for s, e, b, t in zip(start, end, beats, row):
+            steps = int(b / align + 1e-9)
+            bpms = [s + (e - s) * k * align / b for k in range(steps + 1)]
+            expected = sum(60 * align / bpm for bpm in bpms[:-1]) + 60 * (b - steps * align) / bpms[-1]
+            assert t == pytest.approx(expected, rel=1e-11)
+
+@pytest.mark.parametrize('cls', [AbletonProject, FlStudioProject])
+def test_calibrate(cls):
+    segments = _measure(cls)
+    cal = calibrate(segments)
+    assert cal.quant == cls.TEMPO_QUANT
+    assert np.abs(cal.residuals_of(cls.TEMPO_QUANT)).max() < 1e-12
+    assert cal.predicted.shape == (len(DEFAULT_CANDIDATES), len(RAMPS))
+
+    # within measurement noise
+    assert calibrate(_measure(cls, noise=1e-5)).quant == cls.TEMPO_QUANT
+
+@pytest.mark.parametrize('project', ['.als', AbletonProject, FlStudioProject])
+def test_validate_project_quant(project):
+    cls = AbletonProject if project == '.als' else project
+    result = validate_project_quant(project, _measure(cls, noise=1e-5))
+    assert result.ok
+    assert result.quant == result.best_quant == cls.TEMPO_QUANT
+    assert result.max_error_ms < 0.1
+
+    other = FlStudioProject if cls is AbletonProject else AbletonProject
+    result = validate_project_quant(project, _measure(other))
+    assert not result.ok
+    assert result.best_quant == other.TEMPO_QUANT
+
+def test_read_segments(caplog):
+    fp = io.StringIO('start_bpm,end_bpm,beats,seconds\n'
+                     '# Live 12\n'
+                     '60,120,4,2.836\n'
+                     '60,120\n'
+                     '120,60,4,2.8\n')
+    with caplog.at_level(logging.WARNING):
+        segments = read_segments(fp)
+    assert segments == [(60, 120, 4, 2.836), (120, 60, 4, 2.8)]
+    assert 'malformed' in caplog.text
+
+def test_cli_calibrate(capsys, tmp_path):
+    specs = [':'.join(map(str, s)) for s in _measure(AbletonProject)]
+    assert main(['calibrate', *specs]) == 0
+    out, _ = capsys.readouterr()
+    assert '16' in [line.split()[0] for line in out.splitlines() if line.endswith('<- best')]
+
+    path = tmp_path / 'segments.csv'
+    path.write_text('\n'.join(','.join(map(str, s)) for s in _measure(FlStudioProject)))
+    assert main(['calibrate', '--csv', str(path), '--validate', '.flp']) == 0
+    assert main(['calibrate', '--csv', str(path), '--validate', '.als']) == 1
+    out, _ = capsys.readouterr()
+    assert '.als TEMPO_QUANT 16: FAIL' in out
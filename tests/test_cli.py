@@ -0,0 +1,74 @@
+from dawtool.__main__ import main
+
+import os
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_cli_single_file(capsys):
+    assert main(['-m', f'{TESTS_DIR}/fl/complex.flp']) == 0
+    out = capsys.readouterr().out
+    # no header for a single file
+    assert not out.startswith('==>')
+    assert out.splitlines()[0] == '00:29.041 Auto'
+
+def test_cli_many_files(capsys):
+    files = [f'{TESTS_DIR}/fl/complex.flp', f'{TESTS_DIR}/als/junk.als', f'{TESTS_DIR}/als/live8']
+    assert main(['-m', '-j', '2', *files]) == 1
+    out = capsys.readouterr().out
+
+    headers = [l for l in out.splitlines() if l.startswith('==>')]
+    assert headers == [
+        f'==> {TESTS_DIR}/fl/complex.flp <==',
+        f'==> {TESTS_DIR}/als/junk.als <==',
+        f'==> {TESTS_DIR}/als/live8/live8-patch-markers-auto.als <==',
+        f'==> {TESTS_DIR}/als/live8/live8-patch-markers-noauto.als <==',
+    ]
+    assert 'Could not extract markers from' in out
+
+def test_cli_unordered(capsys):
+    assert main(['-m', '-u', '-j', '2', f'{TESTS_DIR}/als/live8']) == 0
+    out = capsys.readouterr().out
+    assert sum(l.startswith('==>') for l in out.splitlines()) == 2
+
+def test_cli_csv(capsys):
+    assert main(['-f', 'csv', '--tempo', f'{TESTS_DIR}/fl/complex.flp', f'{TESTS_DIR}/als/junk.als']) == 1
+    captured = capsys.readouterr()
+    lines = captured.out.splitlines()
+    # one header, errors on stderr
+    assert lines[0] == 'file,type,real_time,text,beat,bpm,prev_aligned_bpm'
+    assert lines[1] == f'{TESTS_DIR}/fl/complex.flp,marker,29.040613113158678,Auto,,,'
+    assert all(l.split(',')[1] in ('marker', 'tempo') for l in lines[1:])
+    assert 'junk.als' in captured.err
+
+def test_cli_truncated_file(tmp_path, capsys):
+    # a truncated gzip raises EOFError, which must not abort the other files
+    data = open(f'{TESTS_DIR}/als/example-140.als', 'rb').read()
+    bad = tmp_path / 'bad.als'
+    bad.write_bytes(data[:len(data) // 2])
+
+    assert main(['-m', '-j', '2', str(bad), f'{TESTS_DIR}/fl/complex.flp']) == 1
+    out = capsys.readouterr().out
+    assert f'Could not extract markers from {bad}' in out
+    assert '00:29.041 Auto' in out
+
+def test_cli_headers_independent_of_jobs(capsys):
+    outputs = []
+    for jobs in ('1', '2'):
+        assert main(['-m', '-j', jobs, f'{TESTS_DIR}/als/live8']) == 0
+        outputs.append(capsys.readouterr().out)
+    assert outputs[0] == outputs[1]
+    assert sum(l.startswith('==>') for l in outputs[0].splitlines()) == 2
+
+def test_cli_file_named_like_subcommand(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'sidecar').mkdir()
+    with open(f'{TESTS_DIR}/fl/complex.flp', 'rb') as f:
+        (tmp_path / 'sidecar' / 'x.flp').write_bytes(f.read())
+    monkeypatch.chdir(tmp_path)
+
+    assert main(['sidecar', '-m']) == 0
+    out = capsys.readouterr().out
+    assert '==> sidecar/x.flp <==' in out
+    assert '00:29.041 Auto' in out
+    # processed as a project directory, not the sidecar subcommand
+    assert not os.path.exists(tmp_path / 'sidecar' / 'x.flp.tempomap')
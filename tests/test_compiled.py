@@ -0,0 +1,106 @@
+from dawtool import load_project
+from dawtool.compiled import CompiledTimeline
+from helpers import load_parsed
+
+import numpy as np
+import pytest
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+import copy
+import os
+import pickle
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROJECTS = [('fl/complex.flp', False), ('fl/complex.flp', True), ('fl/auto-basic2.flp', False),
+            ('fl/fl-markers.flp', False), ('als/automation-pathological.als', False),
+            ('als/automation-intense.als', True), ('als/example-120.als', False)]
+
+
+@pytest.mark.parametrize('fname,theoretical', PROJECTS)
+def test_compile_matches_project(fname, theoretical):
+    proj = load_parsed(fname, theoretical=theoretical)
+    before = copy.deepcopy(proj.tempo_automation_events)
+    timeline = proj.compile()
+    # nothing cached on the project's events
+    assert proj.tempo_automation_events == before
+
+    assert timeline.theoretical == theoretical
+    assert timeline.markers == proj.markers
+    assert timeline.time_signatures == tuple(proj.time_signatures)
+
+    beats = np.random.default_rng(0).uniform(0, 100, 300)
+    assert timeline.real_times(beats) == pytest.approx(proj.beat_real_times(beats), abs=1e-9)
+    assert timeline.real_time(12.5) == pytest.approx(proj._calc_beat_real_time(12.5), abs=1e-9)
+
+    events = proj.tempo_automation_events
+    if events and len(events) > 1:
+        assert timeline.event_real_times == pytest.approx([ev.real_time for ev in events], abs=1e-9)
+
+def test_compiled_immutable():
+    timeline = load_parsed('fl/complex.flp').compile()
+    with pytest.raises(AttributeError):
+        timeline.align = 1.
+    with pytest.raises(ValueError):
+        timeline.event_bpms[0] = 1.
+    with pytest.raises(ValueError):
+        timeline.real_times([-1.])
+
+@pytest.mark.parametrize('protocol', [pickle.DEFAULT_PROTOCOL, 5])
+def test_compiled_pickle(protocol):
+    timeline = load_parsed('fl/complex.flp').compile(dense=True)
+    buffers = []
+    data = pickle.dumps(timeline, protocol, buffer_callback=buffers.append if protocol >= 5 else None)
+    copied = pickle.loads(data, buffers=buffers)
+
+    assert isinstance(copied, CompiledTimeline)
+    assert not copied.event_beats.flags.writeable
+    assert not copied.dense[1].flags.writeable
+    assert copied.markers == timeline.markers
+    assert list(copied.real_times(np.arange(64.))) == list(timeline.real_times(np.arange(64.)))
+    if protocol >= 5:
+        # arrays go out of band, not copied into the pickle
+        assert buffers
+        assert len(data) < sum(b.raw().nbytes for b in buffers)
+
+def test_compiled_concurrent():
+    timeline = load_parsed('als/automation-pathological.als').compile()
+    chunks = [np.linspace(i, i + 50, 1000) for i in range(16)]
+    expected = [timeline.real_times(c) for c in chunks]
+
+    with ThreadPoolExecutor(8) as pool:
+        for got, want in zip(pool.map(timeline.real_times, chunks), expected):
+            assert list(got) == list(want)
+    with ProcessPoolExecutor(2) as pool:
+        for got, want in zip(pool.map(timeline.real_times, chunks[:4]), expected):
+            assert list(got) == list(want)
+
+def test_compile_no_tempo():
+    fname = f'{TESTS_DIR}/cue/rekordbox.cue'
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f)
+        proj.parse()
+    timeline = proj.compile()
+    assert [(m.time, m.text) for m in timeline.markers] == [(m.time, m.text) for m in proj.markers]
+    with pytest.raises(ValueError):
+        timeline.real_times([1.])
+
+def test_compile_sorts_markers():
+    sheet = b'''FILE "mix.wav" WAVE
+  TRACK 01 AUDIO
+    TITLE "second"
+    INDEX 01 02:00:00
+  TRACK 02 AUDIO
+    TITLE "first"
+    INDEX 01 01:00:00
+  TRACK 03 AUDIO
+    TITLE "third"
+    INDEX 01 03:00:00
+'''
+    proj = load_project('x.cue', BytesIO(sheet))
+    proj.parse()
+    assert [m.text for m in proj.markers] == ['second', 'first', 'third']
+
+    timeline = proj.compile()
+    assert [(m.time, m.text) for m in timeline.markers] == [(60, 'first'), (120, 'second'), (180, 'third')]
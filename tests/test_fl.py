@@ -1,6 +1,8 @@
 from dawtool import extract_markers, format_time, load_project
-from dawtool.daw.flstudio import Channel, ChannelAutomationPoint, PlaylistItem, GlobalTempoAutomationPoint, ArtificialGlobalTempoAutomationPoint, FlStudioProject, AutomationChannel, FlStudioRawMarker
+from dawtool.daw.flstudio import RenderedPlaylistItem, Channel, ChannelAutomationPoint, PlaylistItem, GlobalTempoAutomationPoint, ArtificialGlobalTempoAutomationPoint, FlStudioProject, AutomationChannel, FlStudioRawMarker
+from dawtool.daw.flstudio_core import Event, iter_events
 from dawtool.marker import Marker
+from helpers import assert_vectorized_matches_serial
 
 from io import BytesIO
 import pytest
@@ -94,7 +96,7 @@ def test_flp_markers():
     proj.parse()
 
     print(proj.raw_markers)
-    raw = [FlStudioRawMarker(time=1220, text='Auto', action=0), FlStudioRawMarker(time=1356, text='start', action=5), FlStudioRawMarker(time=1932, text='time sig', action=8), FlStudioRawMarker(time=2624, text='loop', action=4), FlStudioRawMarker(time=3168, text='marker loop', action=1), FlStudioRawMarker(time=3988, text='marker skip', action=2), FlStudioRawMarker(time=4896, text='marker pause', action=3), FlStudioRawMarker(time=5640, text='punch in', action=9), FlStudioRawMarker(time=6516, text='punch out', action=10)]
+    raw = [FlStudioRawMarker(time=1220, text='Auto', action=0, numerator=4, denominator=4), FlStudioRawMarker(time=1356, text='start', action=5, numerator=4, denominator=4), FlStudioRawMarker(time=1932, text='time sig', action=8, numerator=4, denominator=4), FlStudioRawMarker(time=2624, text='loop', action=4, numerator=4, denominator=4), FlStudioRawMarker(time=3168, text='marker loop', action=1, numerator=4, denominator=4), FlStudioRawMarker(time=3988, text='marker skip', action=2, numerator=4, denominator=4), FlStudioRawMarker(time=4896, text='marker pause', action=3, numerator=4, denominator=4), FlStudioRawMarker(time=5640, text='punch in', action=9, numerator=4, denominator=4), FlStudioRawMarker(time=6516, text='punch out', action=10, numerator=4, denominator=4)]
     assert proj.raw_markers == raw
 
     print(proj.markers)
@@ -119,6 +121,26 @@ def test_malformed_auto_chan():
     with pytest.raises(ValueError):
         p._compute_tempo_automations()
 
+def test_channel_registry_by_id():
+    # channel ids that don't match list positions, e.g. after deleting and
+    # reordering channels
+    p = FlStudioProject(None, BytesIO())
+    p.version = (20,)
+    p._handle_event(Event.CHANNEL_NEW, 7)
+    p._handle_event(Event.CHANNEL_NAME, 'seven'.encode('utf-16'))
+    p._handle_event(Event.CHANNEL_NEW, 3)
+    p._handle_event(Event.CHANNEL_NAME, 'three'.encode('utf-16'))
+
+    assert [c.id for c in p.channels] == [7, 3]
+    assert p.channels_by_id[7].name == 'seven'
+    assert p.channels_by_id[3].name == 'three'
+
+    auto_chan = AutomationChannel(3, AutomationChannel.PARAM_MASTER_TEMPO, AutomationChannel.DEST_MASTER)
+    assert p._get_auto_chan_channel(auto_chan) is p.channels[1]
+
+    with pytest.raises(ValueError):
+        p._get_auto_chan_channel(AutomationChannel(1, AutomationChannel.PARAM_MASTER_TEMPO, AutomationChannel.DEST_MASTER))
+
 def test_FL20_str_decode():
     p = FlStudioProject(None, BytesIO())
     p.version = (20,)
@@ -147,3 +169,262 @@ def test_FL11_str_decode():
     with pytest.raises(UnicodeDecodeError):
         x = 'hi'
         assert x == p._decode_str(x.encode('utf-16'))
+
+
+def test_iter_events():
+    fname = f'{TESTS_DIR}/fl/fl-markers.flp'
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f)
+        proj.parse()
+        f.seek(0)
+        events = list(iter_events(f))
+
+    version = next(e for e in events if e.id == Event.VERSION)
+    assert version.kind == Event.TEXT
+    assert tuple(map(int, version.value.decode('utf-8').replace('\x00', '').split('.'))) == proj.version
+
+    marker_times = [e.value & 0xffffff for e in events if e.id == Event.MARKER_TIME]
+    assert marker_times == [m.pulse for m in proj.raw_markers]
+
+    tempo = next(e for e in events if e.id == Event.TEMPO)
+    assert tempo.kind == Event.DWORD
+    assert bytes(tempo.data) == open(fname, 'rb').read()[tempo.offset:tempo.offset+4]
+
+def test_iter_events_bytes_early_exit():
+    fname = f'{TESTS_DIR}/fl/fl test.flp'
+    with open(fname, 'rb') as f:
+        contents = f.read()
+
+    it = iter_events(contents)
+    first = next(it)
+    assert first.id == Event.VERSION
+    it.close()
+
+    with pytest.raises(ValueError):
+        list(iter_events(b'FLhx' + contents[4:]))
+
+    with pytest.raises(ValueError):
+        list(iter_events(contents[:-1]))
+
+
+def _clip(start, len, points, track_id=1):
+    points = [GlobalTempoAutomationPoint(b, None, bpm, track_id) for b, bpm in points]
+    return RenderedPlaylistItem(0, track_id, start, len, points)
+
+def test_dedup_clips():
+    a = _clip(0, 4, [(0, 120), (4, 120)], track_id=1)
+    b = _clip(0, 8, [(0, 100), (8, 100)], track_id=2)
+    c = _clip(0, 8, [(0, 90), (8, 90)], track_id=3)
+    d = _clip(8, 4, [(8, 140), (12, 140)], track_id=4)
+
+    # longest wins, later clip wins a tie
+    assert FlStudioProject._dedup_clips([a, b, c, d]) == [c, d]
+    assert FlStudioProject._dedup_clips([]) == []
+
+def test_render_overlap_split():
+    p = FlStudioProject(None, BytesIO())
+    curr = _clip(0, 16, [(0, 100), (2, 100), (4, 140), (16, 140)])
+    nxt = _clip(3, 4, [(3, 80), (7, 80)], track_id=2)
+    exact = _clip(4, 4, [(4, 60), (8, 60)], track_id=2)
+
+    rendered = p._render_dedup_clips([curr, nxt])
+    assert [(x.beat, x.bpm) for x in rendered] == [(0, 100), (2, 100), (3, 120), (3, 80), (7, 80)]
+    assert isinstance(rendered[2], ArtificialGlobalTempoAutomationPoint)
+
+    rendered = p._render_dedup_clips([curr, exact])
+    assert [(x.beat, x.bpm) for x in rendered] == [(0, 100), (2, 100), (4, 140), (4, 60), (8, 60)]
+
+
+def test_render_automation_timelines():
+    fname = f'{TESTS_DIR}/fl/complex.flp'
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f)
+    proj.parse()
+
+    timelines = proj.render_automation_timelines()
+    assert len(timelines) == 22
+
+    # the generic renderer agrees with the tempo specific one
+    tempo = timelines[(AutomationChannel.DEST_MASTER, AutomationChannel.PARAM_MASTER_TEMPO)]
+    assert tempo.is_tempo
+    assert tempo.channel_ids == [1, 2, 34]
+    events = proj.tempo_automation_events
+    assert list(tempo.beats) == [e.beat for e in events]
+    assert list((tempo.values + .5) * 120) == pytest.approx([e.bpm for e in events])
+    assert list(tempo.artificial) == [isinstance(e, ArtificialGlobalTempoAutomationPoint) for e in events]
+
+    pitch = timelines[(AutomationChannel.DEST_MASTER, AutomationChannel.PARAM_MASTER_PITCH)]
+    assert not pitch.is_tempo
+    assert len(pitch.beats) == len(pitch.values) == 3
+
+def test_profile_stats():
+    fname = f'{TESTS_DIR}/fl/complex.flp'
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f, profile=True)
+        proj.parse()
+        f.seek(0)
+        num_events = sum(1 for _ in iter_events(f))
+
+    assert set(proj.stats['phases']) == {'events', 'render_clips', 'calc_markers'}
+    counters = proj.stats['counters']
+    assert counters['events_decoded'] == num_events
+    assert counters['tempo_events'] == len(proj.tempo_automation_events)
+    assert counters['segments_integrated'] == len(proj.tempo_automation_events) - 1
+    assert counters['real_time_cache_misses'] == 1
+    assert counters['real_time_cache_hits'] == len(proj.markers) - 1
+    assert 'memory_peaks' not in proj.stats
+
+    # off by default
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f)
+        proj.parse()
+    assert proj.stats == {}
+
+def test_hooks():
+    fname = f'{TESTS_DIR}/fl/complex.flp'
+    segments = []
+    phases = []
+    def on_segment(first, second, kind, elapsed):
+        segments.append((second.beat, kind, elapsed))
+
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f, on_segment=on_segment, on_phase=lambda *a: phases.append(a))
+        proj.parse()
+
+    assert [name for name, _ in phases] == ['events', 'render_clips', 'calc_markers']
+    # not profiling
+    assert proj.stats == {}
+
+    events = proj.tempo_automation_events
+    # one segment per pair of events, then one per marker
+    assert len(segments) == len(events) - 1 + len(proj.markers)
+    assert {kind for _, kind, _ in segments} == {'vertical', 'horizontal', 'slope'}
+    for ev, (beat, _, elapsed) in zip(events[1:], segments):
+        assert beat == ev.beat
+    assert sum(e for _, _, e in segments[:len(events) - 1]) == pytest.approx(events[-1].real_time)
+
+def test_beat_grid_matches_engine():
+    import numpy as np
+    for fname, theoretical in [('complex.flp', False), ('complex.flp', True), ('auto-basic2.flp', False)]:
+        fname = f'{TESTS_DIR}/fl/{fname}'
+        with open(fname, 'rb') as f:
+            proj = load_project(fname, f, theoretical=theoretical, dense_budget=0)
+            proj.parse()
+
+        grid = proj.beat_grid(0, 100, 0.25)
+        assert len(grid) == 400
+        expected = [proj._calc_beat_real_time(b) for b in np.arange(0, 100, 0.25)]
+        assert grid == pytest.approx(expected, rel=1e-12, abs=1e-9)
+
+    # unsorted, off grid beats
+    beats = [57.3, 0.01, 13.999, 6.625]
+    assert proj.beat_real_times(beats) == pytest.approx([proj._calc_beat_real_time(b) for b in beats], abs=1e-9)
+
+    with pytest.raises(ValueError):
+        proj.beat_real_times([-1.])
+
+@pytest.mark.parametrize('fname', ['fl/complex.flp', 'fl/auto-basic2.flp',
+                                   'als/automation-intense-unaligned.als',
+                                   'als/automation-pathological.als'])
+def test_dense_timeline(fname):
+    import numpy as np
+    fname = f'{TESTS_DIR}/{fname}'
+
+    def load(**kwargs):
+        with open(fname, 'rb') as f:
+            proj = load_project(fname, f, profile=True, **kwargs)
+            proj.parse()
+        return proj
+
+    segments = load(dense_budget=0)
+    dense = load()
+    # never built while parsing
+    assert 'dense_steps' not in dense.stats['counters']
+    assert [m.time for m in dense.markers] == [m.time for m in segments.markers]
+
+    end = dense.tempo_automation_events[-1].beat
+    beats = np.random.default_rng(0).uniform(0, end + 8, 500)
+    expected = [segments._calc_beat_real_time(b) for b in beats]
+    # too few queries to pay for the table
+    assert dense.beat_real_times(beats[:2]) == pytest.approx(expected[:2], abs=1e-9)
+    assert 'dense_steps' not in dense.stats['counters']
+
+    # one query per grid step builds it, later lookups use it. in the table,
+    # and past the last event
+    align = 4 / dense.TEMPO_QUANT
+    dense.beat_grid(0, end, align)
+    assert dense.stats['counters']['dense_steps'] > 0
+    assert [dense._calc_beat_real_time(b) for b in beats] == pytest.approx(expected, abs=1e-9)
+    assert dense.beat_real_times(beats) == pytest.approx(expected, abs=1e-9)
+    assert dense.beat_real_times(beats[beats < end]) == pytest.approx(
+            [e for b, e in zip(beats, expected) if b < end], abs=1e-9)
+
+    # over budget falls back to the segments
+    small = load(dense_budget=64)
+    small.beat_grid(0, end, align)
+    assert 'dense_steps' not in small.stats['counters']
+
+def test_time_signatures():
+    fname = f'{TESTS_DIR}/fl/fl-markers.flp'
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f)
+        proj.parse()
+
+    # project time sig, then the 'time sig' marker
+    assert proj.time_signatures == [(0., 4, 4), (20.125, 4, 4)]
+    assert proj.beats_per_bar == 4
+
+    # the time sig marker restarts the bars
+    assert list(proj.bar_beats(0, 30)) == [0., 4., 8., 12., 16., 20., 20.125, 24.125, 28.125]
+    assert list(proj.bar_beats(17, 25)) == [20., 20.125, 24.125]
+    assert list(proj.bar_grid(0, 30)) == pytest.approx([b * proj.sec_per_beat for b in proj.bar_beats(0, 30)])
+    from dawtool.timeline import bar_starts
+    from dawtool.project import TimeSignature
+    sigs = [TimeSignature(0., 3, 4), TimeSignature(6., 7, 8)]
+    assert list(bar_starts(sigs, 0, 13)) == [0., 3., 6., 9.5]
+
+def test_range_queries():
+    fname = f'{TESTS_DIR}/fl/complex.flp'
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f)
+        proj.parse()
+
+    markers = proj.markers
+    events = proj.tempo_automation_events
+    for start, end in [(0, 100), (10, 30), (markers[0].time, markers[1].time), (30, 10), (-5, 0), (1000, 2000)]:
+        assert proj.markers_between(start, end) == [m for m in markers if start <= m.time <= end]
+        assert proj.tempo_events_between(start, end) == [ev for ev in events if start <= ev.real_time <= end]
+
+    assert proj.nearest_marker(0) == markers[0]
+    assert proj.nearest_marker(1e6) == markers[-1]
+    for m in markers:
+        assert proj.nearest_marker(m.time + 0.1) == m
+    # ties go to the earlier marker
+    a, b = markers[:2]
+    assert proj.nearest_marker((a.time + b.time) / 2) == a
+
+    # the index follows changes to the markers
+    proj.markers = markers[1:]
+    assert proj.nearest_marker(0) == markers[1]
+    proj.markers = []
+    assert proj.nearest_marker(0) is None
+    assert proj.markers_between(0, 100) == []
+
+    # and to the tempo automation events: a replaced list (of the same
+    # length) gets its real times computed, once
+    import copy
+    doubled = copy.deepcopy(events)
+    for ev in doubled:
+        ev.bpm *= 2
+        ev.real_time = None
+    proj.tempo_automation_events = doubled
+    assert proj.tempo_events_between(0, 1e6) == doubled
+    assert doubled[-1].real_time == pytest.approx(events[-1].real_time / 2, rel=1e-3)
+    generation = proj._real_times_generation
+    proj.tempo_events_between(0, 10)
+    proj.nearest_marker(0)
+    assert proj._real_times_generation == generation
+
+@pytest.mark.parametrize('fname', ['fl/complex.flp', 'fl/auto-basic2.flp'])
+def test_vectorized_real_times(fname):
+    assert_vectorized_matches_serial(fname)
@@ -44,3 +44,10 @@ def test_precise():
     assert format_time(59.1) == '00:59'
     assert format_time(60.1, precise=True) == '01:00.100'
     assert format_time(60.1) == '01:00'
+
+def test_format_cue_index():
+    from dawtool.util import format_cue_index
+    assert format_cue_index(0) == '00:00:00'
+    assert format_cue_index(61.5) == '01:01:37'
+    assert format_cue_index(59.999) == '01:00:00'
+    assert format_cue_index(100*60 + 1/75) == '100:00:01'
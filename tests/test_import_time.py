@@ -0,0 +1,59 @@
+"""
+Startup cost regression tests. dawtool is often run as a short lived
+process per file, so `import dawtool` must not pull in the DAW modules or
+their heavy dependencies.
+"""
+
+import subprocess
+import sys
+
+# generous, to not be flaky on slow CI machines. a regression that imports
+# numpy/scipy blows well past it.
+IMPORT_BUDGET_US = 150_000
+
+HEAVY_MODULES = ['scipy', 'numpy', 'hexdump', 'xml.etree.ElementTree',
+                 'dawtool.daw.ableton', 'dawtool.daw.flstudio', 'dawtool.daw.cue']
+
+
+def _importtime(code):
+    """
+    Return {module: cumulative import time in us} for running code in a
+    fresh interpreter.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time_budget():
+    times = _importtime('import dawtool')
+    assert times['dawtool'] < IMPORT_BUDGET_US
+
+def test_import_is_lazy():
+    times = _importtime('import dawtool')
+    assert not [m for m in HEAVY_MODULES if m in times]
+
+def test_load_project_imports_only_needed_module():
+    code = ('import io, sys, dawtool; '
+            'dawtool.load_project("x.cue", io.BytesIO(b"")).parse(); '
+            'print(" ".join(sys.modules))')
+    proc = subprocess.run([sys.executable, '-c', code],
+                          capture_output=True, text=True, check=True)
+    modules = proc.stdout.split()
+    assert 'dawtool.daw.cue' in modules
+    assert 'dawtool.daw.ableton' not in modules
+    assert 'dawtool.daw.flstudio' not in modules
+
+def test_cli_import_is_lazy():
+    # short cli runs on one file need neither the worker pool nor the
+    # record writers
+    times = _importtime('import dawtool.__main__')
+    assert times['dawtool.__main__'] < IMPORT_BUDGET_US
+    lazy = HEAVY_MODULES + ['multiprocessing', 'concurrent.futures', 'json', 'csv', 'dawtool.batch']
+    assert not [m for m in lazy if m in times]
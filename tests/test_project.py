@@ -0,0 +1,61 @@
+"""
+Format independent Project behavior: dumps, instrumentation and the time
+calculation engine.
+"""
+
+from helpers import load_parsed
+
+import numpy as np
+import pytest
+
+import io
+import tracemalloc
+
+
+def test_dump_fp():
+    proj = load_parsed('als/automation.als')
+
+    s = io.StringIO()
+    proj.dump(s)
+    assert s.getvalue().startswith('>>> Full Timeline Dump <<<\n')
+    assert s.getvalue().count('TempoAutomationFloatEvent') == len(proj.tempo_automation_events)
+
+@pytest.mark.parametrize('reset_peak', [True, False])
+def test_profile_memory(monkeypatch, reset_peak):
+    if not reset_peak:
+        # python < 3.9
+        monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+
+    fname = 'als/automation.als'
+    proj = load_parsed(fname, profile='memory')
+
+    phases = ['decompress', 'version', 'tempo', 'markers', 'automation', 'calc_markers']
+    assert list(proj.stats['phases']) == phases
+    assert list(proj.stats['memory_peaks']) == phases
+    assert proj.stats['counters']['bytes_decompressed'] == len(proj.contents)
+    assert proj.stats['memory_peaks']['decompress'] >= len(proj.contents)
+    assert not tracemalloc.is_tracing()
+
+    # tracing started by the caller is left running, with its traces
+    tracemalloc.start()
+    try:
+        kept = bytearray(1 << 20)
+        proj = load_parsed(fname, profile='memory')
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_object_traceback(kept) is not None
+        if reset_peak:
+            assert proj.stats['memory_peaks']['decompress'] >= len(proj.contents)
+        else:
+            assert proj.stats['memory_peaks'] == {}
+            assert 'python 3.9' in proj.stats['memory_peaks_skipped']
+    finally:
+        tracemalloc.stop()
+
+def test_beat_real_times_many_sloped_segments():
+    proj = load_parsed('als/automation-pathological.als', dense_budget=0)
+
+    # unsorted beats spread over many sloped segments, several per segment
+    end = proj.tempo_automation_events[-1].beat
+    beats = np.random.default_rng(1).uniform(0, end + 4, 2000)
+    expected = [proj._calc_beat_real_time(b) for b in beats]
+    assert proj.beat_real_times(beats) == pytest.approx(expected, rel=1e-12, abs=1e-9)
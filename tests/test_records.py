@@ -0,0 +1,22 @@
+from dawtool.records import write_records
+from helpers import load_parsed
+
+import pytest
+
+import io
+import json
+
+
+def test_records():
+    proj = load_parsed('als/example-120.als')
+
+    s = io.StringIO()
+    write_records(s, proj.iter_records(tempo=True), 'ndjson')
+    records = [json.loads(l) for l in s.getvalue().splitlines()]
+    assert [r['text'] for r in records if r['type'] == 'marker'] == [m.text for m in proj.markers]
+    assert [r['real_time'] for r in records if r['type'] == 'marker'] == [m.time for m in proj.markers]
+    tempo = [r for r in records if r['type'] == 'tempo']
+    assert tempo == [{'file': None, 'type': 'tempo', 'real_time': 0.0, 'text': None, 'beat': -63072000.0, 'bpm': 120.0, 'prev_aligned_bpm': None}]
+
+    with pytest.raises(ValueError):
+        write_records(s, [], 'xml')
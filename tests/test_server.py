@@ -0,0 +1,75 @@
+from dawtool import load_project
+from dawtool.server import make_server, request_records
+
+import pytest
+
+import json
+import os
+import threading
+from urllib.request import urlopen
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope='module')
+def server_url():
+    server = make_server(port=0)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    host, port = server.server_address[:2]
+    yield f'http://{host}:{port}'
+    server.shutdown()
+    server.server_close()
+
+def test_server_path(server_url):
+    fname = f'{TESTS_DIR}/fl/complex.flp'
+    records = request_records(server_url, fname, tempo=True)
+
+    with open(fname, 'rb') as f:
+        proj = load_project(fname, f)
+        proj.parse()
+    assert records == list(proj.iter_records(tempo=True))
+    # cached the second time around
+    assert request_records(server_url, fname, tempo=True) == records
+
+def test_server_bytes(server_url):
+    with open(f'{TESTS_DIR}/als/example-120.als', 'rb') as f:
+        data = f.read()
+    with urlopen(f'{server_url}/parse?filename=x.als&theoretical=1', data) as resp:
+        records = json.load(resp)['records']
+    assert records[0] == {'type': 'marker', 'real_time': 0.0, 'text': 'mirvs - his track你好'}
+    assert len(records) == 15
+
+def test_server_errors(server_url):
+    with pytest.raises(ValueError, match='Not gzip'):
+        request_records(server_url, f'{TESTS_DIR}/als/junk.als')
+    with pytest.raises(ValueError, match='not found'):
+        request_records(server_url, f'{TESTS_DIR}/als/missing.als')
+    with pytest.raises(ValueError, match='unknown ext'):
+        request_records(server_url, f'{TESTS_DIR}/test_server.py')
+
+def test_server_unreadable(server_url, tmp_path):
+    # a directory that looks like a project
+    (tmp_path / 'dir.als').mkdir()
+    with pytest.raises(ValueError):
+        request_records(server_url, str(tmp_path / 'dir.als'))
+
+    # truncated gzip
+    with open(f'{TESTS_DIR}/als/example-120.als', 'rb') as f:
+        data = f.read()
+    (tmp_path / 'truncated.als').write_bytes(data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        request_records(server_url, str(tmp_path / 'truncated.als'))
+
+    # the server is still up
+    with urlopen(f'{server_url}/ping') as resp:
+        assert json.load(resp) == {'ok': True}
+
+def test_server_unexpected_error(server_url, monkeypatch):
+    import dawtool.server
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(dawtool.server, 'parse_records', broken)
+    with pytest.raises(ValueError, match='RuntimeError: boom'):
+        request_records(server_url, f'{TESTS_DIR}/als/example-140.als')
@@ -0,0 +1,90 @@
+from dawtool import read_sidecar, write_sidecar
+from dawtool.__main__ import main
+from dawtool.sidecar import HEADER
+from helpers import load_parsed
+
+import numpy as np
+import pytest
+
+import mmap
+import os
+import shutil
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.parametrize('fname,theoretical', [('fl/complex.flp', False), ('fl/complex.flp', True),
+                                               ('fl/fl-markers.flp', False),
+                                               ('als/automation-pathological.als', False),
+                                               ('als/example-140.als', False),
+                                               ('cue/rekordbox.cue', False)])
+def test_sidecar_round_trip(tmp_path, fname, theoretical):
+    timeline = load_parsed(fname, theoretical=theoretical).compile()
+    path = str(tmp_path / 'x.tempomap')
+    write_sidecar(timeline, path)
+    loaded = read_sidecar(path)
+
+    assert loaded.align == timeline.align
+    assert loaded.time_signatures == timeline.time_signatures
+    assert [(m.time, m.text) for m in loaded.markers] == [(m.time, m.text) for m in timeline.markers]
+    for name in ('event_beats', 'event_bpms', 'event_real_times', 'event_prev_aligned_bpms'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(timeline, name))
+    assert loaded.dense is None
+
+    if len(timeline.event_beats):
+        beats = np.linspace(0, 80, 321)
+        assert list(loaded.real_times(beats)) == list(timeline.real_times(beats))
+
+        with_table = read_sidecar(path, dense=True)
+        assert (with_table.dense is None) == theoretical
+        np.testing.assert_allclose(with_table.real_times(beats), timeline.real_times(beats),
+                                   rtol=1e-12)
+
+def test_sidecar_mmapped(tmp_path):
+    proj = load_parsed('fl/complex.flp')
+    path = str(tmp_path / 'x.tempomap')
+    timeline = proj.compile(dense=True)
+    write_sidecar(timeline, path)
+    loaded = read_sidecar(path)
+
+    assert not loaded.event_beats.flags.writeable
+    # views of the map, not copies
+    assert isinstance(loaded.event_beats.base.obj, mmap.mmap)
+    assert [m.time for m in loaded.markers] == [m.time for m in proj.markers]
+    # the dense table isn't stored
+    assert os.path.getsize(path) < timeline.dense[1].nbytes
+
+def test_sidecar_bad(tmp_path):
+    path = tmp_path / 'x.tempomap'
+    for data in [b'', b'JUNK' * 40]:
+        path.write_bytes(data)
+        with pytest.raises(ValueError):
+            read_sidecar(str(path))
+
+    write_sidecar(load_parsed('fl/complex.flp'), str(path))
+    good = path.read_bytes()
+    path.write_bytes(good[:-3])
+    with pytest.raises(ValueError):
+        read_sidecar(str(path))
+
+    # other versions
+    for version in (1, 3):
+        path.write_bytes(good[:8] + version.to_bytes(2, 'little') + good[10:])
+        with pytest.raises(ValueError):
+            read_sidecar(str(path))
+    assert HEADER.size % 8 == 0
+
+def test_cli_sidecar(tmp_path, capsys):
+    src = tmp_path / 'projects'
+    shutil.copytree(f'{TESTS_DIR}/fl', src / 'fl')
+    shutil.copy(f'{TESTS_DIR}/als/junk.als', src)
+
+    assert main(['sidecar', str(src), '-j', '2']) == 1
+    out, err = capsys.readouterr()
+    assert 'junk.als' in err
+    assert os.path.exists(src / 'fl' / 'complex.flp.tempomap')
+
+    out_dir = tmp_path / 'out'
+    assert main(['sidecar', str(src / 'fl' / 'complex.flp'), '-o', str(out_dir)]) == 0
+    loaded = read_sidecar(str(out_dir / 'complex.flp.tempomap'))
+    assert [m.time for m in loaded.markers] == [m.time for m in load_parsed('fl/complex.flp').markers]
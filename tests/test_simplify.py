@@ -0,0 +1,66 @@
+from dawtool.project import GenericTempoAutomationEvent
+from dawtool.simplify import rdp_keep, simplify_tempo_events
+from helpers import load_parsed
+
+import numpy as np
+import pytest
+
+
+def _recorded_project(theoretical=False):
+    """
+    A project with a dense, smooth "recorded" tempo lane, and a tempo jump
+    """
+    proj = load_parsed('als/example-120.als', theoretical=theoretical)
+    beats = np.linspace(0., 256., 2001)
+    bpms = 120. + 20. * np.sin(beats / 40.)
+    events = [GenericTempoAutomationEvent(b, None, v) for b, v in zip(beats, bpms)]
+    events += [GenericTempoAutomationEvent(256., None, 90.), GenericTempoAutomationEvent(300., None, 90.)]
+    proj.tempo_automation_events = events
+    return proj
+
+
+def test_rdp_keep():
+    beats = [0., 1., 2., 3., 3., 4., 5.]
+    bpms = [100., 110., 120., 120., 80., 81., 80.]
+    # collinear points go, vertical line points stay
+    assert rdp_keep(beats, bpms, 0.5).tolist() == [True, False, True, True, True, True, True]
+    assert rdp_keep(beats, bpms, 2.).tolist() == [True, False, True, True, True, False, True]
+    assert rdp_keep([], [], 1.).tolist() == []
+
+
+@pytest.mark.parametrize('theoretical', [False, True])
+@pytest.mark.parametrize('max_error_ms', [0.1, 5.])
+def test_simplify_tempo_events(theoretical, max_error_ms):
+    proj = _recorded_project(theoretical)
+    events = proj.tempo_automation_events
+    kept, error_ms = simplify_tempo_events(proj, max_error_ms)
+
+    assert len(kept) < len(events) / 4
+    assert 0 <= error_ms <= max_error_ms
+    # the tempo jump survives
+    assert [(ev.beat, ev.bpm) for ev in kept[-3:]] == [(256., events[-3].bpm), (256., 90.), (300., 90.)]
+
+    # check the achieved error independently
+    proj._calc_tempo_automation_event_real_times()
+    exact = [ev.real_time for ev in events]
+    proj.tempo_automation_events = kept
+    proj._calc_tempo_automation_event_real_times()
+    times = [proj._calc_beat_real_time(ev.beat) for ev in events]
+    # (the search uses the vectorized engine, which agrees to float rounding)
+    assert np.abs(np.subtract(times, exact)).max() * 1000 == pytest.approx(error_ms, abs=1e-6)
+
+
+def test_simplify_project():
+    fname = 'fl/complex.flp'
+    exact = load_parsed(fname)
+    proj = load_parsed(fname, simplify_ms=1., profile=True)
+
+    assert len(proj.tempo_automation_events) < len(exact.tempo_automation_events)
+    assert proj.simplify_error_ms <= 1.
+    assert proj.stats['counters']['tempo_events_dropped'] == \
+        len(exact.tempo_automation_events) - len(proj.tempo_automation_events)
+    assert 'simplify' in proj.stats['phases']
+    assert [m.time for m in proj.markers] == pytest.approx([m.time for m in exact.markers], abs=1e-3)
+
+    # off by default
+    assert exact.simplify_error_ms is None
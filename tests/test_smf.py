@@ -0,0 +1,128 @@
+from dawtool.__main__ import main
+from dawtool.compiled import CompiledTimeline
+from dawtool.smf import PPQ, _varlen, emit_smf, tempo_track
+from helpers import load_parsed
+
+import pytest
+
+import io
+import os
+import struct
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _read_varlen(data, i):
+    n = 0
+    while True:
+        b = data[i]
+        i += 1
+        n = (n << 7) | (b & 0x7f)
+        if not b & 0x80:
+            return n, i
+
+def _decode(data):
+    """
+    Minimal SMF reader for meta events: return (ppq, [(tick, kind, data)])
+    """
+    assert data[:4] == b'MThd'
+    _, fmt, ntracks, ppq = struct.unpack('>IHHH', data[4:14])
+    assert (fmt, ntracks) == (1, 1)
+    assert data[14:18] == b'MTrk'
+    size, = struct.unpack('>I', data[18:22])
+    body = data[22:22 + size]
+    assert len(body) == size
+
+    events, tick, i = [], 0, 0
+    while i < len(body):
+        delta, i = _read_varlen(body, i)
+        tick += delta
+        assert body[i] == 0xff
+        kind = body[i+1]
+        length, i = _read_varlen(body, i + 2)
+        events.append((tick, kind, body[i:i + length]))
+        i += length
+    assert events[-1][1] == 0x2f
+    return ppq, events[:-1]
+
+def _smf_real_time(tempos, tick, ppq):
+    """
+    Real time of tick under the set_tempo events [(tick, usec)]
+    """
+    elapsed = 0.
+    for (t0, usec), nxt in zip(tempos, tempos[1:] + [(float('inf'), None)]):
+        if tick <= t0:
+            break
+        elapsed += (min(tick, nxt[0]) - t0) / ppq * usec / 1e6
+    return elapsed
+
+
+def test_varlen():
+    assert _varlen(0) == b'\x00'
+    assert _varlen(0x7f) == b'\x7f'
+    assert _varlen(0x80) == b'\x81\x00'
+    assert _varlen(0x0fffffff) == b'\xff\xff\xff\x7f'
+
+@pytest.mark.parametrize('fname,theoretical', [('fl/complex.flp', False), ('fl/complex.flp', True),
+                                               ('fl/fl-markers.flp', False),
+                                               ('als/automation-intense-unaligned.als', False),
+                                               ('als/example-140.als', False)])
+def test_smf_tempo_map(fname, theoretical):
+    proj = load_parsed(fname, theoretical=theoretical)
+    f = io.BytesIO()
+    proj.emit_smf_to(f)
+    ppq, events = _decode(f.getvalue())
+    assert ppq == PPQ
+
+    tempos = [(tick, int.from_bytes(data, 'big')) for tick, kind, data in events if kind == 0x51]
+    assert tempos[0][0] == 0
+    # only changes are written
+    assert all(a[1] != b[1] for a, b in zip(tempos, tempos[1:]))
+
+    sigs = [(tick, data[0], 1 << data[1]) for tick, kind, data in events if kind == 0x58]
+    assert sigs == [(round(ts.beat * ppq), ts.numerator, ts.denominator) for ts in proj.time_signatures]
+
+    markers = [(tick, data.decode()) for tick, kind, data in events if kind == 0x06]
+    assert [text for _, text in markers] == [m.text for m in proj.markers]
+    for (tick, _), m in zip(markers, proj.markers):
+        # set_tempo rounding and the marker snapping to a tick
+        assert _smf_real_time(tempos, tick, ppq) == pytest.approx(m.time, abs=1e-3)
+
+    # DAW mode: the grid steps of the tempo map match the project's
+    if not theoretical and len(tempos) > 1:
+        align = 4 / proj.TEMPO_QUANT
+        for beat in [align * k for k in range(0, 40 * proj.TEMPO_QUANT // 4, 7)]:
+            expected = proj._calc_beat_real_time(beat)
+            assert _smf_real_time(tempos, round(beat * ppq), ppq) == pytest.approx(expected, abs=1e-4)
+
+def test_smf_theoretical_step():
+    proj = load_parsed('fl/complex.flp', theoretical=True)
+    ppq, events = _decode(emit_smf(proj, theoretical_step=1.))
+    ticks = [tick for tick, kind, _ in events if kind == 0x51]
+    assert len(ticks) > 1
+    assert all(tick % PPQ == 0 for tick in ticks)
+
+def test_smf_long_constant_tempo():
+    # FL Studio's grid, with a marker 4 hours after the last tempo change:
+    # millions of steps, but few tempo events
+    base = load_parsed('fl/complex.flp').compile()
+    timeline = CompiledTimeline(base.event_beats, base.event_bpms, base.event_real_times,
+                                base.event_prev_aligned_bpms, base.align, [4 * 3600.], ['end'], [])
+    events = tempo_track(timeline)
+    tempos = [(tick, int.from_bytes(data[3:], 'big')) for tick, data in sorted(events) if data[1] == 0x51]
+    assert len(tempos) < 3000
+    (tick, _), = [(tick, data) for tick, data in events if data[1] == 0x06]
+    assert _smf_real_time(tempos, tick, PPQ) == pytest.approx(4 * 3600., abs=1e-3)
+
+def test_smf_no_tempo():
+    with pytest.raises(ValueError):
+        emit_smf(load_parsed('cue/rekordbox.cue'))
+
+def test_cli_export_smf(tmp_path, capsys):
+    paths = [f'{TESTS_DIR}/fl/complex.flp', f'{TESTS_DIR}/als/junk.als']
+    assert main(['export-smf', *paths, '-o', str(tmp_path), '-j', '2']) == 1
+    out, err = capsys.readouterr()
+    assert 'junk.als' in err
+    ppq, events = _decode((tmp_path / 'complex.flp.mid').read_bytes())
+    assert [data.decode() for _, kind, data in events if kind == 0x06] == \
+        [m.text for m in load_parsed('fl/complex.flp').markers]
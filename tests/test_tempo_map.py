@@ -0,0 +1,113 @@
+from dawtool.project import GenericTempoAutomationEvent
+from dawtool.tempo_map import SumTree
+from helpers import load_parsed
+
+import pytest
+
+import copy
+import random
+
+
+def _reference(proj, tempo):
+    """
+    A project with tempo's events, recomputed from scratch by the engine
+    """
+    ref = copy.copy(proj)
+    ref.tempo_automation_events = []
+    for ev in tempo.events:
+        e = GenericTempoAutomationEvent(ev.beat, None, ev.bpm)
+        e.prev_aligned_bpm = None
+        ref.tempo_automation_events.append(e)
+    ref._calc_tempo_automation_event_real_times()
+    return ref
+
+def _check(proj, tempo, beats):
+    ref = _reference(proj, tempo)
+    for i, ev in enumerate(ref.tempo_automation_events):
+        assert tempo.event_real_time(i) == pytest.approx(ev.real_time, abs=1e-9)
+    for b in beats:
+        assert tempo.real_time_at(b) == pytest.approx(ref._calc_beat_real_time(b), abs=1e-9)
+
+
+def test_sum_tree():
+    rng = random.Random(0)
+    values = [rng.random() for _ in range(37)]
+    tree = SumTree(values)
+    assert len(tree) == 37
+    for i in range(38):
+        assert tree.prefix_sum(i) == pytest.approx(sum(values[:i]))
+
+    for _ in range(300):
+        op = rng.choice(['insert', 'delete', 'set'])
+        if op == 'insert' or not values:
+            i = rng.randrange(len(values) + 1)
+            v = rng.random()
+            values.insert(i, v)
+            tree.insert(i, v)
+        elif op == 'delete':
+            i = rng.randrange(len(values))
+            del values[i]
+            del tree[i]
+        else:
+            i = rng.randrange(len(values))
+            values[i] = rng.random()
+            tree[i] = values[i]
+        assert len(tree) == len(values)
+        i = rng.randrange(len(values) + 1)
+        assert tree.prefix_sum(i) == pytest.approx(sum(values[:i]))
+    assert [tree[i] for i in range(len(values))] == values
+    assert SumTree().prefix_sum(0) == 0.
+
+def test_tempo_map_unedited():
+    proj = load_parsed('fl/complex.flp')
+    tempo = proj.tempo_map()
+    for i, ev in enumerate(proj.tempo_automation_events):
+        assert tempo.event_real_time(i) == pytest.approx(ev.real_time, abs=1e-12)
+    for m, raw in zip(proj.markers, [m for m in proj.raw_markers if m.action == 0]):
+        assert tempo.real_time_at(raw.pulse / proj.pulses_per_beat) == pytest.approx(m.time, abs=1e-12)
+
+@pytest.mark.parametrize('fname,theoretical', [
+    ('fl/complex.flp', False),
+    ('fl/complex.flp', True),
+    ('als/automation-intense-unaligned.als', False),
+])
+def test_tempo_map_edits(fname, theoretical):
+    proj = load_parsed(fname, theoretical=theoretical)
+    tempo = proj.tempo_map()
+    rng = random.Random(1234)
+    beats = [rng.uniform(0, 80) for _ in range(20)]
+
+    for _ in range(30):
+        op = rng.choice(['insert', 'delete', 'move', 'move_bpm'])
+        # keep Ableton's negative first event and FL's event at 0
+        if op == 'insert':
+            tempo.insert(rng.choice([rng.uniform(0.1, 70), rng.randrange(1, 70) / 4]), rng.uniform(80, 170))
+        elif len(tempo) > 2:
+            i = rng.randrange(1, len(tempo))
+            if op == 'delete':
+                tempo.delete(i)
+            elif op == 'move':
+                tempo.move(i, beat=rng.uniform(0.1, 70))
+            else:
+                tempo.move(i, bpm=rng.uniform(80, 170))
+        _check(proj, tempo, beats)
+
+    # the project itself is untouched
+    assert proj.tempo_automation_events == load_parsed(fname, theoretical=theoretical).tempo_automation_events
+
+def test_tempo_map_first_event():
+    proj = load_parsed('fl/complex.flp')
+    tempo = proj.tempo_map()
+
+    # the timeline must start at or before beat 0
+    with pytest.raises(ValueError):
+        tempo.move(0, beat=0.3)
+    with pytest.raises(ValueError):
+        tempo.move(0, beat=5.)
+    with pytest.raises(ValueError):
+        tempo.delete(0)
+    assert tempo.events[0].beat == 0.
+    _check(proj, tempo, [0.5, 10., 40.])
+
+    tempo.move(0, beat=-0.3)
+    _check(proj, tempo, [0.5, 10., 40.])
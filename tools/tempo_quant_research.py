@@ -7,6 +7,9 @@ Research tool for brute forcing the tempo quantization of a DAW.
   first 13ish powers of 2)
 - See which candidate matches the DAW
 
+The computation lives in dawtool.calibrate, which also fits many measured
+segments at once (`dawtool calibrate`).
+
 Output:
 
 1 4.0
@@ -24,7 +27,7 @@ Output:
 4096 2.7728328777659423
 """
 
-import numpy as np
+from dawtool.calibrate import predict_times, DEFAULT_CANDIDATES
 
 def time_elapsed_interval(start, end, interval, quant):
     """
@@ -34,17 +37,15 @@ def time_elapsed_interval(start, end, interval, quant):
     @param end: End BPM
     @param interval: Number of beats
     @param quant: Candidate tempo quantization (power of 2; e.g. 16th, 32rd
-                  note etc)
+                  note etc), as the number of tempo steps over interval
     """
-    bpms = np.linspace(start, end, quant+1)[:-1]
-    spbs = 60 / bpms
-    width = interval / quant
-    return (spbs * width).sum()
+    # predict_times counts quant in steps per 4 beats
+    return float(predict_times([start], [end], [interval], [quant * 4 / interval])[0, 0])
 
 def main():
-    for i in range(13):
-        quant = 2 ** i
-        print(quant, time_elapsed_interval(60, 120, 4, quant))
+    times = predict_times([60], [120], [4], DEFAULT_CANDIDATES)[:, 0]
+    for quant, elapsed in zip(DEFAULT_CANDIDATES, times):
+        print(quant, elapsed)
 
 if __name__ == '__main__':
     main()